@@ -0,0 +1,175 @@
+import os
+import math
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+
+# Target p95 latency of the live frame callback, in seconds.
+LIVE_P95_TARGET = float(os.getenv('SMARTFIT_LIVE_P95_MS', '80')) / 1000.0
+
+# CPU cores reserved per active live session (pose + drawing + encode).
+LIVE_CPU_PER_SESSION = float(os.getenv('SMARTFIT_LIVE_CPU_PER_SESSION', '0.5'))
+
+# A live session counts as active while it has sent a frame within this many seconds.
+LIVE_SESSION_TIMEOUT = 3.0
+
+# Longest a batch job pauses in one yield_batch() call; it then processes a frame
+# anyway, so a live session that is over target on its own can't starve it.
+BATCH_MAX_PAUSE = float(os.getenv('SMARTFIT_BATCH_MAX_PAUSE', '5'))
+
+
+class AdmissionController:
+    """
+    Prioritizes live coaching over batch analysis on the same machine.
+
+    The live path only appends latency samples (lock-free deque and dict
+    writes). Batch workers take a slot before starting a job and call
+    yield_batch() between frames. They pause while live p95 latency is above
+    target, and the number of concurrent batch jobs shrinks as live sessions
+    claim CPUs.
+    """
+
+    def __init__(self, cpu_count=None, live_p95_target=LIVE_P95_TARGET,
+                 live_cpu_per_session=LIVE_CPU_PER_SESSION, window=256, min_reserve=1.0):
+        self.cpu_count = cpu_count or os.cpu_count() or 1
+        self.live_p95_target = live_p95_target
+        self.live_cpu_per_session = live_cpu_per_session
+        self.min_reserve = min_reserve
+
+        self._live_latencies = deque(maxlen=window)
+        self._live_seen = {}
+
+        self._batch_active = 0
+        self._batch_cond = threading.Condition()
+
+        self._stats_time = 0.0
+        self._stats = (0.0, 0)
+
+    # ------------------------------- Live side -------------------------------
+
+    def record_live(self, session_id, latency):
+        """Called from the live frame callback with the time spent processing a frame."""
+        self._live_latencies.append(latency)
+        self._live_seen[session_id] = time.perf_counter()
+
+    @contextmanager
+    def live_frame(self, session_id):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record_live(session_id, time.perf_counter() - start)
+
+    # ------------------------------- Load estimate -------------------------------
+
+    def _live_stats(self, max_age=0.25):
+        """(p95 latency, active live sessions), recomputed at most every `max_age` seconds."""
+        now = time.perf_counter()
+        if now - self._stats_time < max_age:
+            return self._stats
+
+        try:
+            samples = sorted(self._live_latencies)
+        except RuntimeError:
+            # Deque mutated by a live callback mid-copy; keep the previous estimate.
+            return self._stats
+        p95 = samples[min(len(samples) - 1, int(0.95 * len(samples)))] if samples else 0.0
+
+        for session_id, seen in list(self._live_seen.items()):
+            if now - seen > LIVE_SESSION_TIMEOUT:
+                self._live_seen.pop(session_id, None)
+        active = len(self._live_seen)
+
+        if not active:
+            # Stale samples from finished sessions shouldn't hold batch work back.
+            self._live_latencies.clear()
+            p95 = 0.0
+
+        self._stats = (p95, active)
+        self._stats_time = now
+        return self._stats
+
+    def live_overloaded(self):
+        p95, active = self._live_stats()
+        return active > 0 and p95 > self.live_p95_target
+
+    def batch_limit(self):
+        """How many batch jobs may run right now."""
+        p95, active = self._live_stats()
+        if active and p95 > self.live_p95_target:
+            return 0
+        reserved = max(self.min_reserve, math.ceil(active * self.live_cpu_per_session))
+        limit = max(0, int(self.cpu_count - reserved))
+        # With nobody live, always let at least one job through, even on a single core.
+        return limit if active else max(limit, 1)
+
+    def headroom(self):
+        p95, active = self._live_stats()
+        reserved = max(self.min_reserve, math.ceil(active * self.live_cpu_per_session))
+        return {
+            'cpu_count': self.cpu_count,
+            'live_sessions': active,
+            'live_p95_ms': round(p95 * 1000.0, 1),
+            'live_p95_target_ms': round(self.live_p95_target * 1000.0, 1),
+            'live_reserved_cpus': reserved,
+            'batch_active': self._batch_active,
+            'batch_limit': self.batch_limit(),
+            'free_cpus': max(0.0, self.cpu_count - reserved - self._batch_active)
+        }
+
+    # ------------------------------- Batch side -------------------------------
+
+    @contextmanager
+    def batch_slot(self, should_stop=None, poll_interval=0.5):
+        """Block until a batch job may start, and hold the slot while it runs."""
+        with self._batch_cond:
+            while self._batch_active >= self.batch_limit():
+                if should_stop is not None and should_stop():
+                    raise InterruptedError('Stopped while waiting for a batch slot')
+                self._batch_cond.wait(timeout=poll_interval)
+            self._batch_active += 1
+        try:
+            yield
+        finally:
+            with self._batch_cond:
+                self._batch_active -= 1
+                self._batch_cond.notify_all()
+
+    def yield_batch(self, should_stop=None, poll_interval=0.2, max_pause=BATCH_MAX_PAUSE):
+        """
+        Called by batch work between frames. Returns immediately unless live
+        sessions are over their latency target, in which case it sleeps until
+        they recover or `max_pause` seconds have passed. Returns the time spent paused.
+        """
+        if not self.live_overloaded():
+            return 0.0
+
+        start = time.perf_counter()
+        while self.live_overloaded():
+            if should_stop is not None and should_stop():
+                break
+            if time.perf_counter() - start >= max_pause:
+                p95, active = self._live_stats()
+                logging.warning(f"Live p95 {p95 * 1000.0:.0f} ms is still over target with {active} live "
+                                f"sessions after {max_pause:g}s; letting a batch frame through")
+                break
+            time.sleep(poll_interval)
+        return time.perf_counter() - start
+
+
+
+_controller = None
+_controller_lock = threading.Lock()
+
+
+def get_admission_controller():
+    """Process-wide controller shared by the live page and the job runner."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AdmissionController()
+    return _controller
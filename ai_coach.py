@@ -1,11 +1,16 @@
 import numpy as np
-from gtts import gTTS
 import os
 import cv2
+from collections import Counter, deque
+from rep_metrics import LOWER_HIPS_FLAG
 
 class AICoach:
-    def __init__(self):
-        self.feedback_history = []
+    def __init__(self, history_size=50):
+        # Only the most recent messages are kept; counts are maintained incrementally.
+        self.feedback_history = deque(maxlen=history_size)
+        self.issue_counts = Counter()
+        self.total_feedback = 0
+        self.rep_totals = {'correct': 0, 'incorrect': 0}
         self.feedback_messages = {
             'squat_depth': [
                 "Lower your squat. Aim for thighs parallel to ground.",
@@ -20,7 +25,8 @@ class AICoach:
             'back_posture': [
                 "Keep your back straight.",
                 "Chest up, core engaged.",
-                "Excellent posture!"
+                "Excellent posture!",
+                "Lean forward slightly and push your hips back."
             ],
             'general': [
                 "Remember to breathe.",
@@ -31,6 +37,30 @@ class AICoach:
         self.last_feedback_time = 0
         self.feedback_cooldown = 3  # seconds between feedback
 
+        # RepRecord.flags bit --> coaching message
+        self.rep_flag_messages = {
+            1 << 0: self.feedback_messages['back_posture'][0],   # BEND BACKWARDS
+            1 << 1: self.feedback_messages['back_posture'][3],   # BEND FORWARD (too upright)
+            1 << 2: self.feedback_messages['knee_alignment'][0], # KNEE FALLING OVER TOE
+            1 << 3: self.feedback_messages['squat_depth'][2],    # SQUAT TOO DEEP
+            LOWER_HIPS_FLAG: self.feedback_messages['squat_depth'][0]
+        }
+
+    def _add_feedback(self, message):
+        self.feedback_history.append(message)
+        self.issue_counts[message] += 1
+        self.total_feedback += 1
+
+    def record_rep(self, rep):
+        """
+        Aggregate a RepRecord from ProcessFrame, counting each issue once per rep
+        """
+        self.rep_totals[rep.outcome] += 1
+
+        for flag, message in self.rep_flag_messages.items():
+            if rep.flags & flag:
+                self._add_feedback(message)
+
     def analyze_form(self, angles, positions, current_time):
         """
         Analyze squat form and provide feedback
@@ -50,7 +80,7 @@ class AICoach:
 
         if feedback:
             self.last_feedback_time = current_time
-            self.feedback_history.append(feedback[0])
+            self._add_feedback(feedback[0])
         
         return feedback
 
@@ -59,17 +89,17 @@ class AICoach:
         Generate a summary of the training session
         """
         return {
-            'total_feedback': len(self.feedback_history),
+            'total_feedback': self.total_feedback,
+            'total_reps': self.rep_totals['correct'] + self.rep_totals['incorrect'],
+            'correct_reps': self.rep_totals['correct'],
+            'incorrect_reps': self.rep_totals['incorrect'],
             'common_issues': self._get_common_issues(),
-            'feedback_history': self.feedback_history
+            'feedback_history': list(self.feedback_history)
         }
 
     def _get_common_issues(self):
         """
         Identify most common form issues
         """
-        if not self.feedback_history:
-            return []
-        
-        from collections import Counter
-        return Counter(self.feedback_history).most_common(3)
\ No newline at end of file
+        # issue_counts is keyed by the fixed message set, so this doesn't grow with the session.
+        return self.issue_counts.most_common(3)
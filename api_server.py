@@ -0,0 +1,535 @@
+import os
+import time
+import json
+import uuid
+import base64
+import struct
+import asyncio
+import logging
+import argparse
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+import numpy as np
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route, WebSocketRoute, Mount
+from starlette.staticfiles import StaticFiles
+from starlette.websockets import WebSocketDisconnect
+
+from utils import get_mediapipe_pose
+from process_frame import ProcessFrame
+from thresholds import get_thresholds
+from landmarks import NUM_LANDMARKS, LANDMARK_FIELDS
+from video_analysis import POSE_SETTINGS
+from overlay import overlay_primitives
+from capture_control import CaptureController
+
+
+# Pose models shared by all sessions; each one serves one micro-batch at a time.
+API_POSE_WORKERS = int(os.getenv('SMARTFIT_API_POSE_WORKERS', str(os.cpu_count() or 1)))
+
+# Frames arriving within this window are handed to a pose worker together.
+API_BATCH_SIZE = int(os.getenv('SMARTFIT_API_BATCH_SIZE', '8'))
+API_BATCH_WAIT = float(os.getenv('SMARTFIT_API_BATCH_WAIT_MS', '5')) / 1000.0
+
+API_SESSION_TTL = float(os.getenv('SMARTFIT_API_SESSION_TTL', '300'))
+API_MAX_SESSIONS = int(os.getenv('SMARTFIT_API_MAX_SESSIONS', '1000'))
+
+# Largest frame width or height a landmark client may declare; ?overlay=1 draws on a canvas that size.
+API_MAX_FRAME_SIDE = int(os.getenv('SMARTFIT_API_MAX_FRAME_SIDE', '4096'))
+
+# A pooled model sees frames from many sessions in turn, so it must not track
+# landmarks from one frame to the next.
+API_POSE_SETTINGS = dict(POSE_SETTINGS, static_image_mode=True, smooth_landmarks=False)
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+
+# ?overlay= values: the annotated frame as base64 JPEG, or drawing primitives for a canvas.
+OVERLAY_MODES = {'1': 'image', 'image': 'image', 'data': 'data'}
+
+
+
+# ------------------------------------- SESSIONS -------------------------------------
+
+class ApiSession:
+    """Server-side analysis state of one client."""
+
+    def __init__(self, session_id, mode, thresholds, flip_frame=False):
+        self.session_id = session_id
+        self.mode = mode
+        self.process_frame = ProcessFrame(thresholds=thresholds, flip_frame=flip_frame)
+        self.feedback_labels = [feedback[0] for feedback in self.process_frame.FEEDBACK_ID_MAP.values()]
+        # Frames of one session are analyzed strictly in order.
+        self.lock = asyncio.Lock()
+        self.last_used = time.monotonic()
+        self.capture = CaptureController()
+        self._capture_sent = None
+        self._blank = None
+
+    def blank_frame(self, width, height):
+        """Canvas for landmark-only requests, reused while the size stays the same."""
+        if self._blank is None or self._blank.shape[:2] != (height, width):
+            self._blank = np.zeros((height, width, 3), dtype=np.uint8)
+        else:
+            self._blank.fill(0)
+        return self._blank
+
+    def with_overlay(self, result, analysis, overlay, frame=None):
+        """Add the requested overlay; `frame` is drawn on for 'image', or a blank canvas if None."""
+        if overlay == 'image':
+            if frame is None:
+                frame = self.blank_frame(*analysis.frame_size)
+            result['overlay'] = _encode_overlay(self.process_frame.render(frame, analysis))
+        elif overlay == 'data':
+            result['overlay'] = overlay_primitives(self.process_frame, analysis)
+        return result
+
+    def with_capture(self, result, latency, overloaded):
+        """
+        Record a frame's server latency and add a 'capture' hint whenever the
+        resolution and frame rate the client should capture at changes.
+        """
+        self.capture.observe(latency)
+        self.capture.update(overloaded)
+        constraints = self.capture.constraints
+        if constraints != self._capture_sent:
+            result['capture'] = self._capture_sent = constraints
+        return result
+
+    def counters(self, play_sound=None):
+        state = self.process_frame.state_tracker
+        feedback = [label for label, active in zip(self.feedback_labels, state.display_text) if active]
+        if state.lower_hips:
+            feedback.insert(0, 'LOWER YOUR HIPS')
+        return {
+            'session_id': self.session_id,
+            'squat_count': state.squat_count,
+            'improper_squat': state.improper_squat,
+            'feedback': feedback,
+            'play_sound': play_sound,
+            # Lets the client re-create the session on another replica after a failover.
+            'state': base64.b64encode(state.snapshot()).decode()
+        }
+
+
+class SessionStore:
+
+    def __init__(self, ttl=API_SESSION_TTL, max_sessions=API_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.sessions = {}
+        self._next_expire = 0.0
+
+    def create(self, mode, state=None, flip_frame=False):
+        self.expire()
+        if len(self.sessions) >= self.max_sessions:
+            return None
+
+        session = ApiSession(uuid.uuid4().hex, mode, get_thresholds(mode), flip_frame)
+        if state:
+            session.process_frame.state_tracker.restore(base64.b64decode(state))
+        self.sessions[session.session_id] = session
+        return session
+
+    def get(self, session_id):
+        # Also reclaim idle sessions here, so they go even when no new sessions are created.
+        if time.monotonic() >= self._next_expire:
+            self.expire()
+        session = self.sessions.get(session_id)
+        if session is not None:
+            session.last_used = time.monotonic()
+        return session
+
+    def remove(self, session_id):
+        return self.sessions.pop(session_id, None) is not None
+
+    def expire(self):
+        now = time.monotonic()
+        # Sweeping is O(sessions); once every few seconds is plenty.
+        self._next_expire = now + min(self.ttl, 5.0)
+        cutoff = now - self.ttl
+        for session_id, session in list(self.sessions.items()):
+            if session.last_used < cutoff and not session.lock.locked():
+                del self.sessions[session_id]
+
+
+
+# ------------------------------------- MICRO-BATCHING -------------------------------------
+
+class MicroBatcher:
+    """
+    Groups concurrent frame requests into micro-batches for a pool of pose models.
+
+    Each pose model has a dispatcher task that takes the first waiting request,
+    collects up to `max_batch` more for at most `max_wait` seconds, then runs
+    the whole batch on its model in one executor call. Under load this trades a
+    few milliseconds of latency for far fewer thread hand-offs per frame.
+    """
+
+    def __init__(self, workers=API_POSE_WORKERS, max_batch=API_BATCH_SIZE, max_wait=API_BATCH_WAIT):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='api-pose')
+        self.batches = 0
+        self.frames = 0
+        self._queue = None
+        self._tasks = []
+        self._poses = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        for _ in range(self.workers):
+            pose = await loop.run_in_executor(self.executor, lambda: get_mediapipe_pose(**API_POSE_SETTINGS))
+            self._poses.append(pose)
+            self._tasks.append(asyncio.create_task(self._dispatch(pose)))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self.executor.shutdown(wait=True)
+        for pose in self._poses:
+            pose.close()
+
+    def overloaded(self):
+        """True when more frames are waiting than the workers take in one round of batches."""
+        return self._queue is not None and self._queue.qsize() > self.workers * self.max_batch
+
+    async def submit(self, session, jpeg, overlay):
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((session, jpeg, overlay, future))
+        return await future
+
+    async def _dispatch(self, pose):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            results = await loop.run_in_executor(self.executor, _process_batch, pose, batch)
+            self.batches += 1
+            self.frames += len(batch)
+
+            for (_, _, _, future), result in zip(batch, results):
+                if future.cancelled():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
+def _encode_overlay(frame):
+    ok, buf = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, 75])
+    return base64.b64encode(buf.tobytes()).decode() if ok else None
+
+
+def _process_batch(pose, batch):
+    results = []
+    for session, jpeg, overlay, _ in batch:
+        try:
+            frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+            if frame is None:
+                raise ValueError('Could not decode JPEG frame')
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            frame_height, frame_width, _ = frame.shape
+            keypoints = pose.process(frame)
+            # Only draw when the client wants the annotated image back.
+            analysis = session.process_frame.analyze(keypoints.pose_landmarks, frame_width, frame_height)
+            results.append(session.with_overlay(session.counters(analysis.play_sound), analysis, overlay, frame))
+        except Exception as e:
+            results.append(e)
+    return results
+
+
+def _process_landmarks(session, landmarks, width, height, overlay):
+    analysis = session.process_frame.process_landmarks(landmarks, (width, height))
+    return session.with_overlay(session.counters(analysis.play_sound), analysis, overlay)
+
+
+# Byte sizes of binary landmark messages (float32 and float16). They're matched
+# before sniffing for a JPEG header, since the first bytes of a landmark message
+# are the low mantissa bits of landmark 0's x and can be anything.
+LANDMARK_MESSAGE_SIZES = (NUM_LANDMARKS * len(LANDMARK_FIELDS) * 4, NUM_LANDMARKS * len(LANDMARK_FIELDS) * 2)
+
+
+def _parse_landmark_message(data):
+    """
+    Binary landmark message: 33 x 4 little-endian float32 (528 bytes) or
+    float16 (264 bytes) of normalized x, y, z, visibility; empty means no pose.
+    """
+    if not data:
+        return None
+    n_values = NUM_LANDMARKS * len(LANDMARK_FIELDS)
+    if len(data) == n_values * 4:
+        landmarks = np.frombuffer(data, dtype='<f4')
+    elif len(data) == n_values * 2:
+        landmarks = np.frombuffer(data, dtype='<f2').astype(np.float32)
+    else:
+        raise ValueError(f'Expected {n_values} float32 or float16 values, got {len(data)} bytes')
+    return landmarks.reshape(NUM_LANDMARKS, len(LANDMARK_FIELDS))
+
+
+
+# ------------------------------------- ROUTES -------------------------------------
+
+sessions = SessionStore()
+batcher = MicroBatcher()
+
+
+def _error(message, status_code):
+    return JSONResponse({'error': message}, status_code=status_code)
+
+
+def _json_object(raw):
+    """Parse a request body or text message that must be a JSON object."""
+    body = json.loads(raw)
+    if not isinstance(body, dict):
+        raise ValueError('Expected a JSON object')
+    return body
+
+
+def _frame_size(width, height):
+    """(width, height) as ints within 1..API_MAX_FRAME_SIDE."""
+    try:
+        width, height = int(width), int(height)
+    except (TypeError, ValueError):
+        raise ValueError('width and height must be integers')
+    if not (1 <= width <= API_MAX_FRAME_SIDE and 1 <= height <= API_MAX_FRAME_SIDE):
+        raise ValueError(f'width and height must be between 1 and {API_MAX_FRAME_SIDE}')
+    return width, height
+
+
+def _landmark_array(landmarks):
+    """A (33, 4) float32 array from nested lists, or None."""
+    if landmarks is None:
+        return None
+    try:
+        landmarks = np.asarray(landmarks, dtype=np.float32)
+    except (TypeError, ValueError):
+        raise ValueError('landmarks must be numbers')
+    if landmarks.shape != (NUM_LANDMARKS, len(LANDMARK_FIELDS)):
+        raise ValueError(f'landmarks must be {NUM_LANDMARKS} x {len(LANDMARK_FIELDS)}')
+    return landmarks
+
+
+async def create_session(request):
+    raw = await request.body()
+    try:
+        body = _json_object(raw) if raw else {}
+        session = sessions.create(str(body.get('mode', 'beginner')), state=body.get('state'),
+                                  flip_frame=bool(body.get('flip')))
+    except (TypeError, ValueError, struct.error) as e:
+        return _error(str(e), 400)
+    if session is None:
+        return _error('Too many active sessions', 503)
+    return JSONResponse(session.counters(), status_code=201)
+
+
+async def get_session(request):
+    session = sessions.get(request.path_params['session_id'])
+    if session is None:
+        return _error('Unknown session', 404)
+    return JSONResponse(session.counters())
+
+
+async def delete_session(request):
+    if not sessions.remove(request.path_params['session_id']):
+        return _error('Unknown session', 404)
+    return JSONResponse({'deleted': True})
+
+
+async def post_frame(request):
+    """
+    Body: one JPEG image. ?overlay=1 adds the annotated frame as base64 JPEG,
+    ?overlay=data the overlay primitives (see overlay.py) instead. A 'capture'
+    field tells the client which resolution and frame rate to capture at.
+    """
+    session = sessions.get(request.path_params['session_id'])
+    if session is None:
+        return _error('Unknown session', 404)
+
+    jpeg = await request.body()
+    if not jpeg:
+        return _error('Empty frame', 400)
+    overlay = OVERLAY_MODES.get(request.query_params.get('overlay'))
+
+    started = time.perf_counter()
+    async with session.lock:
+        try:
+            result = await batcher.submit(session, jpeg, overlay)
+        except ValueError as e:
+            return _error(str(e), 400)
+        session.with_capture(result, time.perf_counter() - started, batcher.overloaded())
+    return JSONResponse(result)
+
+
+async def post_landmarks(request):
+    """
+    Body: {"landmarks": [[x, y, z, visibility] * 33] or null, "width": W, "height": H}
+    with coordinates normalized as in MediaPipe Pose. No model runs on the server.
+    """
+    session = sessions.get(request.path_params['session_id'])
+    if session is None:
+        return _error('Unknown session', 404)
+
+    try:
+        body = _json_object(await request.body())
+        landmarks = _landmark_array(body.get('landmarks'))
+    except ValueError as e:
+        return _error(str(e), 400)
+    if 'width' not in body or 'height' not in body:
+        return _error('width and height are required', 400)
+    try:
+        width, height = _frame_size(body['width'], body['height'])
+    except ValueError as e:
+        return _error(str(e), 400)
+    overlay = OVERLAY_MODES.get(request.query_params.get('overlay'))
+
+    async with session.lock:
+        result = await asyncio.get_running_loop().run_in_executor(
+            None, _process_landmarks, session, landmarks, width, height, overlay
+        )
+    return JSONResponse(result)
+
+
+async def session_socket(websocket):
+    """
+    Streaming endpoint for one session. Messages are either
+
+    - landmarks from a client that runs MediaPipe itself (see
+      _parse_landmark_message; JSON {"landmarks": [...]} text also works) for
+      a frame of ?width= x ?height= pixels. Only the squat logic runs, inline
+      on the event loop, since it takes far less time than a thread hand-off.
+    - JPEG frames, which go through the pooled pose models like POST .../frame,
+      including its 'capture' hints.
+
+    With ?overlay=data every message is answered with counters plus overlay
+    primitives for a canvas layer over the client's own camera feed, so no
+    video is encoded or sent back. Otherwise landmark messages are only
+    answered when a rep was scored or the counters or feedback changed.
+    """
+    session = sessions.get(websocket.path_params['session_id'])
+    if session is None:
+        await websocket.close(code=4404)
+        return
+
+    frame_size = None
+    if 'width' in websocket.query_params or 'height' in websocket.query_params:
+        try:
+            frame_size = _frame_size(websocket.query_params['width'], websocket.query_params['height'])
+        except (KeyError, ValueError):
+            await websocket.close(code=4400)
+            return
+    overlay = OVERLAY_MODES.get(websocket.query_params.get('overlay'))
+
+    await websocket.accept()
+    last_sent = None
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+            data = message.get('bytes')
+
+            if data is not None and len(data) not in LANDMARK_MESSAGE_SIZES and data[:2] == b'\xff\xd8':
+                started = time.perf_counter()
+                async with session.lock:
+                    try:
+                        result = await batcher.submit(session, data, overlay)
+                    except ValueError as e:
+                        result = {'error': str(e)}
+                    else:
+                        session.with_capture(result, time.perf_counter() - started, batcher.overloaded())
+                session.last_used = time.monotonic()
+                await websocket.send_json(result)
+                continue
+
+            try:
+                if frame_size is None:
+                    raise ValueError('Connect with ?width=&height= to send landmarks')
+                if data is not None:
+                    landmarks = _parse_landmark_message(data)
+                else:
+                    landmarks = _landmark_array(_json_object(message.get('text') or '{}').get('landmarks'))
+            except ValueError as e:
+                await websocket.send_json({'error': str(e)})
+                continue
+
+            async with session.lock:
+                analysis = session.process_frame.process_landmarks(landmarks, frame_size)
+            session.last_used = time.monotonic()
+
+            summary = (analysis.squat_count, analysis.improper_squat, analysis.feedback, analysis.lower_hips)
+            if overlay is None and analysis.play_sound is None and summary == last_sent:
+                continue
+            last_sent = summary
+
+            result = session.counters(analysis.play_sound)
+            # The snapshot is only worth its bytes when a counter moved.
+            if analysis.play_sound is None:
+                result.pop('state')
+            await websocket.send_json(session.with_overlay(result, analysis, overlay))
+
+    except WebSocketDisconnect:
+        pass
+
+
+async def health(request):
+    return JSONResponse({
+        'sessions': len(sessions.sessions),
+        'pose_workers': batcher.workers,
+        'batches': batcher.batches,
+        'frames': batcher.frames,
+        'avg_batch': round(batcher.frames / batcher.batches, 2) if batcher.batches else 0.0
+    })
+
+
+@asynccontextmanager
+async def lifespan(app):
+    await batcher.start()
+    try:
+        yield
+    finally:
+        await batcher.stop()
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        Route('/sessions', create_session, methods=['POST']),
+        Route('/sessions/{session_id}', get_session, methods=['GET']),
+        Route('/sessions/{session_id}', delete_session, methods=['DELETE']),
+        Route('/sessions/{session_id}/frame', post_frame, methods=['POST']),
+        Route('/sessions/{session_id}/landmarks', post_landmarks, methods=['POST']),
+        WebSocketRoute('/sessions/{session_id}/ws', session_socket),
+        Mount('/static', StaticFiles(directory=STATIC_DIR), name='static'),
+    ],
+    lifespan=lifespan
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description='Squat analysis HTTP API.')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=8000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    # Sessions live in this process: scale out with more processes or hosts and route by session id.
+    uvicorn.run(app, host=args.host, port=args.port, workers=1)
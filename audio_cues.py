@@ -0,0 +1,280 @@
+import io
+import os
+import json
+import argparse
+from collections import deque
+import numpy as np
+
+
+DEFAULT_CUE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'audio_cues')
+DEFAULT_SAMPLE_RATE = 48000
+
+_PCM_FILE = 'cues.pcm'
+_INDEX_FILE = 'cues.json'
+
+
+def default_cues(max_count=30):
+    """
+    Cue key --> spoken text. Keys match ProcessFrame's play_sound codes and
+    FEEDBACK_ID_MAP messages.
+    """
+    cues = {str(count): str(count) for count in range(1, max_count + 1)}
+    cues.update({
+        'incorrect': 'Incorrect',
+        'reset_counters': 'Resetting counters',
+        'BEND BACKWARDS': 'Bend backwards',
+        'BEND FORWARD': 'Bend forward',
+        'KNEE FALLING OVER TOE': 'Knee falling over toe',
+        'SQUAT TOO DEEP': 'Squat too deep',
+        'LOWER YOUR HIPS': 'Lower your hips'
+    })
+    return cues
+
+
+
+# ------------------------------------- OFFLINE SYNTHESIS -------------------------------------
+
+class ToneSynthesizer:
+    """Offline fallback that renders a short beep pattern per cue, no network needed."""
+
+    def __init__(self, sample_rate=DEFAULT_SAMPLE_RATE):
+        self.sample_rate = sample_rate
+
+    def __call__(self, text):
+        if text.isdigit():
+            freq, beeps = 880.0, 1
+        elif text.lower().startswith('incorrect'):
+            freq, beeps = 330.0, 2
+        else:
+            freq, beeps = 550.0, 1
+
+        t = np.arange(int(0.12 * self.sample_rate)) / self.sample_rate
+        beep = 0.5 * np.sin(2 * np.pi * freq * t)
+        gap = np.zeros(int(0.06 * self.sample_rate))
+        pcm = np.concatenate([np.concatenate([beep, gap]) for _ in range(beeps)])
+        return (pcm * 32767).astype(np.int16)
+
+
+class GTTSSynthesizer:
+    """Renders speech with gTTS and decodes it to mono PCM with PyAV. Needs network access."""
+
+    def __init__(self, lang='en', sample_rate=DEFAULT_SAMPLE_RATE):
+        self.lang = lang
+        self.sample_rate = sample_rate
+
+    def __call__(self, text):
+        import av
+        from gtts import gTTS
+
+        mp3 = io.BytesIO()
+        gTTS(text=text, lang=self.lang).write_to_fp(mp3)
+        mp3.seek(0)
+
+        resampler = av.AudioResampler(format='s16', layout='mono', rate=self.sample_rate)
+        chunks = []
+        with av.open(mp3, format='mp3') as container:
+            for frame in container.decode(audio=0):
+                for out in resampler.resample(frame):
+                    chunks.append(out.to_ndarray().reshape(-1))
+        for out in resampler.resample(None):
+            chunks.append(out.to_ndarray().reshape(-1))
+
+        return np.concatenate(chunks).astype(np.int16) if chunks else np.zeros((0,), dtype=np.int16)
+
+
+SYNTHESIZERS = {
+    'tone': ToneSynthesizer,
+    'gtts': GTTSSynthesizer
+}
+
+
+def build_cue_bank(out_dir, synthesizer, cues=None):
+    """
+    Pre-render every cue with `synthesizer` (text -> mono int16 PCM at
+    synthesizer.sample_rate) into a single PCM file plus a JSON index.
+    """
+    cues = cues or default_cues()
+    os.makedirs(out_dir, exist_ok=True)
+
+    index = {}
+    offset = 0
+    with open(os.path.join(out_dir, _PCM_FILE), 'wb') as pcm_file:
+        for key, text in cues.items():
+            pcm = np.asarray(synthesizer(text), dtype='<i2')
+            pcm_file.write(pcm.tobytes())
+            index[key] = [offset, len(pcm)]
+            offset += len(pcm)
+
+    with open(os.path.join(out_dir, _INDEX_FILE), 'w') as index_file:
+        json.dump({'sample_rate': synthesizer.sample_rate, 'cues': index}, index_file, indent=2)
+
+    return index
+
+
+
+# ------------------------------------- CUE BANK -------------------------------------
+
+class CueBank:
+    """
+    Read-only view over a pre-rendered cue bank. The PCM file is memory-mapped on
+    first use, and clips are zero-copy slices into it.
+    """
+
+    def __init__(self, directory=DEFAULT_CUE_DIR):
+        self.directory = directory
+        self._pcm = None
+        self._index = None
+        self.sample_rate = None
+
+    @property
+    def available(self):
+        return os.path.exists(os.path.join(self.directory, _INDEX_FILE))
+
+    def _load(self):
+        with open(os.path.join(self.directory, _INDEX_FILE)) as index_file:
+            meta = json.load(index_file)
+        self.sample_rate = meta['sample_rate']
+        self._index = meta['cues']
+        self._pcm = np.memmap(os.path.join(self.directory, _PCM_FILE), dtype='<i2', mode='r')
+
+    def get(self, key):
+        if self._index is None:
+            if not self.available:
+                return None
+            self._load()
+
+        entry = self._index.get(key)
+        if entry is None:
+            return None
+        offset, length = entry
+        return self._pcm[offset:offset + length]
+
+
+
+# ------------------------------------- MIXING -------------------------------------
+
+class CueMixer:
+    """
+    Mixes cues into the outgoing WebRTC audio track.
+
+    trigger() is called from the video callback thread and only appends to a
+    short deque; mix() runs in the audio callback and writes the active clip
+    into each outgoing frame, so a cue starts on the next audio frame.
+    """
+
+    def __init__(self, bank: CueBank, mic_gain=0.0, max_pending=2):
+        self.bank = bank
+        self.mic_gain = mic_gain
+        self._pending = deque(maxlen=max_pending)
+        self._clip = None
+        self._pos = 0
+        self._resampled = {}
+        self._feedback_mask = 0
+        self._silence = {}
+
+    def trigger(self, key):
+        if key is not None:
+            self._pending.append(key)
+
+    def trigger_feedback(self, display_text, labels, lower_hips=False):
+        """Queue a cue for each feedback message that just turned on."""
+        mask = 0
+        for idx in range(len(display_text)):
+            if display_text[idx]:
+                mask |= 1 << idx
+        if lower_hips:
+            mask |= 1 << len(labels)
+
+        rising = mask & ~self._feedback_mask
+        self._feedback_mask = mask
+
+        if rising:
+            for idx, label in enumerate(labels):
+                if rising & (1 << idx):
+                    self.trigger(label)
+            if rising & (1 << len(labels)):
+                self.trigger('LOWER YOUR HIPS')
+
+    def _clip_for(self, key, sample_rate):
+        clip = self.bank.get(key)
+        if clip is None or self.bank.sample_rate == sample_rate:
+            return clip
+
+        # Resample once per cue and rate if the track doesn't match the bank.
+        cache_key = (key, sample_rate)
+        if cache_key not in self._resampled:
+            n_out = int(len(clip) * sample_rate / self.bank.sample_rate)
+            x_out = np.linspace(0, len(clip) - 1, n_out)
+            self._resampled[cache_key] = np.interp(x_out, np.arange(len(clip)), clip).astype(np.int16)
+        return self._resampled[cache_key]
+
+    def _next_samples(self, n_samples, sample_rate):
+        out = np.zeros((n_samples,), dtype=np.int32)
+        filled = 0
+        while filled < n_samples:
+            if self._clip is None:
+                if not self._pending:
+                    break
+                self._clip = self._clip_for(self._pending.popleft(), sample_rate)
+                self._pos = 0
+                continue
+
+            take = min(n_samples - filled, len(self._clip) - self._pos)
+            out[filled:filled + take] = self._clip[self._pos:self._pos + take]
+            filled += take
+            self._pos += take
+            if self._pos >= len(self._clip):
+                self._clip = None
+        return out
+
+    def mix(self, frame):
+        """audio_frame_callback for webrtc_streamer."""
+        import av
+
+        idle = self._clip is None and not self._pending
+        if idle and self.mic_gain == 1.0:
+            return frame
+
+        channels = len(frame.layout.channels)
+        shape = (channels, frame.samples) if frame.format.is_planar else (1, frame.samples * channels)
+
+        if idle:
+            # Nothing to play and the mic is muted: reuse a zero buffer instead of mixing.
+            key = (shape, frame.format.name)
+            if key not in self._silence:
+                self._silence[key] = np.zeros(shape, dtype=np.int16)
+            mixed = self._silence[key]
+        else:
+            cue = self._next_samples(frame.samples, frame.sample_rate)
+            if frame.format.is_planar:
+                # (channels, samples)
+                cue = np.broadcast_to(cue[np.newaxis, :], shape)
+            else:
+                # (1, samples * channels), interleaved
+                cue = np.repeat(cue, channels)[np.newaxis, :]
+
+            if self.mic_gain:
+                mixed = frame.to_ndarray().astype(np.int32) * self.mic_gain + cue
+            else:
+                mixed = cue
+            mixed = np.clip(mixed, -32768, 32767).astype(np.int16)
+
+        new_frame = av.AudioFrame.from_ndarray(mixed, format=frame.format.name, layout=frame.layout.name)
+        new_frame.sample_rate = frame.sample_rate
+        new_frame.pts = frame.pts
+        new_frame.time_base = frame.time_base
+        return new_frame
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Pre-render the audio cue bank used by the Live Stream page.')
+    parser.add_argument('--out', default=DEFAULT_CUE_DIR, help='Output directory for the cue bank.')
+    parser.add_argument('--synth', default='gtts', choices=sorted(SYNTHESIZERS), help='Offline synthesizer to use.')
+    parser.add_argument('--sample-rate', type=int, default=DEFAULT_SAMPLE_RATE)
+    parser.add_argument('--max-count', type=int, default=30, help='Highest rep count to pre-render.')
+    args = parser.parse_args()
+
+    synthesizer = SYNTHESIZERS[args.synth](sample_rate=args.sample_rate)
+    index = build_cue_bank(args.out, synthesizer, default_cues(args.max_count))
+    print(f'Rendered {len(index)} cues to {args.out}')
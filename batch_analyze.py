@@ -0,0 +1,181 @@
+import os
+import sys
+import glob
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import pandas as pd
+
+from utils import get_mediapipe_pose
+from thresholds import get_thresholds, load_thresholds
+from video_analysis import analyze_video, POSE_SETTINGS
+from media_backend import MEDIA_BACKEND
+
+
+REPORT_FORMATS = ('json', 'parquet')
+
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.webm')
+
+SUMMARY_COLUMNS = ['source', 'status', 'error', 'report', 'video', 'frames',
+                   'correct_reps', 'incorrect_reps', 'seconds']
+
+
+def report_name(video_path):
+    """Report file stem: the video name plus a hash of its path, so equal names in different folders don't clash."""
+    stem = os.path.splitext(os.path.basename(video_path))[0]
+    return f'{stem}_{hashlib.sha1(os.path.abspath(video_path).encode()).hexdigest()[:8]}'
+
+
+def collect_videos(patterns, extensions=VIDEO_EXTENSIONS):
+    """Expand files, directories (searched recursively for videos) and glob patterns."""
+    videos = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            pattern = os.path.join(pattern, '**', '*')
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if os.path.isfile(path) and path.lower().endswith(extensions):
+                videos.append(path)
+    # Keep the first occurrence of files matched by several patterns.
+    return list(dict.fromkeys(videos))
+
+
+
+# ------------------------------------- WORKER PROCESS -------------------------------------
+
+_worker = {}
+
+
+def _init_worker(thresholds, backend):
+    # Each process runs one video at a time; let the pool, not OpenCV, use the cores.
+    cv2.setNumThreads(1)
+    _worker['thresholds'] = thresholds
+    _worker['backend'] = backend
+    _worker['pose'] = get_mediapipe_pose(**POSE_SETTINGS)
+
+
+def _write_report(result, report_path, report_format):
+    if report_format == 'json':
+        with open(report_path, 'w') as f:
+            json.dump(result, f, indent=2)
+    else:
+        reps = pd.DataFrame(result['reps'])
+        reps.insert(0, 'source', result['source'])
+        reps.to_parquet(report_path, index=False)
+
+
+def analyze_one(video_path, out_dir, report_format, overlay):
+    """Runs in a pool worker with its warm pose model. Returns a summary row."""
+    name = report_name(video_path)
+    report_path = os.path.join(out_dir, f'{name}.{report_format}')
+    video_out = os.path.join(out_dir, f'{name}_annotated.mp4') if overlay else None
+
+    if _worker['pose'] is None:
+        _worker['pose'] = get_mediapipe_pose(**POSE_SETTINGS)
+    else:
+        # Start tracking and smoothing afresh instead of from the last video's final frames.
+        _worker['pose'].reset()
+
+    start = time.perf_counter()
+    try:
+        result = analyze_video(video_path, _worker['thresholds'], video_path=video_out,
+                               pose=_worker['pose'], backend=_worker['backend'])
+    except Exception as e:
+        # Don't carry a model that failed mid-video over to the next one.
+        _worker['pose'].close()
+        _worker['pose'] = None
+        return {'source': video_path, 'status': 'failed', 'error': f'{type(e).__name__}: {e}'}
+
+    result['source'] = video_path
+    result['thresholds'] = _worker['thresholds']
+    try:
+        _write_report(result, report_path, report_format)
+    except Exception as e:
+        # A full disk or a missing parquet engine fails this video, not the whole batch.
+        return {'source': video_path, 'status': 'failed', 'error': f'report: {type(e).__name__}: {e}'}
+
+    return {
+        'source': video_path,
+        'status': 'done',
+        'report': report_path,
+        'video': video_out,
+        'frames': result['frames'],
+        'correct_reps': result['correct_reps'],
+        'incorrect_reps': result['incorrect_reps'],
+        'seconds': round(time.perf_counter() - start, 2)
+    }
+
+
+
+# ------------------------------------- DRIVER -------------------------------------
+
+def run_batch(videos, thresholds, out_dir, report_format='json', overlay=False,
+              workers=None, backend=None, skip_existing=False):
+    os.makedirs(out_dir, exist_ok=True)
+
+    if skip_existing:
+        videos = [video for video in videos
+                  if not os.path.exists(os.path.join(out_dir, f'{report_name(video)}.{report_format}'))]
+
+    summary = []
+    if not videos:
+        return summary
+
+    workers = min(workers or os.cpu_count() or 1, len(videos))
+    # MediaPipe isn't fork-safe, so workers start fresh interpreters.
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(thresholds, backend or MEDIA_BACKEND)) as pool:
+        futures = [pool.submit(analyze_one, video, out_dir, report_format, overlay) for video in videos]
+        for done, future in enumerate(as_completed(futures), 1):
+            row = future.result()
+            summary.append(row)
+            detail = row['error'] if row['status'] == 'failed' else \
+                f"{row['correct_reps']} correct, {row['incorrect_reps']} incorrect, {row['seconds']}s"
+            print(f"[{done}/{len(videos)}] {row['status']}: {row['source']} ({detail})", flush=True)
+
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze many squat videos in parallel without the web UI.')
+    parser.add_argument('videos', nargs='+', help='Video files, directories or glob patterns (quote them).')
+    parser.add_argument('--mode', default='beginner', choices=['beginner', 'pro'])
+    parser.add_argument('--thresholds', help='JSON thresholds file; overrides --mode.')
+    parser.add_argument('--out', default='reports', help='Output directory for reports and overlays.')
+    parser.add_argument('--format', default='json', choices=REPORT_FORMATS,
+                        help='Per-video report format; parquet writes one row per rep and needs pyarrow.')
+    parser.add_argument('--overlay', action='store_true', help='Also write an annotated video per input.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser.add_argument('--backend', default=None, choices=['opencv', 'pyav'], help='Media backend.')
+    parser.add_argument('--skip-existing', action='store_true', help='Skip videos that already have a report.')
+    args = parser.parse_args()
+
+    if args.format == 'parquet':
+        try:
+            import pyarrow
+        except ImportError:
+            parser.error('--format parquet needs pyarrow (pip install pyarrow)')
+
+    thresholds = load_thresholds(args.thresholds) if args.thresholds else get_thresholds(args.mode)
+    videos = collect_videos(args.videos)
+    if not videos:
+        parser.error('No videos matched.')
+
+    summary = run_batch(videos, thresholds, args.out, args.format, args.overlay,
+                        args.workers, args.backend, args.skip_existing)
+
+    if summary:
+        summary_path = os.path.join(args.out, 'summary.csv')
+        # Append to the summary of earlier runs into the same directory.
+        pd.DataFrame(summary, columns=SUMMARY_COLUMNS).to_csv(summary_path, mode='a', index=False,
+                                                              header=not os.path.exists(summary_path))
+        print(f'Summary written to {summary_path}')
+
+    failed = sum(1 for row in summary if row['status'] == 'failed')
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,129 @@
+import os
+import time
+from collections import deque
+
+from admission import LIVE_P95_TARGET
+
+
+# Capture levels a client can be asked for: (width, height, frame rate).
+CAPTURE_LEVELS = (
+    (320, 240, 10),
+    (480, 360, 15),
+    (640, 480, 20),
+    (960, 540, 24),
+    (1280, 720, 30),
+)
+
+CAPTURE_MIN_WIDTH = int(os.getenv('SMARTFIT_CAPTURE_MIN_WIDTH', '320'))
+CAPTURE_MAX_WIDTH = int(os.getenv('SMARTFIT_CAPTURE_MAX_WIDTH', '640'))
+CAPTURE_START_WIDTH = int(os.getenv('SMARTFIT_CAPTURE_START_WIDTH', '480'))
+
+
+class CaptureController:
+    """
+    Picks the capture resolution and frame rate a live client should use.
+
+    Feed it the processing latency of each frame with observe() and call
+    update() periodically with the server's load. It steps down a level as
+    soon as p95 latency goes over target or the server is overloaded, and
+    steps back up only after latency has stayed well under target for
+    `raise_after` seconds. Every change is followed by a `cooldown`, so the
+    client's camera can settle before the next decision.
+    """
+
+    def __init__(self, levels=CAPTURE_LEVELS, min_width=CAPTURE_MIN_WIDTH, max_width=CAPTURE_MAX_WIDTH,
+                 start_width=CAPTURE_START_WIDTH, target_latency=LIVE_P95_TARGET,
+                 window=60, cooldown=3.0, raise_after=10.0):
+        self.levels = [level for level in levels if min_width <= level[0] <= max_width] or [levels[0]]
+        self.target_latency = target_latency
+        self.cooldown = cooldown
+        self.raise_after = raise_after
+
+        self.level = 0
+        for idx, level in enumerate(self.levels):
+            if level[0] <= start_width:
+                self.level = idx
+
+        self._latencies = deque(maxlen=window)
+        self._last_change = time.perf_counter()
+        self._good_since = None
+        self._last_processed = 0.0
+
+    def observe(self, latency):
+        self._latencies.append(latency)
+
+    def p95(self):
+        try:
+            samples = sorted(self._latencies)
+        except RuntimeError:
+            # Appended to by the frame callback mid-copy; skip this round.
+            return None
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+
+    def update(self, overloaded=False, now=None):
+        """Re-evaluate the level; returns True if it changed."""
+        if now is None:
+            now = time.perf_counter()
+        if now - self._last_change < self.cooldown:
+            return False
+
+        p95 = self.p95()
+
+        if overloaded or (p95 is not None and p95 > self.target_latency):
+            self._good_since = None
+            return self._set_level(self.level - 1, now)
+
+        if p95 is not None and p95 < 0.5 * self.target_latency:
+            if self._good_since is None:
+                self._good_since = now
+            elif now - self._good_since >= self.raise_after:
+                self._good_since = None
+                return self._set_level(self.level + 1, now)
+        else:
+            self._good_since = None
+        return False
+
+    def _set_level(self, level, now):
+        level = max(0, min(level, len(self.levels) - 1))
+        if level == self.level:
+            return False
+        self.level = level
+        # Samples taken at the old level say little about the new one.
+        self._latencies.clear()
+        self._last_change = now
+        return True
+
+    @property
+    def constraints(self):
+        width, height, frame_rate = self.levels[self.level]
+        return {'width': width, 'height': height, 'frameRate': frame_rate}
+
+    def media_stream_constraints(self, audio=False):
+        """
+        getUserMedia constraints for clients that can't change them mid-stream,
+        e.g. webrtc_streamer: the current level's resolution, capped at the
+        ceiling, and the ceiling's frame rate, which should_process() then
+        throttles down to the current level.
+        """
+        width, height, _ = self.levels[self.level]
+        max_width, max_height, max_frame_rate = self.levels[-1]
+        return {
+            'video': {
+                'width': {'ideal': width, 'max': max_width},
+                'height': {'ideal': height, 'max': max_height},
+                'frameRate': {'ideal': max_frame_rate, 'max': max_frame_rate}
+            },
+            'audio': audio
+        }
+
+    def should_process(self, now=None):
+        """Frame-rate cap for clients that can't change their capture rate mid-stream."""
+        if now is None:
+            now = time.perf_counter()
+        # A little slack so jitter doesn't drop every other frame at exactly the target rate.
+        if now - self._last_processed < 0.9 / self.levels[self.level][2]:
+            return False
+        self._last_processed = now
+        return True
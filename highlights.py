@@ -0,0 +1,141 @@
+import os
+import bisect
+import numpy as np
+import av
+
+from rep_metrics import LOWER_HIPS_FLAG, flag_names
+
+
+# Extra seconds kept around each exported clip.
+CLIP_PADDING = 0.5
+
+
+def feedback_spans(flags, times):
+    """
+    Contiguous runs of each feedback flag in a per-frame flags array (the bits
+    of RepRecord.flags), as dicts with frame and time ranges, ordered by start.
+    """
+    flags = np.asarray(flags, dtype=np.uint8)
+    times = np.asarray(times, dtype=np.float64)
+
+    spans = []
+    for bit in range(LOWER_HIPS_FLAG.bit_length()):
+        on = ((flags >> bit) & 1).astype(np.int8)
+        edges = np.diff(np.concatenate(([0], on, [0])))
+        starts = np.flatnonzero(edges == 1)
+        ends = np.flatnonzero(edges == -1) - 1
+        for start, end in zip(starts, ends):
+            spans.append({
+                'flag': 1 << bit,
+                'start_frame': int(start),
+                'end_frame': int(end),
+                'start_time': float(times[start]),
+                'end_time': float(times[end])
+            })
+
+    spans.sort(key=lambda span: (span['start_frame'], span['flag']))
+    return spans
+
+
+def build_highlight_index(reps, spans, feedback_id_map):
+    """
+    Map each rep and each feedback event to its frame and time range in the
+    source video. `reps` are RepRecord dicts, `spans` come from feedback_spans().
+    Feedback events carry the number of the rep they happened in, if any.
+    """
+    rep_entries = []
+    for rep in reps:
+        rep_entries.append({
+            'rep': rep['rep'],
+            'outcome': rep['outcome'],
+            'start_frame': rep['start_frame'],
+            'end_frame': rep['end_frame'],
+            'start_time': rep['start_time'],
+            'end_time': rep['end_time'],
+            'feedback': flag_names(rep['flags'], feedback_id_map)
+        })
+
+    rep_starts = [rep['start_frame'] for rep in rep_entries]
+
+    feedback_entries = []
+    for span in spans:
+        idx = bisect.bisect_right(rep_starts, span['end_frame']) - 1
+        in_rep = idx >= 0 and rep_entries[idx]['end_frame'] >= span['start_frame']
+        feedback_entries.append(dict(
+            span,
+            label=flag_names(span['flag'], feedback_id_map)[0],
+            rep=rep_entries[idx]['rep'] if in_rep else None
+        ))
+
+    return {'reps': rep_entries, 'feedback': feedback_entries}
+
+
+def highlight_index_from_sidecar(sidecar, feedback_id_map):
+    """Index for a loaded sidecar (see sidecar.load_sidecar)."""
+    spans = feedback_spans(sidecar['flags'], sidecar['times'])
+    return build_highlight_index(sidecar['meta']['reps'], spans, feedback_id_map)
+
+
+
+# ------------------------------------- CLIP EXPORT -------------------------------------
+
+def _copy_range(src, video, audio, start_time, end_time, output_path):
+    # A copied stream can only start on a keyframe, so seek to the last one at or before start_time.
+    src.seek(int(max(start_time, 0.0) / video.time_base), stream=video, backward=True, any_frame=False)
+
+    streams = [video] + ([audio] if audio is not None else [])
+    offset = None
+    clip_end = None
+
+    with av.open(output_path, mode='w') as dst:
+        out_streams = {stream.index: dst.add_stream(template=stream) for stream in streams}
+
+        for packet in src.demux(streams):
+            if packet.dts is None:
+                continue
+            packet_time = float(packet.dts * packet.time_base)
+
+            if packet.stream.index == video.index:
+                if offset is None:
+                    if not packet.is_keyframe:
+                        continue
+                    offset = packet_time
+                elif packet_time > end_time:
+                    break
+                clip_end = packet_time
+            elif offset is None or packet_time < offset:
+                continue
+
+            # Shift timestamps so the clip starts at zero.
+            shift = int(round(offset / packet.time_base))
+            packet.dts -= shift
+            if packet.pts is not None:
+                packet.pts -= shift
+            packet.stream = out_streams[packet.stream.index]
+            dst.mux(packet)
+
+    if offset is None:
+        os.remove(output_path)
+        raise ValueError(f"No keyframe found after {start_time:.2f}s")
+
+    return {'path': output_path, 'start_time': offset, 'end_time': clip_end}
+
+
+def export_clips(source_path, ranges, output_paths, padding=CLIP_PADDING):
+    """
+    Cut `(start_time, end_time)` ranges out of `source_path` by remuxing the
+    compressed packets; nothing is decoded or re-encoded. Clips start on the
+    keyframe at or before `start_time - padding`, so they may begin a little
+    early. Returns the actual start and end time of each clip.
+    """
+    clips = []
+    with av.open(source_path) as src:
+        video = src.streams.video[0]
+        audio = src.streams.audio[0] if src.streams.audio else None
+        for (start_time, end_time), output_path in zip(ranges, output_paths):
+            clips.append(_copy_range(src, video, audio, start_time - padding, end_time + padding, output_path))
+    return clips
+
+
+def export_clip(source_path, start_time, end_time, output_path, padding=CLIP_PADDING):
+    return export_clips(source_path, [(start_time, end_time)], [output_path], padding)[0]
@@ -0,0 +1,373 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+
+from scratch import SCRATCH_DIR, ScratchStore
+from utils import get_mediapipe_pose
+from video_analysis import analyze_video, AnalysisCancelled, ANALYSIS_VERSION, POSE_SETTINGS
+from result_cache import ResultCache, cache_key, file_digest
+from media_backend import MEDIA_BACKEND
+from preview import PreviewChannel
+from admission import get_admission_controller
+
+
+JOBS_DB = os.getenv('SMARTFIT_JOBS_DB', os.path.join(SCRATCH_DIR, 'jobs.db'))
+JOB_WORKERS = int(os.getenv('SMARTFIT_JOB_WORKERS', '2'))
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+
+class JobQueue:
+    """Persistent job queue in a local SQLite database."""
+
+    def __init__(self, db_path=JOBS_DB):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self.init_db()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_db(self):
+        conn = self._connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS jobs
+                        (id TEXT PRIMARY KEY,
+                         user TEXT,
+                         kind TEXT,
+                         status TEXT,
+                         params TEXT,
+                         frames_done INTEGER DEFAULT 0,
+                         total_frames INTEGER DEFAULT 0,
+                         checkpoint TEXT,
+                         result TEXT,
+                         error TEXT,
+                         cancel_requested INTEGER DEFAULT 0,
+                         created REAL,
+                         started REAL,
+                         updated REAL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created)')
+        conn.close()
+
+    def _execute(self, query, args=()):
+        conn = self._connect()
+        try:
+            return conn.execute(query, args).rowcount
+        finally:
+            conn.close()
+
+    def submit(self, user, kind, params):
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, user, kind, status, params, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, user, kind, QUEUED, json.dumps(params), now, now)
+        )
+        return job_id
+
+    def claim(self):
+        """Atomically move the oldest queued job to running and return it, or None."""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE status=? ORDER BY created LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            now = time.time()
+            conn.execute("UPDATE jobs SET status=?, started=?, updated=? WHERE id=?", (RUNNING, now, now, row['id']))
+            conn.execute('COMMIT')
+            return self._to_dict(row, status=RUNNING, started=now)
+        except sqlite3.Error:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def update_progress(self, job_id, frames_done, total_frames):
+        self._execute(
+            "UPDATE jobs SET frames_done=?, total_frames=?, updated=? WHERE id=?",
+            (frames_done, total_frames, time.time(), job_id)
+        )
+
+    def save_checkpoint(self, job_id, checkpoint):
+        self._execute(
+            "UPDATE jobs SET checkpoint=?, updated=? WHERE id=?",
+            (json.dumps(checkpoint), time.time(), job_id)
+        )
+
+    def finish(self, job_id, result):
+        self._execute(
+            "UPDATE jobs SET status=?, result=?, updated=? WHERE id=?",
+            (DONE, json.dumps(result), time.time(), job_id)
+        )
+
+    def fail(self, job_id, error, status=FAILED):
+        self._execute(
+            "UPDATE jobs SET status=?, error=?, updated=? WHERE id=?",
+            (status, error, time.time(), job_id)
+        )
+
+    def cancel(self, job_id):
+        """Cancel a queued job right away, or ask a running one to stop."""
+        self._execute(
+            "UPDATE jobs SET status=?, updated=? WHERE id=? AND status=?",
+            (CANCELLED, time.time(), job_id, QUEUED)
+        )
+        self._execute("UPDATE jobs SET cancel_requested=1 WHERE id=?", (job_id,))
+
+    def cancel_requested(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id=?", (job_id,)).fetchone()
+            return bool(row and row['cancel_requested'])
+        finally:
+            conn.close()
+
+    def requeue_interrupted(self):
+        """Put jobs left 'running' by a dead process back in the queue; they resume from their checkpoint."""
+        return self._execute(
+            "UPDATE jobs SET status=?, updated=? WHERE status=?",
+            (QUEUED, time.time(), RUNNING)
+        )
+
+    def get(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id=?", (job_id,)).fetchone()
+            return self._to_dict(row) if row else None
+        finally:
+            conn.close()
+
+    def list_jobs(self, user, limit=20):
+        conn = self._connect()
+        try:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE user=? ORDER BY created DESC LIMIT ?", (user, limit)
+            ).fetchall()
+            return [self._to_dict(row) for row in rows]
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _to_dict(row, **overrides):
+        job = dict(row)
+        for key in ('params', 'checkpoint', 'result'):
+            job[key] = json.loads(job[key]) if job[key] else None
+        job.update(overrides)
+        job['progress'] = job['frames_done'] / job['total_frames'] if job['total_frames'] else 0.0
+        return job
+
+
+
+# ------------------------------------- JOB HANDLERS -------------------------------------
+
+_worker_local = threading.local()
+
+
+def _worker_pose(job_id):
+    """
+    One MediaPipe pose per worker thread. Its tracking and smoothing state is
+    reset for every new job so one video's ROI doesn't leak into the next;
+    only a job resuming on the thread that last ran it keeps the graph as is.
+    """
+    if getattr(_worker_local, 'pose', None) is None:
+        _worker_local.pose = get_mediapipe_pose(**POSE_SETTINGS)
+    elif _worker_local.job_id != job_id:
+        _worker_local.pose.reset()
+    _worker_local.job_id = job_id
+    return _worker_local.pose
+
+
+def run_analysis_job(job, context):
+    """
+    params: source_path, thresholds, sidecar_path and/or video_path,
+            keep_source (keep the upload for on-demand overlay rendering)
+
+    A video already analyzed with the same thresholds and code is served from
+    the result cache without decoding a frame or taking a batch slot.
+    """
+    params = job['params']
+    outputs = {name: params[name + '_path'] for name in ('sidecar', 'video') if params.get(name + '_path')}
+
+    cache = ResultCache()
+    # The decoder's colour conversion can shift landmarks slightly, so the backend is part of the version.
+    key = cache_key(file_digest(params['source_path']), params['thresholds'], POSE_SETTINGS,
+                    [ANALYSIS_VERSION, MEDIA_BACKEND], outputs=outputs)
+    result = cache.get(key, outputs)
+
+    if result is None:
+        with context.batch_slot():
+            pose = _worker_pose(job['id'])
+            try:
+                result = analyze_video(
+                    params['source_path'],
+                    params['thresholds'],
+                    sidecar_path=params.get('sidecar_path'),
+                    video_path=params.get('video_path'),
+                    pose=pose,
+                    on_progress=context.progress,
+                    on_frame=context.preview,
+                    should_stop=context.cancelled,
+                    throttle=context.throttle,
+                    checkpoint=context.checkpoint,
+                    resume=job['checkpoint']
+                )
+            except Exception:
+                # Don't carry a model that failed mid-video over to the next job.
+                pose.close()
+                _worker_local.pose = None
+                raise
+        cache.put(key, result, outputs)
+
+    if not params.get('keep_source'):
+        ScratchStore().remove(params['source_path'])
+
+    result['source_path'] = params['source_path'] if params.get('keep_source') else None
+    return result
+
+
+JOB_HANDLERS = {
+    'analyze_video': run_analysis_job
+}
+
+
+
+class JobContext:
+    """Handed to job handlers to report progress, save checkpoints and check for cancellation."""
+
+    def __init__(self, runner, job_id, progress_interval=1.0):
+        self.runner = runner
+        self.job_id = job_id
+        self.progress_interval = progress_interval
+        self._last_progress = 0.0
+        self._last_cancel_check = 0.0
+        self._cancelled = False
+
+    def progress(self, frames_done, total_frames):
+        now = time.perf_counter()
+        if now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            self.runner.queue.update_progress(self.job_id, frames_done, total_frames)
+
+    def checkpoint(self, data):
+        self.runner.queue.save_checkpoint(self.job_id, data)
+
+    def cancelled(self):
+        # Polled every frame, so the database is only consulted once per progress interval.
+        now = time.perf_counter()
+        if not self._cancelled and now - self._last_cancel_check >= self.progress_interval:
+            self._last_cancel_check = now
+            self._cancelled = self.runner.queue.cancel_requested(self.job_id)
+        return self._cancelled or self.runner.stopping
+
+    def batch_slot(self):
+        """Hold one of the admission controller's batch slots; cancellable while waiting."""
+        return self.runner.admission.batch_slot(should_stop=self.cancelled)
+
+    def throttle(self):
+        """Pause between frames while live sessions are over their latency target."""
+        self.runner.admission.yield_batch(should_stop=self.cancelled)
+
+    def preview(self, frame):
+        channel = self.runner.previews.get(self.job_id)
+        if channel is not None:
+            channel(frame)
+
+
+
+class JobRunner:
+    """
+    Pulls jobs from a JobQueue on a fixed number of worker threads. Handlers
+    take an AdmissionController batch slot (context.batch_slot()) around their
+    heavy work, so live sessions get CPU first.
+
+    `previews` maps job ids to optional frame callbacks, so a page can watch a
+    job without the job depending on the page. watch() fills `preview_images`
+    with a downscaled JPEG of the job's latest frame.
+    """
+
+    def __init__(self, queue: JobQueue, workers=JOB_WORKERS, handlers=None, poll_interval=1.0, admission=None):
+        self.queue = queue
+        self.admission = admission or get_admission_controller()
+        self.workers = workers
+        self.handlers = handlers or JOB_HANDLERS
+        self.poll_interval = poll_interval
+        self.previews = {}
+        self.preview_images = {}
+        self.stopping = False
+        self._threads = []
+        self._preview_channels = {}
+
+    def watch(self, job_id, max_fps=2.0):
+        channel = PreviewChannel(lambda jpeg: self.preview_images.__setitem__(job_id, jpeg), max_fps=max_fps)
+        self._preview_channels[job_id] = channel.start()
+        self.previews[job_id] = channel.offer
+
+        job = self.queue.get(job_id)
+        if job is None or job['status'] in FINISHED_STATUSES:
+            self._unwatch(job_id)
+
+    def _unwatch(self, job_id):
+        self.previews.pop(job_id, None)
+        channel = self._preview_channels.pop(job_id, None)
+        if channel is not None:
+            channel.close()
+        self.preview_images.pop(job_id, None)
+
+    def start(self):
+        self.queue.requeue_interrupted()
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f'job-worker-{idx}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self, timeout=10.0):
+        self.stopping = True
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+
+    def _work(self):
+        while not self.stopping:
+            job = self.queue.claim()
+            if job is None:
+                time.sleep(self.poll_interval)
+                continue
+            self._run(job)
+
+    def _run(self, job):
+        handler = self.handlers.get(job['kind'])
+        if handler is None:
+            self.queue.fail(job['id'], f"Unknown job kind: {job['kind']}")
+            return
+
+        context = JobContext(self, job['id'])
+        try:
+            result = handler(job, context)
+        except (AnalysisCancelled, InterruptedError):
+            if self.stopping:
+                # Shutting down: leave the job running so it is requeued and resumed on restart.
+                return
+            self.queue.fail(job['id'], 'Cancelled', status=CANCELLED)
+        except Exception as e:
+            logging.exception(f"Job {job['id']} failed")
+            self.queue.fail(job['id'], str(e))
+        else:
+            self.queue.finish(job['id'], result)
+        finally:
+            self._unwatch(job['id'])
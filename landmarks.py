@@ -0,0 +1,106 @@
+from collections import namedtuple
+import numpy as np
+
+
+# MediaPipe Pose landmark count and per-landmark fields stored in arrays.
+NUM_LANDMARKS = 33
+LANDMARK_FIELDS = ('x', 'y', 'z', 'visibility')
+
+# Minimal stand-ins for MediaPipe's result objects, enough for ProcessFrame.
+Landmark = namedtuple('Landmark', LANDMARK_FIELDS)
+LandmarkList = namedtuple('LandmarkList', ['landmark'])
+PoseResult = namedtuple('PoseResult', ['pose_landmarks'])
+
+NO_POSE = PoseResult(pose_landmarks=None)
+
+# Joints the squat angles are computed from on each side: shoulder, hip, knee, ankle.
+SIDE_JOINTS = np.array([[11, 23, 25, 27],    # left
+                        [12, 24, 26, 28]])   # right
+
+# Sides closer in confidence than this are picked by body geometry instead.
+SIDE_CONFIDENCE_MARGIN = 0.1
+
+
+def landmarks_to_array(pose_landmarks, out=None):
+    """Copy a MediaPipe landmark list into a (33, 4) float32 array of x, y, z, visibility."""
+    if out is None:
+        out = np.empty((NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+
+    for idx, lm in enumerate(pose_landmarks.landmark):
+        out[idx, 0] = lm.x
+        out[idx, 1] = lm.y
+        out[idx, 2] = lm.z
+        out[idx, 3] = lm.visibility
+    return out
+
+
+def visibility_array(pose_landmarks):
+    """Visibility of every landmark of a MediaPipe landmark list, as a (33,) float32 array."""
+    return np.fromiter((lm.visibility for lm in pose_landmarks.landmark), dtype=np.float32, count=NUM_LANDMARKS)
+
+
+def side_confidence(visibility):
+    """(left, right) confidence: the visibility of each side's least visible key joint."""
+    return visibility[SIDE_JOINTS].min(axis=1)
+
+
+def array_to_result(landmarks):
+    """Wrap a (33, 4) array (or None) as a pose result ProcessFrame can consume."""
+    if landmarks is None:
+        return NO_POSE
+    return PoseResult(LandmarkList([Landmark(*map(float, row)) for row in landmarks]))
+
+
+
+class ArrayPose:
+    """
+    Pose-like object that returns pre-computed landmarks instead of running a model.
+
+    set() the landmarks for the next frame, then pass this object to
+    ProcessFrame.process() in place of a MediaPipe pose.
+    """
+
+    def __init__(self):
+        self._result = NO_POSE
+
+    def set(self, landmarks):
+        self._result = array_to_result(landmarks)
+        return self
+
+    def process(self, frame):
+        return self._result
+
+
+
+class ReplayPose:
+    """Replays a (n_frames, 33, 4) landmark trace frame by frame; frames with present=False have no pose."""
+
+    def __init__(self, landmarks, present):
+        self.landmarks = landmarks
+        self.present = present
+        self.frame_idx = 0
+
+    def process(self, frame):
+        idx = self.frame_idx
+        self.frame_idx += 1
+
+        if idx >= len(self.present) or not self.present[idx]:
+            return NO_POSE
+        return array_to_result(self.landmarks[idx])
+
+
+
+class RecordingPose:
+    """Wraps a MediaPipe pose and keeps the landmarks of the last processed frame."""
+
+    def __init__(self, pose):
+        self.pose = pose
+        self.last_landmarks = np.empty((NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+        self.last_present = False
+
+    def process(self, frame):
+        result = self.pose.process(frame)
+        self.last_present = bool(result.pose_landmarks)
+        if self.last_present:
+            landmarks_to_array(result.pose_landmarks, out=self.last_landmarks)
+        return result
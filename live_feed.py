@@ -0,0 +1,71 @@
+import time
+from typing import NamedTuple, Optional, Sequence, Tuple
+
+
+class LiveCounters(NamedTuple):
+    seq: int
+    timestamp: float
+    squat_count: int
+    improper_squat: int
+    feedback: Tuple[str, ...]
+    last_sound: Optional[str]
+
+
+EMPTY_COUNTERS = LiveCounters(0, 0.0, 0, 0, (), None)
+
+
+class LiveFeed:
+    """
+    Single-writer snapshot channel from the webrtc frame callback to the page script.
+
+    The callback publishes immutable LiveCounters tuples and the page polls the
+    latest one. Publishing swaps a single reference, which is atomic under the
+    GIL, so neither side ever takes a lock. Snapshots are only built at most once
+    per `min_interval` seconds unless a counter changed or a sound was played.
+    """
+
+    def __init__(self, feedback_labels: Sequence[str], min_interval: float = 0.2):
+        self.feedback_labels = tuple(feedback_labels)
+        self.min_interval = min_interval
+        self._latest = EMPTY_COUNTERS
+        self._last_sound = None
+
+    def publish(self, state, play_sound=None, now=None):
+        """Called from the frame callback after ProcessFrame.process()."""
+        latest = self._latest
+        if play_sound is not None:
+            self._last_sound = play_sound
+
+        if now is None:
+            now = time.perf_counter()
+
+        changed = play_sound is not None or \
+                  state.squat_count != latest.squat_count or \
+                  state.improper_squat != latest.improper_squat
+
+        if not changed and now - latest.timestamp < self.min_interval:
+            return False
+
+        feedback = tuple(
+            label for label, active in zip(self.feedback_labels, state.display_text) if active
+        )
+        if state.lower_hips:
+            feedback = ('LOWER YOUR HIPS',) + feedback
+
+        self._latest = LiveCounters(
+            seq=latest.seq + 1,
+            timestamp=now,
+            squat_count=state.squat_count,
+            improper_squat=state.improper_squat,
+            feedback=feedback,
+            last_sound=self._last_sound
+        )
+        return True
+
+    def latest(self) -> LiveCounters:
+        return self._latest
+
+    def poll(self, since_seq: int) -> Optional[LiveCounters]:
+        """Return the latest snapshot if it is newer than `since_seq`, else None."""
+        latest = self._latest
+        return latest if latest.seq > since_seq else None
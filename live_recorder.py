@@ -0,0 +1,162 @@
+import os
+import time
+import queue
+import logging
+import threading
+from fractions import Fraction
+
+import av
+
+
+# Caps for one live recording; whichever is hit first stops it.
+RECORD_MAX_SECONDS = float(os.getenv('SMARTFIT_RECORD_MAX_SECONDS', '600'))
+RECORD_MAX_BYTES = int(os.getenv('SMARTFIT_RECORD_MAX_MB', '200')) * 1024 * 1024
+
+# Frames waiting for the encoder. When it falls behind, new frames are dropped
+# instead of blocking the live callback or growing memory.
+RECORD_QUEUE_SIZE = 16
+
+_STOP = object()
+
+
+class LiveRecorder:
+    """
+    Records one live session's processed frames to an mp4 on a background thread.
+
+    submit() is called from the frame callback and only does a non-blocking
+    queue put; opening the file, colour conversion, H.264 encoding and muxing
+    all happen on the encoder thread. Frames are timestamped with their capture
+    time, so dropped frames don't shorten the recording.
+
+    The thread starts with the first frame. Recording stops by itself once
+    `max_seconds` or `max_bytes` is reached, or after `idle_timeout` seconds
+    without frames (e.g. the browser went away).
+    """
+
+    def __init__(self, path, max_seconds=RECORD_MAX_SECONDS, max_bytes=RECORD_MAX_BYTES,
+                 queue_size=RECORD_QUEUE_SIZE, idle_timeout=10.0, crf=26):
+        self.path = path
+        self.max_seconds = max_seconds
+        self.max_bytes = max_bytes
+        self.idle_timeout = idle_timeout
+        self.crf = crf
+
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self.bytes_written = 0
+        self.duration = 0.0
+        self.stop_reason = None
+        self.error = None
+
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._accepting = True
+        self._thread = threading.Thread(target=self._run, name='live-recorder', daemon=True)
+
+    @property
+    def recording(self):
+        return self._accepting
+
+    @property
+    def has_output(self):
+        return self.frames_written > 0 and os.path.exists(self.path)
+
+    def submit(self, frame, timestamp=None):
+        """Queue an RGB frame for encoding. Returns False if it was dropped."""
+        if not self._accepting:
+            return False
+        if self._thread.ident is None:
+            self._thread.start()
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        try:
+            self._queue.put_nowait((frame, timestamp))
+        except queue.Full:
+            self.frames_dropped += 1
+            return False
+        return True
+
+    def close(self, timeout=10.0):
+        """Stop accepting frames, finish encoding the queued ones and finalize the file."""
+        self._accepting = False
+        if self._thread.ident is None:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout=timeout)
+
+    def _stop(self, reason):
+        if self._accepting:
+            self._accepting = False
+            self.stop_reason = reason
+
+    def _run(self):
+        container = None
+        stream = None
+        start_time = None
+        last_pts = -1
+
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=self.idle_timeout)
+                except queue.Empty:
+                    self._stop('idle')
+                    break
+                if item is _STOP:
+                    break
+                if not self._accepting and self.stop_reason is not None:
+                    # A cap was hit; discard whatever was queued after it.
+                    continue
+
+                frame, timestamp = item
+                if container is None:
+                    container = av.open(self.path, mode='w', format='mp4',
+                                        options={'movflags': 'faststart'})
+                    stream = container.add_stream('libx264', rate=30, options={
+                        'preset': 'veryfast', 'crf': str(self.crf),
+                        # One encoder thread per session, so many sessions can't starve the live callbacks.
+                        'threads': '1'
+                    })
+                    stream.width = frame.shape[1] - frame.shape[1] % 2
+                    stream.height = frame.shape[0] - frame.shape[0] % 2
+                    stream.pix_fmt = 'yuv420p'
+                    # Millisecond timestamps from the capture clock: frame pacing follows the camera.
+                    stream.codec_context.time_base = Fraction(1, 1000)
+                    start_time = timestamp
+
+                elapsed = timestamp - start_time
+                if elapsed > self.max_seconds:
+                    self._stop('duration')
+                    continue
+
+                video_frame = av.VideoFrame.from_ndarray(frame[:stream.height, :stream.width], format='rgb24')
+                video_frame.pts = max(int(elapsed * 1000), last_pts + 1)
+                video_frame.time_base = Fraction(1, 1000)
+                last_pts = video_frame.pts
+
+                for packet in stream.encode(video_frame):
+                    container.mux(packet)
+                    self.bytes_written += packet.size
+
+                self.frames_written += 1
+                self.duration = elapsed
+
+                if self.bytes_written >= self.max_bytes:
+                    self._stop('size')
+
+        except Exception as e:
+            logging.exception(f"Live recording to {self.path} failed")
+            self.error = str(e)
+            self._accepting = False
+
+        finally:
+            self._accepting = False
+            if container is not None:
+                try:
+                    for packet in stream.encode(None):
+                        container.mux(packet)
+                    container.close()
+                except Exception as e:
+                    logging.warning(f"Could not finalize live recording {self.path}: {e}")
@@ -0,0 +1,73 @@
+import time
+
+import av
+
+from utils import get_mediapipe_pose
+from landmarks import RecordingPose
+
+
+def session_pose(state):
+    """
+    The session's pose model, created once and kept in `state` (st.session_state)
+    instead of building a new MediaPipe graph on every rerun.
+    """
+    if 'live_pose' not in state:
+        state['live_pose'] = RecordingPose(get_mediapipe_pose())
+    return state['live_pose']
+
+
+
+class LiveFrameHandler:
+    """
+    The live stream's per-frame work, used as webrtc_streamer's
+    video_frame_callback and driven directly by load_test.py.
+
+    Everything but process_frame, pose, feed and admission is optional: the
+    capture controller caps the analyzed frame rate, the recorder and sidecar
+    keep the session, and the cue mixer plays audio feedback.
+    """
+
+    def __init__(self, process_frame, pose, feed, admission, session_id,
+                 capture=None, recorder=None, sidecar=None, cue_mixer=None):
+        self.process_frame = process_frame
+        self.pose = pose
+        self.feed = feed
+        self.admission = admission
+        self.session_id = session_id
+        self.capture = capture
+        self.recorder = recorder
+        self.sidecar = sidecar
+        self.cue_mixer = cue_mixer
+
+    def __call__(self, frame: av.VideoFrame) -> av.VideoFrame:
+        process_frame = self.process_frame
+        frame = frame.to_ndarray(format="rgb24")  # Decode and get RGB frame
+        timestamp = time.perf_counter()
+
+        # The browser keeps its capture rate until the stream restarts, so frames
+        # above the current level's rate get the last overlay instead of a pose pass.
+        if self.capture is not None and process_frame.last_analysis is not None \
+                and not self.capture.should_process(timestamp):
+            frame = process_frame.render(frame, process_frame.last_analysis)
+            if self.recorder is not None:
+                self.recorder.submit(frame, timestamp)
+            return av.VideoFrame.from_ndarray(frame, format="rgb24")
+
+        if self.sidecar is not None and self.sidecar.n_frames == 0:
+            self.sidecar.meta['frame_size'] = [frame.shape[1], frame.shape[0]]
+
+        # Latency feeds admission control, which throttles batch analysis when live frames slow down.
+        with self.admission.live_frame(self.session_id):
+            frame, play_sound = process_frame.process(frame, self.pose, timestamp=timestamp)  # Process frame
+        if self.capture is not None:
+            self.capture.observe(time.perf_counter() - timestamp)
+        if self.sidecar is not None:
+            self.sidecar.add(self.pose, process_frame, play_sound, timestamp)
+        if self.recorder is not None:
+            self.recorder.submit(frame, timestamp)  # Non-blocking; encoded on the recorder's thread
+        self.feed.publish(process_frame.state_tracker, play_sound)  # Share counters with the page
+        if self.cue_mixer is not None:
+            self.cue_mixer.trigger(play_sound)
+            self.cue_mixer.trigger_feedback(process_frame.state_tracker.display_text, self.feed.feedback_labels,
+                                            process_frame.state_tracker.lower_hips)
+        return av.VideoFrame.from_ndarray(frame, format="rgb24")  # Encode and return RGB frame
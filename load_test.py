@@ -0,0 +1,330 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+
+import av
+import cv2
+import numpy as np
+import pandas as pd
+
+from utils import get_mediapipe_pose
+from process_frame import ProcessFrame
+from thresholds import get_thresholds
+from live_feed import LiveFeed
+from landmarks import RecordingPose, NO_POSE, array_to_result
+from admission import AdmissionController, LIVE_P95_TARGET
+from capture_control import CaptureController
+from live_recorder import LiveRecorder
+from live_session import LiveFrameHandler
+from media_backend import open_reader
+from synthetic import generate_clip, random_reps, render_frames, load_clip
+
+
+# Pass criteria for every session; also the gate used by --find-capacity.
+MIN_FPS_RATIO = 0.9
+MAX_P95_MS = 1000.0 * LIVE_P95_TARGET * 2
+
+# A run where fewer analyzed frames than this have a usable pose fails, since
+# ProcessFrame skips the angle, feedback and drawing work on the others.
+MIN_DETECTION_RATE = 0.8
+
+# Latency samples from the first seconds are dropped while models warm up.
+WARMUP_SECONDS = 2.0
+
+
+def load_source_frames(source, frame_size, fps, max_frames=150, backend=None):
+    """
+    Frames every simulated camera loops over, as the yuv420p VideoFrames a
+    WebRTC decoder hands to the callback, and the landmark trace that goes
+    with them. `source` is a video, a synthetic trace (.npz), or None for a
+    freshly generated synthetic clip.
+
+    Returns (frames, trace): trace is (landmarks, present) aligned with the
+    frames for synthetic sources, whose stick figures no pose model detects,
+    and None for videos.
+    """
+    trace = None
+    if source is None or source.endswith('.npz'):
+        clip = load_clip(source) if source else \
+            generate_clip(random_reps(np.random.default_rng(0), 4, get_thresholds('beginner')), fps=fps, frame_size=frame_size)
+        rgb_frames = render_frames(clip)
+        trace = (clip.landmarks, clip.present)
+    else:
+        reader = open_reader(source, backend)
+        rgb_frames = iter(reader)
+
+    frames = []
+    try:
+        for rgb in rgb_frames:
+            if (rgb.shape[1], rgb.shape[0]) != tuple(frame_size):
+                rgb = cv2.resize(rgb, tuple(frame_size), interpolation=cv2.INTER_AREA)
+            frames.append(av.VideoFrame.from_ndarray(rgb, format='rgb24').reformat(format='yuv420p'))
+            if len(frames) >= max_frames:
+                break
+    finally:
+        if source is not None and not source.endswith('.npz'):
+            reader.close()
+    if trace is not None:
+        trace = (trace[0][:len(frames)], trace[1][:len(frames)])
+    return frames, trace
+
+
+def _rss_bytes():
+    """Current resident set size, where the platform exposes it."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+
+class TracePose:
+    """
+    Pose for looped synthetic frames: returns the trace's landmarks for the
+    frame index set with seek(), so ProcessFrame does its full angle,
+    feedback and drawing work. If `model` is given it still runs on every
+    frame, so latency includes inference; its result is discarded.
+    """
+
+    def __init__(self, landmarks, present, model=None):
+        self.results = [array_to_result(landmarks[idx] if present[idx] else None) for idx in range(len(present))]
+        self.model = model
+        self.frame_idx = 0
+
+    def seek(self, frame_idx):
+        self.frame_idx = frame_idx % len(self.results)
+
+    def process(self, frame):
+        if self.model is not None:
+            self.model.process(frame)
+        return self.results[self.frame_idx] if self.results else NO_POSE
+
+    def close(self):
+        if self.model is not None:
+            self.model.close()
+
+
+
+class SimulatedSession:
+    """
+    One camera user: a source thread delivers frames at `fps` into a one-frame
+    slot and a worker thread runs the live frame handler on the newest one,
+    like streamlit-webrtc's per-session callback thread. A frame still in the
+    slot when the next one arrives is dropped.
+    """
+
+    def __init__(self, session_id, frames, fps, thresholds, admission, adaptive=False, record_dir=None, trace=None):
+        self.session_id = session_id
+        self.frames = frames
+        self.fps = fps
+
+        process_frame = ProcessFrame(thresholds=thresholds, flip_frame=True)
+        feed = LiveFeed([feedback[0] for feedback in process_frame.FEEDBACK_ID_MAP.values()])
+        recorder = LiveRecorder(os.path.join(record_dir, f'session_{session_id}.mp4')) if record_dir else None
+        self.pose = get_mediapipe_pose() if trace is None else TracePose(*trace, model=get_mediapipe_pose())
+        self.handler = LiveFrameHandler(
+            process_frame, RecordingPose(self.pose), feed, admission, session_id,
+            capture=CaptureController() if adaptive else None, recorder=recorder
+        )
+
+        self.sent = 0
+        self.processed = 0
+        self.analyzed = 0
+        self.detected = 0
+        self.dropped = 0
+        self.latencies = []
+        self.warmup_until = 0.0
+
+        self._slot = None
+        self._cond = threading.Condition()
+        self._done = False
+
+    def run(self, duration):
+        started = time.perf_counter()
+        self.warmup_until = started + min(WARMUP_SECONDS, duration / 4)
+        worker = threading.Thread(target=self._work, name=f'load-session-{self.session_id}', daemon=True)
+        worker.start()
+
+        # Cameras don't start in lockstep.
+        next_frame = started + random.uniform(0, 1.0 / self.fps)
+        frame_idx = 0
+        while next_frame < started + duration:
+            time.sleep(max(0.0, next_frame - time.perf_counter()))
+            with self._cond:
+                if self._slot is not None:
+                    self.dropped += 1
+                self._slot = (frame_idx, time.perf_counter())
+                self._cond.notify()
+            self.sent += 1
+            frame_idx += 1
+            next_frame += 1.0 / self.fps
+
+        with self._cond:
+            self._done = True
+            self._cond.notify()
+        worker.join()
+
+        if self.handler.recorder is not None:
+            self.handler.recorder.close()
+        self.pose.close()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while self._slot is None and not self._done:
+                    self._cond.wait()
+                if self._slot is None:
+                    return
+                frame_idx, arrived = self._slot
+                self._slot = None
+
+            if isinstance(self.pose, TracePose):
+                self.pose.seek(frame_idx)
+            process_frame = self.handler.process_frame
+            analyzed_before = process_frame.frame_idx
+            self.handler(self.frames[frame_idx % len(self.frames)])
+            finished = time.perf_counter()
+            self.processed += 1
+            # Frames skipped by the adaptive frame-rate cap aren't analyzed and don't count.
+            if process_frame.frame_idx > analyzed_before:
+                self.analyzed += 1
+                self.detected += process_frame.last_analysis.view is not None
+            if arrived >= self.warmup_until:
+                self.latencies.append(finished - arrived)
+
+    def report(self, duration):
+        latencies = np.asarray(self.latencies) * 1000.0
+        percentile = (lambda q: round(float(np.percentile(latencies, q)), 1)) if len(latencies) else (lambda q: float('nan'))
+        return {
+            'session': self.session_id,
+            'fps': round(self.processed / duration, 2),
+            'p50_ms': percentile(50),
+            'p95_ms': percentile(95),
+            'p99_ms': percentile(99),
+            'sent': self.sent,
+            'processed': self.processed,
+            'detection': round(self.detected / max(1, self.analyzed), 3),
+            'dropped': self.dropped
+        }
+
+
+
+# ------------------------------------- DRIVER -------------------------------------
+
+def run_load(n_sessions, frames, fps, duration, thresholds, adaptive=False, record=False, trace=None):
+    """Run `n_sessions` simulated users for `duration` seconds; returns (per-session rows, process summary)."""
+    admission = AdmissionController()
+    record_dir = tempfile.mkdtemp(prefix='smartfit_load_') if record else None
+    sessions = [SimulatedSession(idx, frames, fps, thresholds, admission, adaptive, record_dir, trace)
+                for idx in range(n_sessions)]
+
+    threads = [threading.Thread(target=session.run, args=(duration,), daemon=True) for session in sessions]
+    cpu_start, wall_start = os.times(), time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    peak_rss = _rss_bytes()
+    while any(thread.is_alive() for thread in threads):
+        time.sleep(0.5)
+        rss = _rss_bytes()
+        if rss is not None:
+            peak_rss = max(peak_rss or 0, rss)
+    for thread in threads:
+        thread.join()
+
+    cpu_end, wall = os.times(), time.perf_counter() - wall_start
+    if record_dir:
+        shutil.rmtree(record_dir, ignore_errors=True)
+    cpu_seconds = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    rows = [session.report(duration) for session in sessions]
+
+    summary = {
+        'sessions': n_sessions,
+        'target_fps': fps,
+        'cores': os.cpu_count(),
+        'cpu_percent': round(100.0 * cpu_seconds / wall, 1),
+        'peak_rss_mb': round(peak_rss / 2**20, 1) if peak_rss else None,
+        'min_fps': min(row['fps'] for row in rows),
+        'worst_p95_ms': max(row['p95_ms'] for row in rows),
+        'min_detection': min(row['detection'] for row in rows),
+        'dropped': sum(row['dropped'] for row in rows)
+    }
+    return rows, summary
+
+
+def passes(summary, min_fps_ratio=MIN_FPS_RATIO, max_p95_ms=MAX_P95_MS, min_detection=MIN_DETECTION_RATE):
+    return summary['min_fps'] >= min_fps_ratio * summary['target_fps'] and \
+           summary['worst_p95_ms'] <= max_p95_ms and summary['min_detection'] >= min_detection
+
+
+def find_capacity(frames, fps, duration, thresholds, min_fps_ratio=MIN_FPS_RATIO, max_p95_ms=MAX_P95_MS,
+                  min_detection=MIN_DETECTION_RATE, **kwargs):
+    """Largest session count that still passes: double until a run fails, then bisect."""
+    good, bad = 0, None
+    n_sessions = 1
+    while bad is None or bad - good > 1:
+        _, summary = run_load(n_sessions, frames, fps, duration, thresholds, **kwargs)
+        ok = passes(summary, min_fps_ratio, max_p95_ms, min_detection)
+        print(f"{n_sessions} sessions: {'pass' if ok else 'fail'} (min fps {summary['min_fps']}, "
+              f"worst p95 {summary['worst_p95_ms']} ms, detection {summary['min_detection']}, "
+              f"cpu {summary['cpu_percent']}%)", flush=True)
+        if ok:
+            good = n_sessions
+        else:
+            bad = n_sessions
+        n_sessions = n_sessions * 2 if bad is None else (good + bad) // 2
+    return good
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the live frame path with simulated camera users, offline.')
+    parser.add_argument('--sessions', type=int, default=4, help='Concurrent simulated users.')
+    parser.add_argument('--source', default=None, help='Video or synthetic .npz trace to loop (default: generated clip, '
+                                                       'whose landmarks are replayed while the pose model still runs).')
+    parser.add_argument('--fps', type=float, default=15.0, help='Camera frame rate per session.')
+    parser.add_argument('--size', default='480x360', help='Camera resolution, WxH.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds per run.')
+    parser.add_argument('--mode', default='beginner', choices=['beginner', 'pro'])
+    parser.add_argument('--adaptive', action='store_true', help='Cap the analyzed frame rate with CaptureController.')
+    parser.add_argument('--record', action='store_true', help='Also encode each session with LiveRecorder.')
+    parser.add_argument('--min-fps-ratio', type=float, default=MIN_FPS_RATIO, help='Gate: achieved / target fps.')
+    parser.add_argument('--max-p95-ms', type=float, default=MAX_P95_MS, help='Gate: worst session p95 latency.')
+    parser.add_argument('--min-detection', type=float, default=MIN_DETECTION_RATE,
+                        help='Gate: share of analyzed frames with a usable pose, per session.')
+    parser.add_argument('--find-capacity', action='store_true', help='Search for the most sessions that pass the gate.')
+    parser.add_argument('--json', help='Write the results to this JSON file.')
+    args = parser.parse_args()
+
+    frame_size = tuple(int(value) for value in args.size.lower().split('x'))
+    frames, trace = load_source_frames(args.source, frame_size, args.fps)
+    thresholds = get_thresholds(args.mode)
+    options = {'adaptive': args.adaptive, 'record': args.record, 'trace': trace}
+
+    if args.find_capacity:
+        capacity = find_capacity(frames, args.fps, args.duration, thresholds, args.min_fps_ratio, args.max_p95_ms,
+                                 args.min_detection, **options)
+        result = {'sessions': capacity, 'cores': os.cpu_count(),
+                  'sessions_per_core': round(capacity / (os.cpu_count() or 1), 2)}
+        print(f"Capacity: {capacity} sessions at {args.fps:g} fps {args.size} "
+              f"({result['sessions_per_core']} per core)")
+        ok = capacity > 0
+    else:
+        rows, result = run_load(args.sessions, frames, args.fps, args.duration, thresholds, **options)
+        result['per_session'] = rows
+        ok = passes(result, args.min_fps_ratio, args.max_p95_ms, args.min_detection)
+        with pd.option_context('display.max_rows', None, 'display.width', 200):
+            print(pd.DataFrame(rows).to_string(index=False))
+        print(' '.join(f'{key}={value}' for key, value in result.items() if key != 'per_session'))
+        print('PASS' if ok else 'FAIL')
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(result, f, indent=2)
+    sys.exit(0 if ok else 1)
@@ -0,0 +1,183 @@
+import os
+from fractions import Fraction
+
+import av
+import cv2
+import numpy as np
+
+
+# 'pyav' (threaded decode, H.264 faststart MP4 output) or 'opencv'.
+MEDIA_BACKEND = os.getenv('SMARTFIT_MEDIA_BACKEND', 'pyav')
+
+# libx264 settings for the PyAV writer.
+H264_PRESET = os.getenv('SMARTFIT_H264_PRESET', 'veryfast')
+H264_CRF = int(os.getenv('SMARTFIT_H264_CRF', '23'))
+# Encoder threads per output. One keeps a batch job on the single core its
+# admission slot accounts for; 0 lets x264 use every core.
+H264_THREADS = int(os.getenv('SMARTFIT_H264_THREADS', '1'))
+
+
+# Both backends read and write RGB frames, which is what ProcessFrame works with.
+#
+#   reader.fps, reader.frame_size, reader.frame_count
+#   reader.seek(frame_idx); for frame in reader: ...; reader.close()
+#   writer.write(frame); writer.close()
+
+
+class OpenCVReader:
+
+    def __init__(self, path):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise ValueError(f"Could not open video: {path}")
+
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 30.0
+        self.frame_size = (int(self.capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+                           int(self.capture.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+
+    def seek(self, frame_idx):
+        self.capture.set(cv2.CAP_PROP_POS_FRAMES, frame_idx)
+
+    def __iter__(self):
+        while self.capture.isOpened():
+            ret, frame = self.capture.read()
+            if not ret:
+                break
+            yield cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def close(self):
+        self.capture.release()
+
+
+class OpenCVWriter:
+    """MPEG-4 Part 2 in an mp4 container; kept for environments without libx264."""
+
+    def __init__(self, path, fps, frame_size):
+        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+        self.writer = cv2.VideoWriter(path, fourcc, fps, tuple(frame_size))
+
+    def write(self, frame):
+        self.writer.write(frame[...,::-1])
+
+    def close(self):
+        self.writer.release()
+
+
+def _stream_rotation(stream):
+    """
+    Clockwise rotation, in degrees, that a player applies to the stream, from
+    its display matrix (or the older 'rotate' tag). OpenCV applies it itself.
+    """
+    side_data = getattr(stream, 'side_data', None) or {}
+    if 'DISPLAYMATRIX' in side_data:
+        # FFmpeg reports the display matrix angle counter-clockwise.
+        degrees = -float(side_data['DISPLAYMATRIX'])
+    else:
+        try:
+            degrees = float(stream.metadata.get('rotate', 0))
+        except ValueError:
+            degrees = 0.0
+    return int(round(degrees / 90.0)) % 4 * 90
+
+
+class PyAVReader:
+    """Decodes with FFmpeg's frame and slice threading enabled, upright like OpenCV's reader."""
+
+    def __init__(self, path):
+        try:
+            self.container = av.open(path)
+        except av.AVError as e:
+            raise ValueError(f"Could not open video: {path}") from e
+        if not self.container.streams.video:
+            self.container.close()
+            raise ValueError(f"No video stream in: {path}")
+
+        self.stream = self.container.streams.video[0]
+        self.stream.thread_type = 'AUTO'
+
+        rate = self.stream.average_rate or self.stream.guessed_rate
+        self.fps = float(rate) if rate else 30.0
+        self.rotation = _stream_rotation(self.stream)
+        self.frame_size = (self.stream.codec_context.width, self.stream.codec_context.height)
+        if self.rotation in (90, 270):
+            self.frame_size = self.frame_size[::-1]
+
+        self.frame_count = self.stream.frames
+        if not self.frame_count and self.stream.duration:
+            self.frame_count = int(self.stream.duration * self.stream.time_base * self.fps)
+
+        self._skip_before = None
+
+    def seek(self, frame_idx):
+        # Seek to the keyframe before the target and decode forward to it.
+        target = frame_idx / self.fps
+        start = self.stream.start_time or 0
+        self.container.seek(start + int(target / self.stream.time_base), stream=self.stream, backward=True)
+        self._skip_before = target - 0.5 / self.fps
+
+    def __iter__(self):
+        start = float((self.stream.start_time or 0) * self.stream.time_base)
+        for frame in self.container.decode(self.stream):
+            if self._skip_before is not None:
+                if frame.time is not None and frame.time - start < self._skip_before:
+                    continue
+                self._skip_before = None
+            rgb = frame.to_ndarray(format='rgb24')
+            if self.rotation:
+                # np.rot90 turns counter-clockwise; copy so OpenCV can draw on the result.
+                rgb = np.ascontiguousarray(np.rot90(rgb, k=-self.rotation // 90))
+            yield rgb
+
+    def close(self):
+        self.container.close()
+
+
+class PyAVWriter:
+    """H.264 MP4 with the index up front (faststart), so browsers can play it while it downloads."""
+
+    def __init__(self, path, fps, frame_size, preset=H264_PRESET, crf=H264_CRF, threads=H264_THREADS):
+        self.container = av.open(path, mode='w', format='mp4', options={'movflags': 'faststart'})
+        self.stream = self.container.add_stream('libx264', rate=Fraction(fps).limit_denominator(1001), options={
+            'preset': preset, 'crf': str(crf),
+            'threads': str(threads)
+        })
+        # yuv420p needs even dimensions.
+        self.stream.width = frame_size[0] - frame_size[0] % 2
+        self.stream.height = frame_size[1] - frame_size[1] % 2
+        self.stream.pix_fmt = 'yuv420p'
+        self._frames = 0
+
+    def write(self, frame):
+        video_frame = av.VideoFrame.from_ndarray(frame[:self.stream.height, :self.stream.width], format='rgb24')
+        video_frame.pts = self._frames
+        video_frame.time_base = self.stream.codec_context.time_base
+        self._frames += 1
+        for packet in self.stream.encode(video_frame):
+            self.container.mux(packet)
+
+    def close(self):
+        for packet in self.stream.encode(None):
+            self.container.mux(packet)
+        self.container.close()
+
+
+BACKENDS = {
+    'opencv': (OpenCVReader, OpenCVWriter),
+    'pyav': (PyAVReader, PyAVWriter)
+}
+
+
+def _backend(name):
+    name = name or MEDIA_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown media backend: {name} (choose from {', '.join(BACKENDS)})")
+    return BACKENDS[name]
+
+
+def open_reader(path, backend=None):
+    return _backend(backend)[0](path)
+
+
+def open_writer(path, fps, frame_size, backend=None):
+    return _backend(backend)[1](path, fps, frame_size)
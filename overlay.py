@@ -0,0 +1,90 @@
+# Overlay-as-data: the drawing ProcessFrame.render() does, as compact primitives
+# a browser canvas can draw over its own camera feed (see static/overlay.js).
+#
+# Each primitive is a short list, coordinates in pixels of the analyzed frame:
+#
+#     ['c', x, y, radius, color]                        filled circle
+#     ['l', x1, y1, x2, y2, color, width]               line
+#     ['a', x, y, radius, start, end, color, width]     arc, degrees clockwise from +x
+#     ['d', x, y1, y2, color]                           dotted vertical line
+#     ['t', text, x, y, color, background, scale]       text, boxed if background is set
+#
+# Colors are '#rrggbb'. Mirroring for flip_frame is already applied.
+
+
+def _hex(color):
+    return '#%02x%02x%02x' % tuple(int(c) for c in color)
+
+
+def _counters(analysis, primitives):
+    frame_width = analysis.frame_size[0]
+    primitives.append(['t', f'CORRECT: {analysis.squat_count}', int(frame_width*0.68), 30, '#ffffe6', '#12b900', 0.7])
+    primitives.append(['t', f'INCORRECT: {analysis.improper_squat}', int(frame_width*0.68), 80, '#ffffe6', '#dd0000', 0.7])
+
+
+def overlay_primitives(process_frame, analysis):
+    """Primitives for one FrameAnalysis, matching what render() would draw."""
+    frame_width, frame_height = analysis.frame_size
+    colors = process_frame.COLORS
+    flip = process_frame.flip_frame
+    points = analysis.points
+
+    def x_of(point):
+        # cv2.flip(frame, 1) maps column x to width - 1 - x.
+        return frame_width - 1 - int(point[0]) if flip else int(point[0])
+
+    def arc_angle(angle):
+        return 180 - angle if flip else angle
+
+    primitives = []
+
+    if analysis.view == 'front':
+        primitives.append(['c', x_of(points['nose']), int(points['nose'][1]), 7, _hex(colors['white'])])
+        primitives.append(['c', x_of(points['left_shoulder']), int(points['left_shoulder'][1]), 7, _hex(colors['yellow'])])
+        primitives.append(['c', x_of(points['right_shoulder']), int(points['right_shoulder'][1]), 7, _hex(colors['magenta'])])
+
+        _counters(analysis, primitives)
+        primitives.append(['t', 'CAMERA NOT ALIGNED PROPERLY!!!', 30, frame_height-60, '#ffffe6', '#ff9900', 0.65])
+        primitives.append(['t', f'OFFSET ANGLE: {analysis.offset_angle}', 30, frame_height-30, '#ffffe6', '#ff9900', 0.65])
+
+    elif analysis.view == 'side':
+        hip_angle, knee_angle, ankle_angle = analysis.angles
+        multiplier = analysis.multiplier
+        white, blue = _hex(colors['white']), _hex(colors['blue'])
+
+        # Same arcs and guide lines as render(): (joint, arc radius, arc sweep, guide length above the joint).
+        for name, radius, sweep, above in (('hip', 30, multiplier*hip_angle, 80),
+                                           ('knee', 20, -multiplier*knee_angle, 50),
+                                           ('ankle', 30, multiplier*ankle_angle, 50)):
+            x, y = x_of(points[name]), int(points[name][1])
+            primitives.append(['a', x, y, radius, arc_angle(-90), arc_angle(-90 + sweep), white, 3])
+            primitives.append(['d', x, y - above, y + 20, blue])
+
+        light_blue = _hex(colors['light_blue'])
+        for start, end in (('shoulder', 'elbow'), ('wrist', 'elbow'), ('shoulder', 'hip'),
+                           ('knee', 'hip'), ('ankle', 'knee'), ('ankle', 'foot')):
+            primitives.append(['l', x_of(points[start]), int(points[start][1]),
+                               x_of(points[end]), int(points[end][1]), light_blue, 4])
+
+        yellow = _hex(colors['yellow'])
+        for name in ('shoulder', 'elbow', 'wrist', 'hip', 'knee', 'ankle', 'foot'):
+            primitives.append(['c', x_of(points[name]), int(points[name][1]), 7, yellow])
+
+        if analysis.lower_hips:
+            primitives.append(['t', 'LOWER YOUR HIPS', 30, 80, '#000000', '#ffff00', 0.6])
+        for idx in analysis.feedback:
+            text, y, background = process_frame.FEEDBACK_ID_MAP[idx]
+            primitives.append(['t', text, 30, y, '#ffffe6', _hex(background), 0.6])
+
+        # Angle labels sit to the right of the joint in the displayed (mirrored) image.
+        light_green = _hex(colors['light_green'])
+        for name, angle, dx, dy in (('hip', hip_angle, 10, 0), ('knee', knee_angle, 15, 10), ('ankle', ankle_angle, 10, 0)):
+            x = frame_width - int(points[name][0]) + dx if flip else int(points[name][0]) + dx
+            primitives.append(['t', str(int(angle)), x, int(points[name][1]) + dy, light_green, None, 0.6])
+
+        _counters(analysis, primitives)
+
+    else:
+        _counters(analysis, primitives)
+
+    return primitives
@@ -1,24 +1,59 @@
-import av
 import os
 import sys
+import time
+import uuid
 import streamlit as st
+import streamlit.components.v1 as components
 from streamlit_webrtc import VideoHTMLAttributes, webrtc_streamer
-from aiortc.contrib.media import MediaRecorder
 
 
 BASE_DIR = os.path.abspath(os.path.join(__file__, '../../'))
 sys.path.append(BASE_DIR)
 
 
-from utils import get_mediapipe_pose
 from process_frame import ProcessFrame
 from thresholds import get_thresholds_beginner, get_thresholds_pro
+from live_feed import LiveFeed
+from audio_cues import CueBank, CueMixer
+from sidecar import SidecarWriter, SIDECAR_MAX_FRAMES
+from admission import get_admission_controller
+from scratch import ScratchStore
+from live_recorder import LiveRecorder, RECORD_MAX_BYTES, RECORD_MAX_SECONDS
+from capture_control import CaptureController
+from live_session import LiveFrameHandler, session_pose
+
+
+# Base URL of api_server.py as seen from the browser, for the canvas overlay.
+API_URL = os.getenv('SMARTFIT_API_URL', '')
 
 
 st.title('AI Fitness Trainer: Squats Analysis')
 
 mode = st.radio('Select Mode', ['Beginner', 'Pro'], horizontal=True)
 
+overlay_mode = st.radio('Overlay', ['Server Video', 'Browser Canvas'], horizontal=True, disabled=not API_URL,
+                        help='Browser Canvas keeps the camera feed in the browser and draws the overlay there '
+                             'from data sent by the API server, so no video is encoded or sent back.'
+                             + ('' if API_URL else ' Set SMARTFIT_API_URL to enable it.'))
+
+if overlay_mode == 'Browser Canvas':
+    # No WebRTC round trip: the API server only returns overlay primitives.
+    components.html(
+        f'<iframe src="{API_URL.rstrip("/")}/static/live_overlay.html?mode={mode.lower()}" '
+        'allow="camera" style="border:0; width:100%; height:640px;"></iframe>',
+        height=660
+    )
+    st.stop()
+
+record_mode = st.radio('Record', ['Overlay Video', 'Landmark Sidecar'], horizontal=True,
+                       help='The sidecar stores only landmarks, angles and feedback instead of encoding a video.')
+
+cue_bank = CueBank()
+audio_cues = st.checkbox('Audio Cues', value=False, disabled=not cue_bank.available,
+                         help='Speaks rep counts and feedback. The browser asks for microphone access, '
+                              'since cues are sent on the audio track; the mic itself stays muted.'
+                              if cue_bank.available else 'Run `python audio_cues.py` to build the cue bank.')
+
 thresholds = None 
 
 if mode == 'Beginner':
@@ -28,55 +63,185 @@ elif mode == 'Pro':
     thresholds = get_thresholds_pro()
 
 
-live_process_frame = ProcessFrame(thresholds=thresholds, flip_frame=True)
-# Initialize face mesh solution
-pose = get_mediapipe_pose()
-
-
-if 'download' not in st.session_state:
-    st.session_state['download'] = False
-
-output_video_file = f'output_live.flv'
+# Keep the processor and its counter feed across reruns so the counters survive widget interaction.
+if 'live_process_frame' not in st.session_state:
+    st.session_state['live_process_frame'] = ProcessFrame(thresholds=thresholds, flip_frame=True)
+    st.session_state['live_feed'] = LiveFeed(
+        [feedback[0] for feedback in st.session_state['live_process_frame'].FEEDBACK_ID_MAP.values()]
+    )
+
+live_process_frame = st.session_state['live_process_frame']
+live_process_frame.thresholds = thresholds
+live_feed = st.session_state['live_feed']
+live_session_id = id(live_process_frame)
+admission = get_admission_controller()
+
+# Capture resolution and frame rate follow this session's latency and the server's load.
+if 'live_capture' not in st.session_state:
+    st.session_state['live_capture'] = CaptureController()
+live_capture = st.session_state['live_capture']
+
+if 'cue_mixer' not in st.session_state:
+    st.session_state['cue_mixer'] = CueMixer(cue_bank)
+cue_mixer = st.session_state['cue_mixer']
+
+# One pose model per session; the page reruns on every widget change.
+recording_pose = session_pose(st.session_state)
+
+
+if 'saved_sets' not in st.session_state:
+    st.session_state['saved_sets'] = []
+
+
+# Recordings go to the per-user scratch store, one file per session and recording.
+if 'scratch_user' not in st.session_state:
+    st.session_state['scratch_user'] = st.session_state.get('username') or uuid.uuid4().hex
+
+@st.cache_resource
+def get_scratch_store():
+    store = ScratchStore()
+    store.cleanup_stale()
+    return store
+
+
+scratch = get_scratch_store()
+scratch_user = st.session_state['scratch_user']
+
+live_recorder = st.session_state.get('live_recorder')
+live_sidecar = st.session_state.get('live_sidecar')
+
+# Finalize the recording once the stream has stopped or a cap ended it.
+if live_recorder is not None and not live_recorder.recording:
+    live_recorder.close()
+    if live_recorder.has_output:
+        scratch.remove(st.session_state.get('live_video_file'))
+        st.session_state['live_video_file'] = live_recorder.path
+        st.session_state['live_video_stop_reason'] = live_recorder.stop_reason
+    else:
+        scratch.remove(live_recorder.path)
+    live_recorder = st.session_state['live_recorder'] = None
+
+if record_mode == 'Overlay Video':
+    if live_recorder is None:
+        # Leave room in the quota for what's already stored; the file only appears once frames arrive.
+        remaining = max(0, scratch.quota_bytes - scratch.usage(scratch_user))
+        recorder_path = scratch.path(scratch_user, f'live_{uuid.uuid4().hex[:12]}.mp4')
+        live_recorder = st.session_state['live_recorder'] = LiveRecorder(
+            recorder_path, max_bytes=min(RECORD_MAX_BYTES, remaining)
+        )
+    live_sidecar = None
+else:
+    if live_sidecar is None:
+        sidecar_path = scratch.path(scratch_user, f'live_{uuid.uuid4().hex[:12]}.npz')
+        live_sidecar = st.session_state['live_sidecar'] = SidecarWriter(
+            sidecar_path, None, None, thresholds, flip_frame=True,
+            max_seconds=RECORD_MAX_SECONDS, max_frames=SIDECAR_MAX_FRAMES
+        )
+    live_recorder = None
 
   
 
-def video_frame_callback(frame: av.VideoFrame):
-    frame = frame.to_ndarray(format="rgb24")  # Decode and get RGB frame
-    frame, _ = live_process_frame.process(frame, pose)  # Process frame
-    return av.VideoFrame.from_ndarray(frame, format="rgb24")  # Encode and return BGR frame
-
-
-def out_recorder_factory() -> MediaRecorder:
-        return MediaRecorder(output_video_file)
+video_frame_callback = LiveFrameHandler(
+    live_process_frame, recording_pose, live_feed, admission, live_session_id,
+    capture=live_capture, recorder=live_recorder, sidecar=live_sidecar,
+    cue_mixer=cue_mixer if audio_cues else None
+)
 
 
+requested_constraints = live_capture.constraints
 ctx = webrtc_streamer(
                         key="Squats-pose-analysis",
                         video_frame_callback=video_frame_callback,
+                        audio_frame_callback=cue_mixer.mix if audio_cues else None,
                         rtc_configuration={"iceServers": [{"urls": ["stun:stun.l.google.com:19302"]}]},  # Add this config
-                        media_stream_constraints={"video": {"width": {'min':480, 'ideal':480}}, "audio": False},
-                        video_html_attrs=VideoHTMLAttributes(autoPlay=True, controls=False, muted=False),
-                        out_recorder_factory=out_recorder_factory
+                        media_stream_constraints=live_capture.media_stream_constraints(audio=audio_cues),
+                        video_html_attrs=VideoHTMLAttributes(autoPlay=True, controls=False, muted=False)
                     )
 
 
-download_button = st.empty()
-
-if os.path.exists(output_video_file):
-    with open(output_video_file, 'rb') as op_vid:
-        download = download_button.download_button('Download Video', data = op_vid, file_name='output_live.flv')
-
-        if download:
-            st.session_state['download'] = True
-
-
-
-if os.path.exists(output_video_file) and st.session_state['download']:
-    os.remove(output_video_file)
-    st.session_state['download'] = False
-    download_button.empty()
-
-
-    
-
-
+def show_counters(placeholder, counters):
+    with placeholder.container():
+        col_correct, col_incorrect = st.columns(2)
+        col_correct.metric('Correct', counters.squat_count)
+        col_incorrect.metric('Incorrect', counters.improper_squat)
+        if counters.feedback:
+            st.caption(' | '.join(counters.feedback))
+
+
+if st.button('Save Set'):
+    counters = live_feed.latest()
+    st.session_state['saved_sets'].append({'correct': counters.squat_count, 'incorrect': counters.improper_squat})
+
+if st.session_state['saved_sets']:
+    st.table(st.session_state['saved_sets'])
+
+counter_placeholder = st.empty()
+show_counters(counter_placeholder, live_feed.latest())
+
+
+# Write the sidecar once the stream has stopped or a cap ended it.
+if live_sidecar is not None and live_sidecar.n_frames and (not ctx.state.playing or not live_sidecar.recording):
+    live_sidecar.save()
+    scratch.remove(st.session_state.get('live_sidecar_file'))
+    st.session_state['live_sidecar_file'] = live_sidecar.path
+    st.session_state['live_sidecar_stop_reason'] = live_sidecar.stop_reason
+    st.session_state['live_sidecar'] = None
+
+# The stream has stopped: let the recorder drain its queue, then rerun to pick up the file.
+if live_recorder is not None and live_recorder.frames_written and not ctx.state.playing:
+    live_recorder.close()
+    st.rerun()
+
+
+live_sidecar_file = st.session_state.get('live_sidecar_file')
+if live_sidecar_file and os.path.exists(live_sidecar_file):
+    sidecar_stop_reason = st.session_state.get('live_sidecar_stop_reason')
+    if sidecar_stop_reason in ('duration', 'size'):
+        st.caption(f'Sidecar stopped at the {sidecar_stop_reason} limit.')
+    with open(live_sidecar_file, 'rb') as sc_file:
+        st.download_button('Download Landmark Sidecar', data = sc_file, file_name='output_live.npz')
+
+live_video_file = st.session_state.get('live_video_file')
+if live_video_file and os.path.exists(live_video_file):
+    stop_reason = st.session_state.get('live_video_stop_reason')
+    if stop_reason in ('duration', 'size'):
+        st.caption(f'Recording stopped at the {stop_reason} limit.')
+
+    col_download, col_delete = st.columns(2)
+    with open(live_video_file, 'rb') as op_vid:
+        col_download.download_button('Download Video', data = op_vid, file_name='output_live.mp4')
+    if col_delete.button('Delete Recording'):
+        scratch.remove(live_video_file)
+        st.session_state['live_video_file'] = None
+        st.rerun()
+
+
+
+# The level the running stream was started with; later reruns must not overwrite it.
+if not ctx.state.playing:
+    st.session_state['live_stream_constraints'] = None
+elif st.session_state.get('live_stream_constraints') is None:
+    st.session_state['live_stream_constraints'] = requested_constraints
+stream_constraints = st.session_state['live_stream_constraints'] or requested_constraints
+
+capture_placeholder = st.empty()
+
+# Poll the counter feed while the stream is running. This only reads the latest
+# snapshot, so it never blocks the frame callback.
+last_seq = live_feed.latest().seq
+while ctx.state.playing:
+    counters = live_feed.poll(last_seq)
+    if counters is not None:
+        last_seq = counters.seq
+        show_counters(counter_placeholder, counters)
+
+    # Pick the capture level for this session; the frame rate applies right away,
+    # the resolution when the stream is next started.
+    if live_capture.update(admission.live_overloaded()):
+        capture = live_capture.constraints
+        if capture['width'] == stream_constraints['width']:
+            capture_placeholder.caption(f"Analyzing {capture['frameRate']} fps.")
+        else:
+            capture_placeholder.caption(f"Analyzing {capture['frameRate']} fps; "
+                                        f"restart the stream to capture at {capture['width']}x{capture['height']}.")
+    time.sleep(0.25)
@@ -1,18 +1,24 @@
 import av
 import os
 import sys
+import glob
+import time
 import streamlit as st
-import cv2
-import tempfile
+import uuid
 
 
 BASE_DIR = os.path.abspath(os.path.join(__file__, '../../'))
 sys.path.append(BASE_DIR)
 
 
-from utils import get_mediapipe_pose
-from process_frame import ProcessFrame
+from process_frame import FEEDBACK_ID_MAP
 from thresholds import get_thresholds_beginner, get_thresholds_pro
+from rep_metrics import flag_names
+from sidecar import render_overlay
+from highlights import export_clip
+from scratch import ScratchStore, QuotaExceededError
+from jobs import JobQueue, JobRunner, QUEUED, RUNNING, DONE, FAILED, CANCELLED
+from admission import get_admission_controller
 
 
 
@@ -20,9 +26,12 @@ st.title('AI Fitness Trainer: Squats Analysis')
 
 mode = st.radio('Select Mode', ['Beginner', 'Pro'], horizontal=True)
 
+output_mode = st.radio('Output', ['Landmark Sidecar', 'Annotated Video'], horizontal=True,
+                       help='The sidecar stores only landmarks, angles and feedback. '
+                            'The annotated video can be rendered from it when needed.')
 
 
-thresholds = None 
+thresholds = None
 
 if mode == 'Beginner':
     thresholds = get_thresholds_beginner()
@@ -32,11 +41,6 @@ elif mode == 'Pro':
 
 
 
-upload_process_frame = ProcessFrame(thresholds=thresholds)
-
-# Initialize face mesh solution
-pose = get_mediapipe_pose()
-
 
 download = None
 
@@ -44,92 +48,232 @@ if 'download' not in st.session_state:
     st.session_state['download'] = False
 
 
-output_video_file = f'output_recorded.mp4'
+# Uploads and outputs live in a per-user scratch directory with a disk quota.
+if 'scratch_user' not in st.session_state:
+    st.session_state['scratch_user'] = st.session_state.get('username') or uuid.uuid4().hex
 
-if os.path.exists(output_video_file):
-    os.remove(output_video_file)
+@st.cache_resource
+def get_scratch_store():
+    store = ScratchStore()
+    # Sweep files left behind by sessions that died mid-upload.
+    store.cleanup_stale()
+    return store
 
 
-with st.form('Upload', clear_on_submit=True):
-    up_file = st.file_uploader("Upload a Video", ['mp4','mov', 'avi'])
-    uploaded = st.form_submit_button("Upload")
+# Analysis runs on background workers shared by all sessions, so it survives reruns and refreshes.
+@st.cache_resource
+def get_job_runner():
+    return JobRunner(JobQueue()).start()
 
-stframe = st.empty()
 
-ip_vid_str = '<p style="font-family:Helvetica; font-weight: bold; font-size: 16px;">Input Video</p>'
-warning_str = '<p style="font-family:Helvetica; font-weight: bold; color: Red; font-size: 17px;">Please Upload a Video first!!!</p>'
-
-warn = st.empty()
+scratch = get_scratch_store()
+scratch_user = st.session_state['scratch_user']
 
+job_runner = get_job_runner()
+job_queue = job_runner.queue
 
-download_button = st.empty()
 
-if up_file and uploaded:
-    
-    download_button.empty()
-    tfile = tempfile.NamedTemporaryFile(delete=False)
+with st.form('Upload', clear_on_submit=True):
+    up_file = st.file_uploader("Upload a Video", ['mp4','mov', 'avi'])
+    uploaded = st.form_submit_button("Upload")
 
-    try:
-        warn.empty()
-        tfile.write(up_file.read())
-
-        vf = cv2.VideoCapture(tfile.name)
-
-        # ---------------------  Write the processed video frame. --------------------
-        fps = int(vf.get(cv2.CAP_PROP_FPS))
-        width = int(vf.get(cv2.CAP_PROP_FRAME_WIDTH))
-        height = int(vf.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        frame_size = (width, height)
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        video_output = cv2.VideoWriter(output_video_file, fourcc, fps, frame_size)
-        # -----------------------------------------------------------------------------
-
-        
-        txt = st.sidebar.markdown(ip_vid_str, unsafe_allow_html=True)   
-        ip_video = st.sidebar.video(tfile.name) 
-
-        while vf.isOpened():
-            ret, frame = vf.read()
-            if not ret:
-                break
-
-            # convert frame from BGR to RGB before processing it.
-            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            out_frame, _ = upload_process_frame.process(frame, pose)
-            stframe.image(out_frame)
-            video_output.write(out_frame[...,::-1])
-
-        
-        vf.release()
-        video_output.release()
-        stframe.empty()
-        ip_video.empty()
-        txt.empty()
-        tfile.close()
-    
-    except AttributeError:
-        warn.markdown(warning_str, unsafe_allow_html=True)   
+warning_str = '<p style="font-family:Helvetica; font-weight: bold; color: Red; font-size: 17px;">Please Upload a Video first!!!</p>'
 
+warn = st.empty()
 
 
-if os.path.exists(output_video_file):
-    with open(output_video_file, 'rb') as op_vid:
-        download = download_button.download_button('Download Video', data = op_vid, file_name='output_recorded.mp4')
-    
-    if download:
-        st.session_state['download'] = True
+def remove_job_files(job):
+    if job is None:
+        return
+    for path in (job['params'].get('source_path'), job['params'].get('sidecar_path'),
+                 job['params'].get('video_path'), job['params'].get('rendered_path')):
+        scratch.remove(path)
+    for path in glob.glob(clip_prefix(job) + '*'):
+        scratch.remove(path)
 
 
+def clip_prefix(job):
+    # Clips sit next to the job's other outputs: <token>_rep<n>.<ext>
+    return os.path.splitext(job['params']['rendered_path'])[0].replace('_annotated', '_rep')
 
-if os.path.exists(output_video_file) and st.session_state['download']:
-    os.remove(output_video_file)
-    st.session_state['download'] = False
-    download_button.empty()
 
+if up_file and uploaded:
 
-    
-    
+    source_path = None
 
-    
+    try:
+        warn.empty()
+        # Copied in chunks; the media backend then decodes straight from disk.
+        source_path = scratch.ingest(scratch_user, up_file, suffix=os.path.splitext(up_file.name)[1],
+                                     expected_size=up_file.size)
+
+        # Drop the files of the previous upload.
+        previous_job = job_queue.get(st.session_state.get('upload_job') or '')
+        if previous_job is not None and previous_job['status'] in (DONE, FAILED, CANCELLED):
+            remove_job_files(previous_job)
+
+        token = uuid.uuid4().hex[:12]
+        params = {
+            'source_path': source_path,
+            'source_name': up_file.name,
+            'thresholds': thresholds,
+            'rendered_path': scratch.path(scratch_user, f'{token}_annotated.mp4')
+        }
+        if output_mode == 'Landmark Sidecar':
+            params['sidecar_path'] = scratch.path(scratch_user, f'{token}.npz')
+            # Keep the source around so the overlay can be rendered on request.
+            params['keep_source'] = True
+        else:
+            params['video_path'] = scratch.path(scratch_user, f'{token}.mp4')
+
+        job_id = job_queue.submit(scratch_user, 'analyze_video', params)
+        job_runner.watch(job_id)
+        source_path = None
+
+        st.session_state['upload_job'] = job_id
+        st.query_params['job'] = job_id
 
+    except AttributeError:
+        warn.markdown(warning_str, unsafe_allow_html=True)
+
+    except QuotaExceededError as e:
+        warn.error(str(e))
+
+    finally:
+        scratch.remove(source_path)
+
+
+
+def show_rep_metrics(reps):
+    st.subheader('Rep Metrics')
+    st.dataframe([
+        {
+            'Rep': rep['rep'],
+            'Result': rep['outcome'],
+            'Descent (s)': round(rep['descent_time'], 2),
+            'Ascent (s)': round(rep['ascent_time'], 2),
+            'Time Under Tension (s)': round(rep['time_under_tension'], 2),
+            'Min Knee Angle': round(rep['min_knee_angle'], 1),
+            'Hip Range': f"{rep['hip_min']:.0f}-{rep['hip_max']:.0f}",
+            'Ankle Range': f"{rep['ankle_min']:.0f}-{rep['ankle_max']:.0f}",
+            'Feedback': ', '.join(flag_names(rep['flags'], FEEDBACK_ID_MAP))
+        }
+        for rep in reps
+    ])
+
+
+def show_highlights(job, result):
+    """Jump to individual reps by cutting short clips out of the video without re-encoding."""
+    highlights = result.get('highlights')
+    clip_source = result.get('source_path') or result.get('video')
+    if not highlights or not highlights['reps'] or not clip_source or not os.path.exists(clip_source):
+        return
+
+    st.subheader('Highlights')
+    only_incorrect = st.checkbox('Only incorrect reps', value=any(rep['outcome'] == 'incorrect' for rep in highlights['reps']))
+    reps = [rep for rep in highlights['reps'] if rep['outcome'] == 'incorrect' or not only_incorrect]
+    if not reps:
+        st.caption('No reps to show.')
+        return
+
+    rep = st.selectbox(
+        'Rep', reps,
+        format_func=lambda rep: f"Rep {rep['rep']} · {rep['outcome']} · {rep['start_time']:.1f}s"
+                                + (f" · {', '.join(rep['feedback'])}" if rep['feedback'] else '')
+    )
+
+    events = [event for event in highlights['feedback'] if event['rep'] == rep['rep']]
+    if events:
+        st.caption(' | '.join(f"{event['label']} at {event['start_time']:.1f}s" for event in events))
+
+    clip_path = f"{clip_prefix(job)}{rep['rep']}{os.path.splitext(clip_source)[1]}"
+    if not os.path.exists(clip_path):
+        try:
+            export_clip(clip_source, rep['start_time'], rep['end_time'], clip_path)
+        except (av.AVError, ValueError) as e:
+            st.warning(f'Could not cut a clip for this rep: {e}')
+            return
+
+    with open(clip_path, 'rb') as clip_file:
+        clip_data = clip_file.read()
+    st.video(clip_data)
+    st.download_button('Download Clip', data=clip_data, file_name=f"rep_{rep['rep']}{os.path.splitext(clip_path)[1]}")
+
+
+# A refresh loses session state, so the job id is also kept in the URL.
+job_id = st.query_params.get('job') or st.session_state.get('upload_job')
+job = job_queue.get(job_id) if job_id else None
+
+if job is not None:
+    st.session_state['upload_job'] = job_id
+
+    st.sidebar.markdown('**Input Video**')
+    st.sidebar.caption(job['params'].get('source_name', ''))
+
+    if job['status'] in (QUEUED, RUNNING):
+
+        headroom = get_admission_controller().headroom()
+        st.sidebar.caption(f"Live sessions: {headroom['live_sessions']} · "
+                           f"batch jobs: {headroom['batch_active']}/{headroom['batch_limit']}")
+
+        if job['status'] == QUEUED:
+            st.info('Waiting for a free analysis worker...')
+        elif not job['frames_done']:
+            st.info('Waiting for CPU; live coaching sessions have priority...')
+        else:
+            text = f"Processed {job['frames_done']}/{job['total_frames']} frames"
+            if job['frames_done'] and job['started']:
+                elapsed = time.time() - job['started']
+                eta = elapsed * (job['total_frames'] - job['frames_done']) / job['frames_done']
+                text += f' · ETA {max(eta, 0):.0f}s'
+            st.progress(min(job['progress'], 1.0), text=text)
+
+            preview = job_runner.preview_images.get(job_id)
+            if preview is not None:
+                st.image(preview)
+
+        if st.button('Cancel Analysis'):
+            job_queue.cancel(job_id)
+
+        time.sleep(1.0)
+        st.rerun()
+
+    elif job['status'] == DONE:
+        result = job['result']
+        st.success(f"Analysis complete: {result['correct_reps']} correct, {result['incorrect_reps']} incorrect reps.")
+
+        if result['reps']:
+            show_rep_metrics(result['reps'])
+            show_highlights(job, result)
+
+        sidecar_file = result.get('sidecar')
+        output_video_file = result.get('video') or job['params']['rendered_path']
+
+        if sidecar_file and os.path.exists(sidecar_file):
+            with open(sidecar_file, 'rb') as sc_file:
+                st.download_button('Download Landmark Sidecar', data = sc_file, file_name='output_recorded.npz')
+
+            if result.get('source_path') and not os.path.exists(output_video_file) and \
+                    st.button('Render Annotated Video'):
+                with st.spinner('Rendering overlay...'):
+                    render_overlay(result['source_path'], sidecar_file, output_video_file)
+
+        download_button = st.empty()
+
+        if os.path.exists(output_video_file):
+            with open(output_video_file, 'rb') as op_vid:
+                download = download_button.download_button('Download Video', data = op_vid, file_name='output_recorded.mp4')
+
+            if download:
+                st.session_state['download'] = True
+
+        if os.path.exists(output_video_file) and st.session_state['download']:
+            os.remove(output_video_file)
+            st.session_state['download'] = False
+            download_button.empty()
+
+    elif job['status'] == FAILED:
+        st.error(f"Analysis failed: {job['error']}")
 
+    elif job['status'] == CANCELLED:
+        st.warning('Analysis cancelled.')
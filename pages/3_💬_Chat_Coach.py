@@ -1,5 +1,5 @@
 import streamlit as st
-from response_handler import FitnessAIAssistant
+from response_handler import FitnessAIAssistant, append_chat_message
 
 # Authentication check
 if 'authenticated' not in st.session_state or not st.session_state.authenticated:
@@ -69,7 +69,7 @@ def main():
     if user_input:
         # Add user message to chat
         st.chat_message("user").write(user_input)
-        st.session_state.chat_history.append({"role": "user", "content": user_input})
+        append_chat_message(st.session_state.chat_history, "user", user_input)
 
         # Get AI response
         response = st.session_state.handler.process_query(
@@ -80,7 +80,7 @@ def main():
         # Display AI response
         with st.chat_message("assistant"):
             st.write(response)
-        st.session_state.chat_history.append({"role": "assistant", "content": response})
+        append_chat_message(st.session_state.chat_history, "assistant", response)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
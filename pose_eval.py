@@ -0,0 +1,328 @@
+import os
+import sys
+import json
+import time
+import argparse
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+import numpy as np
+import pandas as pd
+
+from utils import get_mediapipe_pose
+from process_frame import ProcessFrame
+from thresholds import get_thresholds, load_thresholds
+from rep_metrics import LOWER_HIPS_FLAG
+from media_backend import open_reader, MEDIA_BACKEND
+from batch_analyze import collect_videos, VIDEO_EXTENSIONS
+
+
+# Settings passed to get_mediapipe_pose; 'resolution' and 'frame_skip' are applied by the harness.
+POSE_KEYS = ('model_complexity', 'min_detection_confidence', 'min_tracking_confidence', 'smooth_landmarks')
+SETTING_KEYS = POSE_KEYS + ('resolution', 'frame_skip')
+
+RESULT_COLUMNS = list(SETTING_KEYS) + ['clips', 'reps', 'rep_accuracy', 'count_error',
+                                       'feedback_precision', 'feedback_recall',
+                                       'ms_per_frame', 'p95_ms', 'pareto']
+
+
+def settings_grid(**choices):
+    """Every combination of the given setting choices, e.g. settings_grid(model_complexity=[0, 1], ...)."""
+    keys = [key for key in SETTING_KEYS if key in choices]
+    return [dict(zip(keys, values)) for values in itertools.product(*(choices[key] for key in keys))]
+
+
+def labels_path(video_path):
+    return os.path.splitext(video_path)[0] + '.labels.json'
+
+
+def load_trace(path):
+    """Landmark trace of a synthetic clip or an analysis sidecar (.npz), with its metadata."""
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        return {
+            'landmarks': data['landmarks'],
+            'present': data['present'],
+            'times': data['times'],
+            'frame_size': tuple(meta['frame_size']),
+            'meta': meta
+        }
+
+
+def load_labels(clip_path, feedback_id_map, trace=None):
+    """
+    Labelled reps of a clip, in order: dicts with 'outcome', 'flags' and,
+    when known, 'start_time' / 'end_time'.
+
+    Synthetic traces carry their labels. Recorded videos and their sidecars
+    need a <name>.labels.json next to them, {"reps": [{"outcome": "correct",
+    "feedback": ["KNEE FALLING OVER TOE"], "start_time": 3.2, "end_time": 5.0}, ...]};
+    feedback names are those shown on screen, times are optional.
+    """
+    if clip_path.endswith('.npz') and trace is None:
+        trace = load_trace(clip_path)
+
+    if trace is not None and trace['meta'].get('kind') == 'synthetic':
+        reps = trace['meta']['reps']
+    else:
+        with open(labels_path(clip_path)) as f:
+            reps = json.load(f)['reps']
+
+    name_bits = {name: 1 << idx for idx, (name, _, _) in feedback_id_map.items()}
+    name_bits['LOWER YOUR HIPS'] = LOWER_HIPS_FLAG
+
+    labels = []
+    for rep in reps:
+        # Reps too shallow to count, or seen from the front, must not be counted.
+        if rep.get('outcome') is None:
+            continue
+        flags = rep.get('flags')
+        if flags is None:
+            flags = 0
+            for name in rep.get('feedback', []):
+                flags |= name_bits[name]
+        labels.append({'outcome': rep['outcome'], 'flags': flags,
+                       'start_time': rep.get('start_time'), 'end_time': rep.get('end_time')})
+    return labels
+
+
+
+# ------------------------------------- WORKER PROCESS -------------------------------------
+
+_worker = {}
+
+
+def _init_worker(thresholds, backend):
+    # Workers run one clip at a time; keep OpenCV from competing for the cores.
+    cv2.setNumThreads(1)
+    _worker['thresholds'] = thresholds
+    _worker['backend'] = backend
+
+
+def evaluate_clip(clip_path, setting):
+    """
+    Run one clip with one setting and return its labels, scored reps and
+    per-frame latencies (pose + resize + squat logic; decoding excluded).
+
+    Landmark traces skip the pose model, so only 'frame_skip' affects them.
+    """
+    reps = []
+    process_frame = ProcessFrame(thresholds=_worker['thresholds'], on_rep=reps.append)
+    skip = setting['frame_skip']
+    latencies = []
+
+    if clip_path.endswith('.npz'):
+        trace = load_trace(clip_path)
+        labels = load_labels(clip_path, process_frame.FEEDBACK_ID_MAP, trace)
+        n_frames = len(trace['times'])
+        for idx in range(0, n_frames, skip):
+            started = time.perf_counter()
+            landmarks = trace['landmarks'][idx] if trace['present'][idx] else None
+            process_frame.process_landmarks(landmarks, trace['frame_size'], float(trace['times'][idx]))
+            latencies.append(time.perf_counter() - started)
+    else:
+        labels = load_labels(clip_path, process_frame.FEEDBACK_ID_MAP)
+        # A fresh model per clip, so tracking never carries over from the previous one.
+        pose = get_mediapipe_pose(**{key: setting[key] for key in POSE_KEYS})
+        reader = open_reader(clip_path, _worker['backend'])
+        resolution = setting['resolution']
+        n_frames = 0
+        try:
+            for idx, frame in enumerate(reader):
+                n_frames += 1
+                if idx % skip:
+                    continue
+                started = time.perf_counter()
+                frame_height, frame_width, _ = frame.shape
+                if resolution and frame_width > resolution:
+                    frame_height = round(frame_height * resolution / frame_width)
+                    frame_width = resolution
+                    frame = cv2.resize(frame, (frame_width, frame_height), interpolation=cv2.INTER_AREA)
+                keypoints = pose.process(frame)
+                process_frame.analyze(keypoints.pose_landmarks, frame_width, frame_height, idx / reader.fps)
+                latencies.append(time.perf_counter() - started)
+        finally:
+            reader.close()
+            pose.close()
+
+    return {
+        'clip': clip_path,
+        'labels': labels,
+        'predicted': [{'outcome': rep.outcome, 'flags': rep.flags, 'bottom_time': rep.bottom_time} for rep in reps],
+        'latencies': np.asarray(latencies, dtype=np.float32),
+        'frames': n_frames
+    }
+
+
+
+# ------------------------------------- SCORING -------------------------------------
+
+def match_reps(labels, predicted):
+    """
+    Pair labelled and scored reps: by time when the labels have it (the
+    scored rep's bottom falls inside the labelled rep), otherwise in order.
+    Returns (pairs, unmatched labels, unmatched predictions).
+    """
+    if labels and all(label['start_time'] is not None for label in labels):
+        pairs, used = [], set()
+        for label in labels:
+            for idx, rep in enumerate(predicted):
+                if idx not in used and label['start_time'] <= rep['bottom_time'] <= label['end_time']:
+                    pairs.append((label, rep))
+                    used.add(idx)
+                    break
+        matched = {id(label) for label, _ in pairs}
+        return (pairs, [label for label in labels if id(label) not in matched],
+                [rep for idx, rep in enumerate(predicted) if idx not in used])
+
+    n_pairs = min(len(labels), len(predicted))
+    return list(zip(labels, predicted)), labels[n_pairs:], predicted[n_pairs:]
+
+
+def score_clip(labels, predicted):
+    """Counts for one clip, summed across clips by summarize()."""
+    pairs, missed, extra = match_reps(labels, predicted)
+
+    tp = fp = fn = 0
+    for label, rep in pairs:
+        tp += bin(label['flags'] & rep['flags']).count('1')
+        fp += bin(rep['flags'] & ~label['flags']).count('1')
+        fn += bin(label['flags'] & ~rep['flags']).count('1')
+    fn += sum(bin(label['flags']).count('1') for label in missed)
+    fp += sum(bin(rep['flags']).count('1') for rep in extra)
+
+    def counts(reps):
+        return sum(rep['outcome'] == 'correct' for rep in reps), sum(rep['outcome'] == 'incorrect' for rep in reps)
+
+    (true_correct, true_incorrect), (pred_correct, pred_incorrect) = counts(labels), counts(predicted)
+    return {
+        'reps': len(labels),
+        'outcome_hits': sum(label['outcome'] == rep['outcome'] for label, rep in pairs),
+        'outcome_total': len(labels) + len(extra),
+        'count_error': abs(true_correct - pred_correct) + abs(true_incorrect - pred_incorrect),
+        'feedback_tp': tp, 'feedback_fp': fp, 'feedback_fn': fn
+    }
+
+
+def pareto_front(accuracy, latency):
+    """True for rows no other row beats on accuracy without being slower, or the other way round."""
+    front = []
+    for acc, lat in zip(accuracy, latency):
+        dominated = any((a >= acc and l <= lat) and (a > acc or l < lat) for a, l in zip(accuracy, latency))
+        front.append(not dominated)
+    return front
+
+
+def summarize(settings, results):
+    """One row per setting; `results` maps a setting's index to its evaluate_clip() results."""
+    rows = []
+    for idx, setting in enumerate(settings):
+        clip_results = results.get(idx, [])
+        scores = [score_clip(result['labels'], result['predicted']) for result in clip_results]
+        total = {key: sum(score[key] for score in scores) for key in scores[0]} if scores else {}
+
+        latencies = np.concatenate([result['latencies'] for result in clip_results]) if clip_results else np.empty(0)
+        frames = sum(result['frames'] for result in clip_results)
+
+        def ratio(num, den):
+            return round(num / den, 4) if den else float('nan')
+
+        rows.append(dict(
+            setting,
+            clips=len(clip_results),
+            reps=total.get('reps', 0),
+            rep_accuracy=ratio(total.get('outcome_hits', 0), total.get('outcome_total', 0)),
+            count_error=ratio(total.get('count_error', 0), len(clip_results)),
+            feedback_precision=ratio(total.get('feedback_tp', 0), total.get('feedback_tp', 0) + total.get('feedback_fp', 0)),
+            feedback_recall=ratio(total.get('feedback_tp', 0), total.get('feedback_tp', 0) + total.get('feedback_fn', 0)),
+            # Amortized over every source frame, so skipped frames count as free.
+            ms_per_frame=round(1000.0 * float(latencies.sum()) / frames, 2) if frames else float('nan'),
+            p95_ms=round(1000.0 * float(np.percentile(latencies, 95)), 2) if len(latencies) else float('nan')
+        ))
+
+    table = pd.DataFrame(rows, columns=RESULT_COLUMNS[:-1])
+    table['pareto'] = pareto_front(table['rep_accuracy'].fillna(0).tolist(), table['ms_per_frame'].fillna(np.inf).tolist())
+    return table.sort_values('ms_per_frame').reset_index(drop=True)
+
+
+
+# ------------------------------------- DRIVER -------------------------------------
+
+def run_eval(clips, settings, thresholds, workers=None, backend=None):
+    """
+    Evaluate every clip under every setting in parallel and return the summary table.
+
+    Latencies are measured while the other workers run; use workers=1 for
+    numbers comparable to a single live session on an idle machine.
+    """
+    tasks = [(idx, clip) for idx in range(len(settings)) for clip in clips]
+    workers = min(workers or os.cpu_count() or 1, len(tasks))
+    # MediaPipe isn't fork-safe, so workers start fresh interpreters.
+    context = multiprocessing.get_context('spawn')
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(thresholds, backend or MEDIA_BACKEND)) as pool:
+        futures = {pool.submit(evaluate_clip, clip, settings[idx]): (idx, clip) for idx, clip in tasks}
+        for done, future in enumerate(as_completed(futures), 1):
+            idx, clip = futures[future]
+            try:
+                results.setdefault(idx, []).append(future.result())
+                status = 'ok'
+            except Exception as e:
+                status = f'failed: {e}'
+            print(f'[{done}/{len(tasks)}] {status}: {clip} {settings[idx]}', flush=True)
+
+    return summarize(settings, results)
+
+
+def _choices(value, cast):
+    return [cast(item) for item in value.split(',')]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rep-count and feedback accuracy vs. latency over pose settings.')
+    parser.add_argument('clips', nargs='+', help='Labelled videos or sidecars (with <name>.labels.json), synthetic '
+                                                 '.npz traces, directories or glob patterns (quote them).')
+    parser.add_argument('--mode', default='beginner', choices=['beginner', 'pro'])
+    parser.add_argument('--thresholds', help='JSON thresholds file; overrides --mode.')
+    parser.add_argument('--complexity', default='0,1,2', help='model_complexity values, comma separated.')
+    parser.add_argument('--detection', default='0.5', help='min_detection_confidence values.')
+    parser.add_argument('--tracking', default='0.5', help='min_tracking_confidence values.')
+    parser.add_argument('--smooth', default='1', help='smooth_landmarks values (1/0).')
+    parser.add_argument('--resolution', default='0', help='Inference widths; 0 keeps the source size.')
+    parser.add_argument('--skip', default='1', help='Analyze every n-th frame.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser.add_argument('--backend', default=None, choices=['opencv', 'pyav'], help='Media backend.')
+    parser.add_argument('--out', default='pose_eval.csv', help='CSV file for the results table.')
+    args = parser.parse_args()
+
+    thresholds = load_thresholds(args.thresholds) if args.thresholds else get_thresholds(args.mode)
+
+    clips = [clip for clip in collect_videos(args.clips, VIDEO_EXTENSIONS + ('.npz',))
+             if clip.endswith('.npz') or os.path.exists(labels_path(clip))]
+    if not clips:
+        parser.error('No labelled clips matched.')
+
+    settings = settings_grid(
+        model_complexity=_choices(args.complexity, int),
+        min_detection_confidence=_choices(args.detection, float),
+        min_tracking_confidence=_choices(args.tracking, float),
+        smooth_landmarks=_choices(args.smooth, lambda value: bool(int(value))),
+        resolution=_choices(args.resolution, int),
+        frame_skip=_choices(args.skip, int)
+    )
+    # Synthetic traces only depend on frame skipping; don't repeat them for every model setting.
+    if all(clip.endswith('.npz') for clip in clips):
+        settings = settings_grid(**{key: [settings[0][key]] for key in POSE_KEYS + ('resolution',)},
+                                 frame_skip=_choices(args.skip, int))
+
+    table = run_eval(clips, settings, thresholds, args.workers, args.backend)
+    table.to_csv(args.out, index=False)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(table.to_string(index=False))
+    print(f'Results written to {args.out}')
+    sys.exit(0 if table['clips'].sum() else 1)
@@ -0,0 +1,108 @@
+import time
+import threading
+import cv2
+
+
+def encode_preview(frame, max_width=480, quality=70):
+    """Downscale an RGB frame to at most `max_width` and JPEG-encode it."""
+    height, width = frame.shape[:2]
+    if width > max_width:
+        frame = cv2.resize(frame, (max_width, int(height * max_width / width)), interpolation=cv2.INTER_AREA)
+
+    ok, buf = cv2.imencode('.jpg', cv2.cvtColor(frame, cv2.COLOR_RGB2BGR), [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+
+class PreviewChannel:
+    """
+    Sends downscaled JPEG previews of processed frames to `sink` at a capped rate.
+
+    offer() only keeps a reference to the newest frame; encoding and delivery
+    happen on a background thread, so the processing loop never waits on the
+    browser. Frames offered while the previous preview is still in flight are
+    simply replaced.
+    """
+
+    def __init__(self, sink, max_fps=4.0, max_width=480, quality=70):
+        self.sink = sink
+        self.min_interval = 1.0 / max_fps
+        self.max_width = max_width
+        self.quality = quality
+
+        self._frame = None
+        self._last_offer = 0.0
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self, wrap_thread=None):
+        """`wrap_thread` can attach framework context (e.g. Streamlit's script run context)."""
+        if wrap_thread is not None:
+            wrap_thread(self._thread)
+        self._thread.start()
+        return self
+
+    def offer(self, frame, now=None):
+        if now is None:
+            now = time.perf_counter()
+        if now - self._last_offer < self.min_interval:
+            return False
+
+        self._last_offer = now
+        self._frame = frame
+        self._wakeup.set()
+        return True
+
+    def _run(self):
+        while True:
+            if not self._closed:
+                self._wakeup.wait()
+            self._wakeup.clear()
+
+            frame, self._frame = self._frame, None
+            if frame is not None:
+                preview = encode_preview(frame, self.max_width, self.quality)
+                if preview is not None:
+                    self.sink(preview)
+
+            if self._closed and self._frame is None:
+                break
+
+    def close(self):
+        self._closed = True
+        self._wakeup.set()
+        self._thread.join(timeout=2.0)
+
+
+
+class ProgressReporter:
+    """Rate-limited 'frames done / total + ETA' updates for a progress callback."""
+
+    def __init__(self, update, total_frames, min_interval=0.5):
+        self.update = update
+        self.total_frames = max(int(total_frames), 0)
+        self.min_interval = min_interval
+        self.start_time = time.perf_counter()
+        self._last_update = 0.0
+
+    def step(self, frames_done, force=False):
+        now = time.perf_counter()
+        if not force and now - self._last_update < self.min_interval:
+            return
+
+        self._last_update = now
+        elapsed = now - self.start_time
+
+        if self.total_frames:
+            fraction = min(frames_done / self.total_frames, 1.0)
+            if frames_done:
+                eta = elapsed * (self.total_frames - frames_done) / frames_done
+                text = f'Processed {frames_done}/{self.total_frames} frames · ETA {eta:.0f}s'
+            else:
+                text = f'Processed 0/{self.total_frames} frames'
+        else:
+            # Some containers don't report a frame count.
+            fraction = 0.0
+            text = f'Processed {frames_done} frames'
+
+        self.update(fraction, text)
@@ -1,12 +1,41 @@
 import time
 import cv2
 import numpy as np
-from utils import find_angle, get_landmark_features, draw_text, draw_dotted_line
+from typing import NamedTuple, Optional
+from utils import find_angle, get_landmark_features, get_landmark_array, draw_text, draw_dotted_line
 from ai_coach import AICoach
+from session_state import SessionState
+from rep_metrics import RepMetricsTracker
+from landmarks import array_to_result, visibility_array, side_confidence, SIDE_CONFIDENCE_MARGIN
+
+
+# Feedback index --> (message, y position, background colour). Indices are
+# SessionState.display_text slots and RepRecord.flags bits.
+FEEDBACK_ID_MAP = {
+                    0: ('BEND BACKWARDS', 215, (0, 153, 255)),
+                    1: ('BEND FORWARD', 215, (0, 153, 255)),
+                    2: ('KNEE FALLING OVER TOE', 170, (255, 80, 80)),
+                    3: ('SQUAT TOO DEEP', 125, (255, 80, 80))
+                  }
+
+
+class FrameAnalysis(NamedTuple):
+    """Everything ProcessFrame.render() needs to draw one analyzed frame."""
+    view: Optional[str]         # 'side', 'front' (camera not aligned) or None (no pose)
+    play_sound: Optional[str]
+    squat_count: int
+    improper_squat: int
+    frame_size: tuple           # (width, height) the pixel coordinates refer to
+    points: dict = None         # Landmark name --> (x, y) pixel coordinates.
+    angles: tuple = None        # Hip, knee and ankle vertical angles ('side').
+    multiplier: int = 1         # -1 when the left side faces the camera.
+    offset_angle: int = 0       # Shoulder-nose offset angle ('front').
+    feedback: tuple = ()        # FEEDBACK_ID_MAP indices shown on this frame.
+    lower_hips: bool = False
 
 
 class ProcessFrame:
-    def __init__(self, thresholds, flip_frame=False):
+    def __init__(self, thresholds, flip_frame=False, on_rep=None):
         
         # Set if frame should be flipped or not.
         self.flip_frame = flip_frame
@@ -66,38 +95,27 @@ class ProcessFrame:
 
         
         # For tracking counters and sharing states in and out of callbacks.
-        self.state_tracker = {
-            'state_seq': [],
+        self.state_tracker = SessionState()
 
-            'start_inactive_time': time.perf_counter(),
-            'start_inactive_time_front': time.perf_counter(),
-            'INACTIVE_TIME': 0.0,
-            'INACTIVE_TIME_FRONT': 0.0,
-
-            # 0 --> Bend Backwards, 1 --> Bend Forward, 2 --> Keep shin straight, 3 --> Deep squat
-            'DISPLAY_TEXT' : np.full((4,), False),
-            'COUNT_FRAMES' : np.zeros((4,), dtype=np.int64),
+        # Analysis of the last processed frame, to redraw on frames that are skipped.
+        self.last_analysis = None
+        
+        self.FEEDBACK_ID_MAP = FEEDBACK_ID_MAP
 
-            'LOWER_HIPS': False,
+        self.coach = AICoach()
 
-            'INCORRECT_POSTURE': False,
+        # Per-rep metrics, emitted to `on_rep` as each rep is scored.
+        self.rep_metrics = RepMetricsTracker()
+        self.on_rep = on_rep
+        self.last_rep = None
+        self.frame_idx = -1
 
-            'prev_state': None,
-            'curr_state':None,
+        # (hip, knee, ankle) vertical angles of the last frame, None if it wasn't analyzed.
+        self.last_angles = None
 
-            'SQUAT_COUNT': 0,
-            'IMPROPER_SQUAT':0
-            
-        }
-        
-        self.FEEDBACK_ID_MAP = {
-                                0: ('BEND BACKWARDS', 215, (0, 153, 255)),
-                                1: ('BEND FORWARD', 215, (0, 153, 255)),
-                                2: ('KNEE FALLING OVER TOE', 170, (255, 80, 80)),
-                                3: ('SQUAT TOO DEEP', 125, (255, 80, 80))
-                               }
-
-        self.coach = AICoach()
+        # Maps frame timestamps onto the perf_counter timeline of the inactivity timers.
+        self._clock_offset = None
+        self._last_timestamp = None
         
 
 
@@ -120,19 +138,19 @@ class ProcessFrame:
     def _update_state_sequence(self, state):
 
         if state == 's2':
-            if (('s3' not in self.state_tracker['state_seq']) and (self.state_tracker['state_seq'].count('s2'))==0) or \
-                    (('s3' in self.state_tracker['state_seq']) and (self.state_tracker['state_seq'].count('s2')==1)):
-                        self.state_tracker['state_seq'].append(state)
+            if ((not self.state_tracker.seq_contains('s3')) and (self.state_tracker.seq_count('s2'))==0) or \
+                    (self.state_tracker.seq_contains('s3') and (self.state_tracker.seq_count('s2')==1)):
+                        self.state_tracker.seq_append(state)
             
 
         elif state == 's3':
-            if (state not in self.state_tracker['state_seq']) and 's2' in self.state_tracker['state_seq']: 
-                self.state_tracker['state_seq'].append(state)
+            if (not self.state_tracker.seq_contains(state)) and self.state_tracker.seq_contains('s2'): 
+                self.state_tracker.seq_append(state)
 
             
 
 
-    def _show_feedback(self, frame, c_frame, dict_maps, lower_hips_disp):
+    def _show_feedback(self, frame, feedback, dict_maps, lower_hips_disp):
 
 
         if lower_hips_disp:
@@ -145,7 +163,7 @@ class ProcessFrame:
                     text_color_bg=(255, 255, 0)
                 )  
 
-        for idx in np.where(c_frame)[0]:
+        for idx in feedback:
             draw_text(
                     frame, 
                     dict_maps[idx][0], 
@@ -159,396 +177,478 @@ class ProcessFrame:
 
 
 
-    def process(self, frame: np.array, pose):
-        play_sound = None
-       
+    def _emit_rep(self, rep):
+        self.last_rep = rep
+        self.coach.record_rep(rep)
+        if self.on_rep is not None:
+            self.on_rep(rep)
+
 
+
+    def process(self, frame: np.array, pose, timestamp=None):
         frame_height, frame_width, _ = frame.shape
 
         # Process the image.
         keypoints = pose.process(frame)
 
-        if keypoints.pose_landmarks:
-            ps_lm = keypoints.pose_landmarks
+        analysis = self.last_analysis = self.analyze(keypoints.pose_landmarks, frame_width, frame_height, timestamp)
+        frame = self.render(frame, analysis)
+
+        return frame, analysis.play_sound
+
+
+
+    def process_landmarks(self, landmarks, frame_size, timestamp=None):
+        """
+        Run only the squat logic on landmarks computed elsewhere (e.g. on the
+        client): a (33, 4) array of normalized x, y, z, visibility, or None when
+        no pose was found. Nothing is drawn.
+        """
+        visibility = None if landmarks is None else landmarks[:, 3]
+        return self.analyze(array_to_result(landmarks).pose_landmarks, frame_size[0], frame_size[1], timestamp,
+                            visibility=visibility)
+
+
+
+    def clock(self, timestamp):
+        """
+        Inactivity timer time for a frame at `timestamp`. The timers live on the
+        perf_counter timeline (SessionState snapshots rely on it), but advance
+        with the frame timestamps, so an analysis paused for load or running
+        faster than real time times inactivity in video time.
+        """
+        if self._clock_offset is None or timestamp < self._last_timestamp:
+            self._clock_offset = time.perf_counter() - timestamp
+        self._last_timestamp = timestamp
+        return timestamp + self._clock_offset
+
+
+
+    def analyze(self, pose_landmarks, frame_width, frame_height, timestamp=None, visibility=None) -> FrameAnalysis:
+        """
+        Update counters, feedback and rep metrics for one frame's landmarks, without drawing.
+        `visibility` is the (33,) per-landmark visibility when the caller already has it as an array.
+        """
+        play_sound = None
+        self.frame_idx += 1
+        self.last_angles = None
+
+        # Video time for uploaded files, wall time for live streams.
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        now = self.clock(timestamp)
+        if self.frame_idx == 0:
+            # Time spent before the first frame (model loading, decoder start-up) isn't inactivity.
+            self.state_tracker.start_inactive_time = self.state_tracker.start_inactive_time_front = now
+
+        frame_size = (frame_width, frame_height)
+
+        if pose_landmarks:
+            ps_lm = pose_landmarks
+
+            # ------------------- Landmark quality gate --------------
+
+            if visibility is None:
+                visibility = visibility_array(ps_lm)
+            confidence = side_confidence(visibility)
+
+            # Neither side has all of its joints in view: keep the current state
+            # and skip the angle work instead of counting on guessed landmarks.
+            if confidence.max() < self.thresholds.get('VISIBILITY_THRESH', 0.0):
+                return FrameAnalysis(
+                    view=None,
+                    play_sound=None,
+                    squat_count=self.state_tracker.squat_count,
+                    improper_squat=self.state_tracker.improper_squat,
+                    frame_size=frame_size
+                )
+
+            # --------------------------------------------------------
 
             nose_coord = get_landmark_features(ps_lm.landmark, self.dict_features, 'nose', frame_width, frame_height)
-            left_shldr_coord, left_elbow_coord, left_wrist_coord, left_hip_coord, left_knee_coord, left_ankle_coord, left_foot_coord = \
-                                get_landmark_features(ps_lm.landmark, self.dict_features, 'left', frame_width, frame_height)
-            right_shldr_coord, right_elbow_coord, right_wrist_coord, right_hip_coord, right_knee_coord, right_ankle_coord, right_foot_coord = \
-                                get_landmark_features(ps_lm.landmark, self.dict_features, 'right', frame_width, frame_height)
+            left_shldr_coord = get_landmark_array(ps_lm.landmark, self.left_features['shoulder'], frame_width, frame_height)
+            right_shldr_coord = get_landmark_array(ps_lm.landmark, self.right_features['shoulder'], frame_width, frame_height)
 
             offset_angle = find_angle(left_shldr_coord, right_shldr_coord, nose_coord)
 
             if offset_angle > self.thresholds['OFFSET_THRESH']:
-                
+
                 display_inactivity = False
 
-                end_time = time.perf_counter()
-                self.state_tracker['INACTIVE_TIME_FRONT'] += end_time - self.state_tracker['start_inactive_time_front']
-                self.state_tracker['start_inactive_time_front'] = end_time
+                end_time = now
+                self.state_tracker.inactive_time_front += end_time - self.state_tracker.start_inactive_time_front
+                self.state_tracker.start_inactive_time_front = end_time
 
-                if self.state_tracker['INACTIVE_TIME_FRONT'] >= self.thresholds['INACTIVE_THRESH']:
-                    self.state_tracker['SQUAT_COUNT'] = 0
-                    self.state_tracker['IMPROPER_SQUAT'] = 0
+                if self.state_tracker.inactive_time_front >= self.thresholds['INACTIVE_THRESH']:
+                    self.state_tracker.reset_counters()
                     display_inactivity = True
 
-                cv2.circle(frame, nose_coord, 7, self.COLORS['white'], -1)
-                cv2.circle(frame, left_shldr_coord, 7, self.COLORS['yellow'], -1)
-                cv2.circle(frame, right_shldr_coord, 7, self.COLORS['magenta'], -1)
-
-                if self.flip_frame:
-                    frame = cv2.flip(frame, 1)
-
                 if display_inactivity:
-                    # cv2.putText(frame, 'Resetting SQUAT_COUNT due to inactivity!!!', (10, frame_height - 90), 
-                    #             self.font, 0.5, self.COLORS['blue'], 2, lineType=self.linetype)
                     play_sound = 'reset_counters'
-                    self.state_tracker['INACTIVE_TIME_FRONT'] = 0.0
-                    self.state_tracker['start_inactive_time_front'] = time.perf_counter()
+                    self.state_tracker.inactive_time_front = 0.0
+                    self.state_tracker.start_inactive_time_front = now
 
-                draw_text(
-                    frame, 
-                    "CORRECT: " + str(self.state_tracker['SQUAT_COUNT']), 
-                    pos=(int(frame_width*0.68), 30),
-                    text_color=(255, 255, 230),
-                    font_scale=0.7,
-                    text_color_bg=(18, 185, 0)
-                )  
-                
-
-                draw_text(
-                    frame, 
-                    "INCORRECT: " + str(self.state_tracker['IMPROPER_SQUAT']), 
-                    pos=(int(frame_width*0.68), 80),
-                    text_color=(255, 255, 230),
-                    font_scale=0.7,
-                    text_color_bg=(221, 0, 0),
-                    
-                )  
-                
-                
-                draw_text(
-                    frame, 
-                    'CAMERA NOT ALIGNED PROPERLY!!!', 
-                    pos=(30, frame_height-60),
-                    text_color=(255, 255, 230),
-                    font_scale=0.65,
-                    text_color_bg=(255, 153, 0),
-                ) 
-                
-                
-                draw_text(
-                    frame, 
-                    'OFFSET ANGLE: '+str(offset_angle), 
-                    pos=(30, frame_height-30),
-                    text_color=(255, 255, 230),
-                    font_scale=0.65,
-                    text_color_bg=(255, 153, 0),
-                ) 
+                self.rep_metrics.reset()
 
                 # Reset inactive times for side view.
-                self.state_tracker['start_inactive_time'] = time.perf_counter()
-                self.state_tracker['INACTIVE_TIME'] = 0.0
-                self.state_tracker['prev_state'] =  None
-                self.state_tracker['curr_state'] = None
-            
+                self.state_tracker.start_inactive_time = now
+                self.state_tracker.inactive_time = 0.0
+                self.state_tracker.prev_state =  None
+                self.state_tracker.curr_state = None
+
+                return FrameAnalysis(
+                    view='front',
+                    play_sound=play_sound,
+                    squat_count=self.state_tracker.squat_count,
+                    improper_squat=self.state_tracker.improper_squat,
+                    frame_size=frame_size,
+                    points={'nose': nose_coord, 'left_shoulder': left_shldr_coord, 'right_shoulder': right_shldr_coord},
+                    offset_angle=offset_angle
+                )
+
             # Camera is aligned properly.
+            self.state_tracker.inactive_time_front = 0.0
+            self.state_tracker.start_inactive_time_front = now
+
+
+            # Use the side the model is more confident about; when both are about
+            # as visible, the side with the longer foot-to-shoulder span faces the camera.
+            left_conf, right_conf = confidence
+            if abs(left_conf - right_conf) > SIDE_CONFIDENCE_MARGIN:
+                use_left = left_conf > right_conf
             else:
+                left_foot_coord = get_landmark_array(ps_lm.landmark, self.left_features['foot'], frame_width, frame_height)
+                right_foot_coord = get_landmark_array(ps_lm.landmark, self.right_features['foot'], frame_width, frame_height)
+                dist_l_sh_hip = abs(left_foot_coord[1] - left_shldr_coord[1])
+                dist_r_sh_hip = abs(right_foot_coord[1] - right_shldr_coord[1])
+                use_left = dist_l_sh_hip > dist_r_sh_hip
 
-                self.state_tracker['INACTIVE_TIME_FRONT'] = 0.0
-                self.state_tracker['start_inactive_time_front'] = time.perf_counter()
+            side = 'left' if use_left else 'right'
+            multiplier = -1 if use_left else 1
+            shldr_coord, elbow_coord, wrist_coord, hip_coord, knee_coord, ankle_coord, foot_coord = \
+                                get_landmark_features(ps_lm.landmark, self.dict_features, side, frame_width, frame_height)
 
 
-                dist_l_sh_hip = abs(left_foot_coord[1]- left_shldr_coord[1])
-                dist_r_sh_hip = abs(right_foot_coord[1] - right_shldr_coord)[1]
+            # ------------------- Verical Angle calculation --------------
 
-                shldr_coord = None
-                elbow_coord = None
-                wrist_coord = None
-                hip_coord = None
-                knee_coord = None
-                ankle_coord = None
-                foot_coord = None
+            hip_vertical_angle = find_angle(shldr_coord, np.array([hip_coord[0], 0]), hip_coord)
+            knee_vertical_angle = find_angle(hip_coord, np.array([knee_coord[0], 0]), knee_coord)
+            ankle_vertical_angle = find_angle(knee_coord, np.array([ankle_coord[0], 0]), ankle_coord)
 
-                if dist_l_sh_hip > dist_r_sh_hip:
-                    shldr_coord = left_shldr_coord
-                    elbow_coord = left_elbow_coord
-                    wrist_coord = left_wrist_coord
-                    hip_coord = left_hip_coord
-                    knee_coord = left_knee_coord
-                    ankle_coord = left_ankle_coord
-                    foot_coord = left_foot_coord
+            self.last_angles = (hip_vertical_angle, knee_vertical_angle, ankle_vertical_angle)
 
-                    multiplier = -1
-                                     
-                
-                else:
-                    shldr_coord = right_shldr_coord
-                    elbow_coord = right_elbow_coord
-                    wrist_coord = right_wrist_coord
-                    hip_coord = right_hip_coord
-                    knee_coord = right_knee_coord
-                    ankle_coord = right_ankle_coord
-                    foot_coord = right_foot_coord
+            # ------------------------------------------------------------
 
-                    multiplier = 1
-                    
 
-                # ------------------- Verical Angle calculation --------------
-                
-                hip_vertical_angle = find_angle(shldr_coord, np.array([hip_coord[0], 0]), hip_coord)
-                cv2.ellipse(frame, hip_coord, (30, 30), 
-                            angle = 0, startAngle = -90, endAngle = -90+multiplier*hip_vertical_angle, 
-                            color = self.COLORS['white'], thickness = 3, lineType = self.linetype)
+            current_state = self._get_state(int(knee_vertical_angle))
+            self.state_tracker.curr_state = current_state
+            self._update_state_sequence(current_state)
 
-                draw_dotted_line(frame, hip_coord, start=hip_coord[1]-80, end=hip_coord[1]+20, line_color=self.COLORS['blue'])
 
 
+            # -------------------------------------- COMPUTE COUNTERS --------------------------------------
 
+            if current_state == 's1':
 
-                knee_vertical_angle = find_angle(hip_coord, np.array([knee_coord[0], 0]), knee_coord)
-                cv2.ellipse(frame, knee_coord, (20, 20), 
-                            angle = 0, startAngle = -90, endAngle = -90-multiplier*knee_vertical_angle, 
-                            color = self.COLORS['white'], thickness = 3,  lineType = self.linetype)
+                if self.state_tracker.seq_len == 3 and not self.state_tracker.incorrect_posture:
+                    self.state_tracker.squat_count+=1
+                    play_sound = str(self.state_tracker.squat_count)
 
-                draw_dotted_line(frame, knee_coord, start=knee_coord[1]-50, end=knee_coord[1]+20, line_color=self.COLORS['blue'])
+                elif self.state_tracker.seq_contains('s2') and self.state_tracker.seq_len==1:
+                    self.state_tracker.improper_squat+=1
+                    play_sound = 'incorrect'
 
+                elif self.state_tracker.incorrect_posture:
+                    self.state_tracker.improper_squat+=1
+                    play_sound = 'incorrect'
 
 
-                ankle_vertical_angle = find_angle(knee_coord, np.array([ankle_coord[0], 0]), ankle_coord)
-                cv2.ellipse(frame, ankle_coord, (30, 30),
-                            angle = 0, startAngle = -90, endAngle = -90 + multiplier*ankle_vertical_angle,
-                            color = self.COLORS['white'], thickness = 3,  lineType=self.linetype)
+                self.state_tracker.seq_clear()
+                self.state_tracker.incorrect_posture = False
+
+
+            # ----------------------------------------------------------------------------------------------------
 
-                draw_dotted_line(frame, ankle_coord, start=ankle_coord[1]-50, end=ankle_coord[1]+20, line_color=self.COLORS['blue'])
 
-                # ------------------------------------------------------------
-        
-                
-                # Join landmarks.
-                cv2.line(frame, shldr_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
-                cv2.line(frame, wrist_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
-                cv2.line(frame, shldr_coord, hip_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
-                cv2.line(frame, knee_coord, hip_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
-                cv2.line(frame, ankle_coord, knee_coord,self.COLORS['light_blue'], 4,  lineType=self.linetype)
-                cv2.line(frame, ankle_coord, foot_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
-                
-                # Plot landmark points
-                cv2.circle(frame, shldr_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, elbow_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, wrist_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, hip_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, knee_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, ankle_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
-                cv2.circle(frame, foot_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
 
-                
 
-                current_state = self._get_state(int(knee_vertical_angle))
-                self.state_tracker['curr_state'] = current_state
-                self._update_state_sequence(current_state)
+            # -------------------------------------- PERFORM FEEDBACK ACTIONS --------------------------------------
 
+            else:
+                if hip_vertical_angle > self.thresholds['HIP_THRESH'][1]:
+                    self.state_tracker.display_text[0] = True
 
 
-                # -------------------------------------- COMPUTE COUNTERS --------------------------------------
+                elif hip_vertical_angle < self.thresholds['HIP_THRESH'][0] and \
+                     self.state_tracker.seq_count('s2')==1:
+                        self.state_tracker.display_text[1] = True
 
-                if current_state == 's1':
 
-                    if len(self.state_tracker['state_seq']) == 3 and not self.state_tracker['INCORRECT_POSTURE']:
-                        self.state_tracker['SQUAT_COUNT']+=1
-                        play_sound = str(self.state_tracker['SQUAT_COUNT'])
-                        
-                    elif 's2' in self.state_tracker['state_seq'] and len(self.state_tracker['state_seq'])==1:
-                        self.state_tracker['IMPROPER_SQUAT']+=1
-                        play_sound = 'incorrect'
 
-                    elif self.state_tracker['INCORRECT_POSTURE']:
-                        self.state_tracker['IMPROPER_SQUAT']+=1
-                        play_sound = 'incorrect'
-                        
-                    
-                    self.state_tracker['state_seq'] = []
-                    self.state_tracker['INCORRECT_POSTURE'] = False
+                if self.thresholds['KNEE_THRESH'][0] < knee_vertical_angle < self.thresholds['KNEE_THRESH'][1] and \
+                   self.state_tracker.seq_count('s2')==1:
+                    self.state_tracker.lower_hips = True
 
 
-                # ----------------------------------------------------------------------------------------------------
+                elif knee_vertical_angle > self.thresholds['KNEE_THRESH'][2]:
+                    self.state_tracker.display_text[3] = True
+                    self.state_tracker.incorrect_posture = True
 
 
+                if (ankle_vertical_angle > self.thresholds['ANKLE_THRESH']):
+                    self.state_tracker.display_text[2] = True
+                    self.state_tracker.incorrect_posture = True
 
 
-                # -------------------------------------- PERFORM FEEDBACK ACTIONS --------------------------------------
+            # ----------------------------------------------------------------------------------------------------
 
-                else:
-                    if hip_vertical_angle > self.thresholds['HIP_THRESH'][1]:
-                        self.state_tracker['DISPLAY_TEXT'][0] = True
-                        
 
-                    elif hip_vertical_angle < self.thresholds['HIP_THRESH'][0] and \
-                         self.state_tracker['state_seq'].count('s2')==1:
-                            self.state_tracker['DISPLAY_TEXT'][1] = True
-                        
-                                        
-                    
-                    if self.thresholds['KNEE_THRESH'][0] < knee_vertical_angle < self.thresholds['KNEE_THRESH'][1] and \
-                       self.state_tracker['state_seq'].count('s2')==1:
-                        self.state_tracker['LOWER_HIPS'] = True
+            rep = self.rep_metrics.update(
+                self.frame_idx, timestamp, current_state,
+                hip_vertical_angle, knee_vertical_angle, ankle_vertical_angle,
+                self.state_tracker.display_text, self.state_tracker.lower_hips, play_sound
+            )
+            if rep is not None:
+                self._emit_rep(rep)
 
 
-                    elif knee_vertical_angle > self.thresholds['KNEE_THRESH'][2]:
-                        self.state_tracker['DISPLAY_TEXT'][3] = True
-                        self.state_tracker['INCORRECT_POSTURE'] = True
 
-                    
-                    if (ankle_vertical_angle > self.thresholds['ANKLE_THRESH']):
-                        self.state_tracker['DISPLAY_TEXT'][2] = True
-                        self.state_tracker['INCORRECT_POSTURE'] = True
 
+            # ----------------------------------- COMPUTE INACTIVITY ---------------------------------------------
 
-                # ----------------------------------------------------------------------------------------------------
+            display_inactivity = False
 
+            if self.state_tracker.curr_state == self.state_tracker.prev_state:
 
-                
-                
-                # ----------------------------------- COMPUTE INACTIVITY ---------------------------------------------
+                end_time = now
+                self.state_tracker.inactive_time += end_time - self.state_tracker.start_inactive_time
+                self.state_tracker.start_inactive_time = end_time
 
-                display_inactivity = False
-                
-                if self.state_tracker['curr_state'] == self.state_tracker['prev_state']:
+                if self.state_tracker.inactive_time >= self.thresholds['INACTIVE_THRESH']:
+                    self.state_tracker.reset_counters()
+                    display_inactivity = True
 
-                    end_time = time.perf_counter()
-                    self.state_tracker['INACTIVE_TIME'] += end_time - self.state_tracker['start_inactive_time']
-                    self.state_tracker['start_inactive_time'] = end_time
 
-                    if self.state_tracker['INACTIVE_TIME'] >= self.thresholds['INACTIVE_THRESH']:
-                        self.state_tracker['SQUAT_COUNT'] = 0
-                        self.state_tracker['IMPROPER_SQUAT'] = 0
-                        display_inactivity = True
+            else:
 
-                
-                else:
-                    
-                    self.state_tracker['start_inactive_time'] = time.perf_counter()
-                    self.state_tracker['INACTIVE_TIME'] = 0.0
+                self.state_tracker.start_inactive_time = now
+                self.state_tracker.inactive_time = 0.0
 
-                # -------------------------------------------------------------------------------------------------------
-              
+            # -------------------------------------------------------------------------------------------------------
 
 
-                hip_text_coord_x = hip_coord[0] + 10
-                knee_text_coord_x = knee_coord[0] + 15
-                ankle_text_coord_x = ankle_coord[0] + 10
+            if self.state_tracker.seq_contains('s3') or current_state == 's1':
+                self.state_tracker.lower_hips = False
 
-                if self.flip_frame:
-                    frame = cv2.flip(frame, 1)
-                    hip_text_coord_x = frame_width - hip_coord[0] + 10
-                    knee_text_coord_x = frame_width - knee_coord[0] + 15
-                    ankle_text_coord_x = frame_width - ankle_coord[0] + 10
+            self.state_tracker.count_frames[self.state_tracker.display_text]+=1
 
-                
-                
-                if 's3' in self.state_tracker['state_seq'] or current_state == 's1':
-                    self.state_tracker['LOWER_HIPS'] = False
+            # Feedback on screen this frame, taken before expired messages are cleared below.
+            feedback = tuple(int(idx) for idx in np.flatnonzero(self.state_tracker.count_frames))
+            lower_hips = bool(self.state_tracker.lower_hips)
 
-                self.state_tracker['COUNT_FRAMES'][self.state_tracker['DISPLAY_TEXT']]+=1
 
-                frame = self._show_feedback(frame, self.state_tracker['COUNT_FRAMES'], self.FEEDBACK_ID_MAP, self.state_tracker['LOWER_HIPS'])
+            if display_inactivity:
+                play_sound = 'reset_counters'
+                self.state_tracker.start_inactive_time = now
+                self.state_tracker.inactive_time = 0.0
 
 
+            self.state_tracker.display_text[self.state_tracker.count_frames > self.thresholds['CNT_FRAME_THRESH']] = False
+            self.state_tracker.count_frames[self.state_tracker.count_frames > self.thresholds['CNT_FRAME_THRESH']] = 0
+            self.state_tracker.prev_state = current_state
 
-                if display_inactivity:
-                    # cv2.putText(frame, 'Resetting COUNTERS due to inactivity!!!', (10, frame_height - 20), self.font, 0.5, self.COLORS['blue'], 2, lineType=self.linetype)
-                    play_sound = 'reset_counters'
-                    self.state_tracker['start_inactive_time'] = time.perf_counter()
-                    self.state_tracker['INACTIVE_TIME'] = 0.0
+            return FrameAnalysis(
+                view='side',
+                play_sound=play_sound,
+                squat_count=self.state_tracker.squat_count,
+                improper_squat=self.state_tracker.improper_squat,
+                frame_size=frame_size,
+                points={
+                    'shoulder': shldr_coord, 'elbow': elbow_coord, 'wrist': wrist_coord, 'hip': hip_coord,
+                    'knee': knee_coord, 'ankle': ankle_coord, 'foot': foot_coord
+                },
+                angles=self.last_angles,
+                multiplier=multiplier,
+                feedback=feedback,
+                lower_hips=lower_hips
+            )
 
-                
-                cv2.putText(frame, str(int(hip_vertical_angle)), (hip_text_coord_x, hip_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
-                cv2.putText(frame, str(int(knee_vertical_angle)), (knee_text_coord_x, knee_coord[1]+10), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
-                cv2.putText(frame, str(int(ankle_vertical_angle)), (ankle_text_coord_x, ankle_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
 
-                 
-                draw_text(
-                    frame, 
-                    "CORRECT: " + str(self.state_tracker['SQUAT_COUNT']), 
-                    pos=(int(frame_width*0.68), 30),
-                    text_color=(255, 255, 230),
-                    font_scale=0.7,
-                    text_color_bg=(18, 185, 0)
-                )  
-                
 
-                draw_text(
-                    frame, 
-                    "INCORRECT: " + str(self.state_tracker['IMPROPER_SQUAT']), 
-                    pos=(int(frame_width*0.68), 80),
-                    text_color=(255, 255, 230),
-                    font_scale=0.7,
-                    text_color_bg=(221, 0, 0),
-                    
-                )  
-                
-                
-                self.state_tracker['DISPLAY_TEXT'][self.state_tracker['COUNT_FRAMES'] > self.thresholds['CNT_FRAME_THRESH']] = False
-                self.state_tracker['COUNT_FRAMES'][self.state_tracker['COUNT_FRAMES'] > self.thresholds['CNT_FRAME_THRESH']] = 0    
-                self.state_tracker['prev_state'] = current_state
-                                  
-
-       
-        
-        else:
 
-            if self.flip_frame:
-                frame = cv2.flip(frame, 1)
+        end_time = now
+        self.state_tracker.inactive_time += end_time - self.state_tracker.start_inactive_time
 
-            end_time = time.perf_counter()
-            self.state_tracker['INACTIVE_TIME'] += end_time - self.state_tracker['start_inactive_time']
+        display_inactivity = False
 
-            display_inactivity = False
+        if self.state_tracker.inactive_time >= self.thresholds['INACTIVE_THRESH']:
+            self.state_tracker.reset_counters()
+            display_inactivity = True
 
-            if self.state_tracker['INACTIVE_TIME'] >= self.thresholds['INACTIVE_THRESH']:
-                self.state_tracker['SQUAT_COUNT'] = 0
-                self.state_tracker['IMPROPER_SQUAT'] = 0
-                # cv2.putText(frame, 'Resetting SQUAT_COUNT due to inactivity!!!', (10, frame_height - 25), self.font, 0.7, self.COLORS['blue'], 2)
-                display_inactivity = True
+        self.state_tracker.start_inactive_time = end_time
 
-            self.state_tracker['start_inactive_time'] = end_time
+        if display_inactivity:
+            play_sound = 'reset_counters'
+            self.state_tracker.start_inactive_time = now
+            self.state_tracker.inactive_time = 0.0
+        # Reset all other state variables
+
+        self.rep_metrics.reset()
+        self.state_tracker.prev_state =  None
+        self.state_tracker.curr_state = None
+        self.state_tracker.inactive_time_front = 0.0
+        self.state_tracker.incorrect_posture = False
+        self.state_tracker.reset_feedback()
+        self.state_tracker.start_inactive_time_front = now
+
+        return FrameAnalysis(
+            view=None,
+            play_sound=play_sound,
+            squat_count=self.state_tracker.squat_count,
+            improper_squat=self.state_tracker.improper_squat,
+            frame_size=frame_size
+        )
+
+
+
+    def _draw_counters(self, frame, analysis):
+        frame_width = analysis.frame_size[0]
+
+        draw_text(
+            frame,
+            "CORRECT: " + str(analysis.squat_count),
+            pos=(int(frame_width*0.68), 30),
+            text_color=(255, 255, 230),
+            font_scale=0.7,
+            text_color_bg=(18, 185, 0)
+        )
+
+
+        draw_text(
+            frame,
+            "INCORRECT: " + str(analysis.improper_squat),
+            pos=(int(frame_width*0.68), 80),
+            text_color=(255, 255, 230),
+            font_scale=0.7,
+            text_color_bg=(221, 0, 0),
+
+        )
+
+
+
+    def render(self, frame, analysis: FrameAnalysis):
+        """Draw the overlay for an analyzed frame."""
+        frame_width, frame_height = analysis.frame_size
+        points = analysis.points
+
+        if analysis.view == 'front':
+
+            cv2.circle(frame, points['nose'], 7, self.COLORS['white'], -1)
+            cv2.circle(frame, points['left_shoulder'], 7, self.COLORS['yellow'], -1)
+            cv2.circle(frame, points['right_shoulder'], 7, self.COLORS['magenta'], -1)
+
+            if self.flip_frame:
+                frame = cv2.flip(frame, 1)
+
+            self._draw_counters(frame, analysis)
 
             draw_text(
-                    frame, 
-                    "CORRECT: " + str(self.state_tracker['SQUAT_COUNT']), 
-                    pos=(int(frame_width*0.68), 30),
-                    text_color=(255, 255, 230),
-                    font_scale=0.7,
-                    text_color_bg=(18, 185, 0)
-                )  
-                
+                frame,
+                'CAMERA NOT ALIGNED PROPERLY!!!',
+                pos=(30, frame_height-60),
+                text_color=(255, 255, 230),
+                font_scale=0.65,
+                text_color_bg=(255, 153, 0),
+            )
+
 
             draw_text(
-                    frame, 
-                    "INCORRECT: " + str(self.state_tracker['IMPROPER_SQUAT']), 
-                    pos=(int(frame_width*0.68), 80),
-                    text_color=(255, 255, 230),
-                    font_scale=0.7,
-                    text_color_bg=(221, 0, 0),
-                    
-                )  
+                frame,
+                'OFFSET ANGLE: '+str(analysis.offset_angle),
+                pos=(30, frame_height-30),
+                text_color=(255, 255, 230),
+                font_scale=0.65,
+                text_color_bg=(255, 153, 0),
+            )
 
-            if display_inactivity:
-                play_sound = 'reset_counters'
-                self.state_tracker['start_inactive_time'] = time.perf_counter()
-                self.state_tracker['INACTIVE_TIME'] = 0.0
-            # Reset all other state variables
-            
-            self.state_tracker['prev_state'] =  None
-            self.state_tracker['curr_state'] = None
-            self.state_tracker['INACTIVE_TIME_FRONT'] = 0.0
-            self.state_tracker['INCORRECT_POSTURE'] = False
-            self.state_tracker['DISPLAY_TEXT'] = np.full((5,), False)
-            self.state_tracker['COUNT_FRAMES'] = np.zeros((5,), dtype=np.int64)
-            self.state_tracker['start_inactive_time_front'] = time.perf_counter()
-            
-            
-            
-        return frame, play_sound
 
+        elif analysis.view == 'side':
+
+            shldr_coord, elbow_coord, wrist_coord = points['shoulder'], points['elbow'], points['wrist']
+            hip_coord, knee_coord, ankle_coord, foot_coord = points['hip'], points['knee'], points['ankle'], points['foot']
+            hip_vertical_angle, knee_vertical_angle, ankle_vertical_angle = analysis.angles
+            multiplier = analysis.multiplier
 
+            # ------------------- Verical Angle arcs --------------
+
+            cv2.ellipse(frame, hip_coord, (30, 30),
+                        angle = 0, startAngle = -90, endAngle = -90+multiplier*hip_vertical_angle,
+                        color = self.COLORS['white'], thickness = 3, lineType = self.linetype)
+
+            draw_dotted_line(frame, hip_coord, start=hip_coord[1]-80, end=hip_coord[1]+20, line_color=self.COLORS['blue'])
+
+
+            cv2.ellipse(frame, knee_coord, (20, 20),
+                        angle = 0, startAngle = -90, endAngle = -90-multiplier*knee_vertical_angle,
+                        color = self.COLORS['white'], thickness = 3,  lineType = self.linetype)
+
+            draw_dotted_line(frame, knee_coord, start=knee_coord[1]-50, end=knee_coord[1]+20, line_color=self.COLORS['blue'])
+
+
+            cv2.ellipse(frame, ankle_coord, (30, 30),
+                        angle = 0, startAngle = -90, endAngle = -90 + multiplier*ankle_vertical_angle,
+                        color = self.COLORS['white'], thickness = 3,  lineType=self.linetype)
+
+            draw_dotted_line(frame, ankle_coord, start=ankle_coord[1]-50, end=ankle_coord[1]+20, line_color=self.COLORS['blue'])
+
+            # ------------------------------------------------------------
+
+
+            # Join landmarks.
+            cv2.line(frame, shldr_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
+            cv2.line(frame, wrist_coord, elbow_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
+            cv2.line(frame, shldr_coord, hip_coord, self.COLORS['light_blue'], 4, lineType=self.linetype)
+            cv2.line(frame, knee_coord, hip_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
+            cv2.line(frame, ankle_coord, knee_coord,self.COLORS['light_blue'], 4,  lineType=self.linetype)
+            cv2.line(frame, ankle_coord, foot_coord, self.COLORS['light_blue'], 4,  lineType=self.linetype)
+
+            # Plot landmark points
+            cv2.circle(frame, shldr_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, elbow_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, wrist_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, hip_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, knee_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, ankle_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+            cv2.circle(frame, foot_coord, 7, self.COLORS['yellow'], -1,  lineType=self.linetype)
+
+
+            hip_text_coord_x = hip_coord[0] + 10
+            knee_text_coord_x = knee_coord[0] + 15
+            ankle_text_coord_x = ankle_coord[0] + 10
+
+            if self.flip_frame:
+                frame = cv2.flip(frame, 1)
+                hip_text_coord_x = frame_width - hip_coord[0] + 10
+                knee_text_coord_x = frame_width - knee_coord[0] + 15
+                ankle_text_coord_x = frame_width - ankle_coord[0] + 10
+
+
+            frame = self._show_feedback(frame, analysis.feedback, self.FEEDBACK_ID_MAP, analysis.lower_hips)
+
+
+            cv2.putText(frame, str(int(hip_vertical_angle)), (hip_text_coord_x, hip_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
+            cv2.putText(frame, str(int(knee_vertical_angle)), (knee_text_coord_x, knee_coord[1]+10), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
+            cv2.putText(frame, str(int(ankle_vertical_angle)), (ankle_text_coord_x, ankle_coord[1]), self.font, 0.6, self.COLORS['light_green'], 2, lineType=self.linetype)
+
+            self._draw_counters(frame, analysis)
+
+
+        else:
+
+            if self.flip_frame:
+                frame = cv2.flip(frame, 1)
+
+            self._draw_counters(frame, analysis)
+
+
+        return frame
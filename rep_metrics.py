@@ -0,0 +1,157 @@
+from typing import NamedTuple, Optional, Sequence
+
+
+# Bit used in RepRecord.flags for the LOWER YOUR HIPS prompt; bits 0-3 follow
+# ProcessFrame.FEEDBACK_ID_MAP.
+LOWER_HIPS_FLAG = 1 << 4
+
+
+class RepRecord(NamedTuple):
+    rep: int
+    outcome: str            # 'correct' or 'incorrect'
+    start_frame: int
+    end_frame: int
+    start_time: float
+    bottom_time: float
+    end_time: float
+    descent_time: float
+    ascent_time: float
+    time_under_tension: float
+    min_knee_angle: float   # Interior hip-knee-ankle angle at the deepest point.
+    max_knee_vertical: float
+    hip_min: float
+    hip_max: float
+    ankle_min: float
+    ankle_max: float
+    flags: int
+
+
+def feedback_flags(display_text: Sequence[bool], lower_hips: bool) -> int:
+    """Pack the feedback shown on the current frame into RepRecord.flags bits."""
+    flags = 0
+    for idx in range(len(display_text)):
+        if display_text[idx]:
+            flags |= 1 << idx
+    if lower_hips:
+        flags |= LOWER_HIPS_FLAG
+    return flags
+
+
+def flag_names(flags: int, feedback_id_map) -> list:
+    """Translate RepRecord.flags into the feedback messages that fired during the rep."""
+    names = [feedback_id_map[idx][0] for idx in sorted(feedback_id_map) if flags & (1 << idx)]
+    if flags & LOWER_HIPS_FLAG:
+        names.append('LOWER YOUR HIPS')
+    return names
+
+
+class RepMetricsTracker:
+    """
+    Incrementally accumulates per-rep metrics from the angles ProcessFrame already computes.
+
+    update() is O(1) per frame: a rep starts when the knee leaves the normal
+    state 's1' and is emitted as a RepRecord when it returns to 's1' and
+    ProcessFrame has scored it.
+    """
+
+    __slots__ = (
+        'active', 'rep_idx',
+        'start_frame', 'start_time', 'bottom_time',
+        'max_knee_vertical', 'min_knee_angle',
+        'hip_min', 'hip_max', 'ankle_min', 'ankle_max',
+        'flags',
+    )
+
+    def __init__(self):
+        self.rep_idx = 0
+        self.reset()
+
+    def reset(self):
+        """Drop the rep in progress, e.g. when the pose is lost or the camera is misaligned."""
+        self.active = False
+        self.start_frame = 0
+        self.start_time = 0.0
+        self.bottom_time = 0.0
+        self.max_knee_vertical = 0.0
+        self.min_knee_angle = 180.0
+        self.hip_min = self.hip_max = 0.0
+        self.ankle_min = self.ankle_max = 0.0
+        self.flags = 0
+
+    def _start(self, frame_idx, timestamp, hip_angle, ankle_angle):
+        self.active = True
+        self.start_frame = frame_idx
+        self.start_time = timestamp
+        self.bottom_time = timestamp
+        self.max_knee_vertical = 0.0
+        self.min_knee_angle = 180.0
+        self.hip_min = self.hip_max = hip_angle
+        self.ankle_min = self.ankle_max = ankle_angle
+        self.flags = 0
+
+    def update(self, frame_idx: int, timestamp: float, state: Optional[str],
+               hip_angle: float, knee_angle: float, ankle_angle: float,
+               display_text: Sequence[bool], lower_hips: bool,
+               play_sound: Optional[str]) -> Optional[RepRecord]:
+
+        if not self.active:
+            if state in ('s2', 's3'):
+                self._start(frame_idx, timestamp, hip_angle, ankle_angle)
+            else:
+                return None
+
+        if state == 's1':
+            return self._finish(frame_idx, timestamp, play_sound)
+
+        if knee_angle > self.max_knee_vertical:
+            self.max_knee_vertical = knee_angle
+            self.bottom_time = timestamp
+            # Thigh and shin lean away from the knee in opposite directions.
+            self.min_knee_angle = 180.0 - knee_angle - ankle_angle
+
+        if hip_angle < self.hip_min:
+            self.hip_min = hip_angle
+        elif hip_angle > self.hip_max:
+            self.hip_max = hip_angle
+
+        if ankle_angle < self.ankle_min:
+            self.ankle_min = ankle_angle
+        elif ankle_angle > self.ankle_max:
+            self.ankle_max = ankle_angle
+
+        self.flags |= feedback_flags(display_text, lower_hips)
+
+        return None
+
+    def _finish(self, frame_idx, timestamp, play_sound):
+        self.active = False
+
+        if play_sound == 'incorrect':
+            outcome = 'incorrect'
+        elif play_sound is not None and play_sound.isdigit():
+            outcome = 'correct'
+        else:
+            # The knee went back up without the rep being scored.
+            return None
+
+        self.rep_idx += 1
+
+        return RepRecord(
+            rep=self.rep_idx,
+            outcome=outcome,
+            start_frame=self.start_frame,
+            end_frame=frame_idx,
+            start_time=self.start_time,
+            bottom_time=self.bottom_time,
+            end_time=timestamp,
+            descent_time=self.bottom_time - self.start_time,
+            ascent_time=timestamp - self.bottom_time,
+            time_under_tension=timestamp - self.start_time,
+            min_knee_angle=self.min_knee_angle,
+            max_knee_vertical=self.max_knee_vertical,
+            hip_min=self.hip_min,
+            hip_max=self.hip_max,
+            ankle_min=self.ankle_min,
+            ankle_max=self.ankle_max,
+            flags=self.flags
+        )
@@ -1,7 +1,21 @@
 from typing import List, Dict
+import os
 import re
+from collections import deque
 from datetime import datetime
 
+
+# Queries kept for context, and chat messages kept for display per session.
+CONVERSATION_HISTORY_LIMIT = 10
+CHAT_HISTORY_LIMIT = int(os.getenv('SMARTFIT_CHAT_HISTORY', '100'))
+
+
+def append_chat_message(history, role, content, limit=CHAT_HISTORY_LIMIT):
+    """Append to a chat history list, dropping the oldest messages beyond `limit`."""
+    history.append({"role": role, "content": content})
+    del history[:-limit]
+
+
 class ResponseHandler:
     def __init__(self):
         self.context = {
@@ -11,7 +25,8 @@ class ResponseHandler:
             'query_count': 0,
             'topics_discussed': set()
         }
-        self.conversation_history = []
+        # Bounded even when a response fails before the context is updated.
+        self.conversation_history = deque(maxlen=CONVERSATION_HISTORY_LIMIT)
         self.response_templates = self._initialize_templates()
 
     def _initialize_templates(self) -> Dict:
@@ -216,8 +231,4 @@ class ResponseHandler:
         if any(term in query.lower() for term in ['advanced', 'professional', 'expert']):
             self.context['user_level'] = 'advanced'
         elif any(term in query.lower() for term in ['intermediate', 'experienced']):
-            self.context['user_level'] = 'intermediate'
-        
-        # Trim conversation history if too long
-        if len(self.conversation_history) > 10:
-            self.conversation_history = self.conversation_history[-10:]
\ No newline at end of file
+            self.context['user_level'] = 'intermediate'
\ No newline at end of file
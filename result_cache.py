@@ -0,0 +1,146 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import logging
+import tempfile
+
+
+RESULT_CACHE_DIR = os.getenv('SMARTFIT_RESULT_CACHE_DIR',
+                             os.path.join(tempfile.gettempdir(), 'smartfit_result_cache'))
+RESULT_CACHE_BYTES = int(os.getenv('SMARTFIT_RESULT_CACHE_MB', '5120')) * 1024 * 1024
+
+_RESULT_FILE = 'result.json'
+
+
+def file_digest(path, chunk_size=8 * 1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_key(input_digest, thresholds, pose_settings, code_version, outputs=()):
+    """
+    Key for an analysis result: the input content plus everything that changes
+    the output. Any threshold, pose setting or code version change gives a new key.
+    """
+    payload = json.dumps({
+        'input': input_digest,
+        'thresholds': thresholds,
+        'pose': pose_settings,
+        'code': code_version,
+        'outputs': sorted(outputs)
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+class ResultCache:
+    """
+    On-disk cache of finished analyses keyed by cache_key(). Each entry is a
+    directory with result.json and its artifacts (sidecar, annotated video).
+    Entries are evicted least-recently-used once the cache exceeds `max_bytes`.
+    """
+
+    def __init__(self, root=RESULT_CACHE_DIR, max_bytes=RESULT_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        # Entries are assembled here and renamed into place, out of eviction's sight.
+        self.tmp_dir = os.path.join(self.root, '.tmp')
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.root, key[:2], key)
+
+    def get(self, key, artifact_targets=None):
+        """
+        Return the cached result, or None. Artifacts are hard-linked (or copied)
+        to the paths in `artifact_targets` ({name: path}) and the result points at them.
+        """
+        entry = self._entry_dir(key)
+        result_path = os.path.join(entry, _RESULT_FILE)
+        try:
+            with open(result_path) as f:
+                cached = json.load(f)
+            # mtime of result.json doubles as the LRU timestamp.
+            os.utime(result_path)
+        except (OSError, ValueError):
+            return None
+
+        result = cached['result']
+        for name, target in (artifact_targets or {}).items():
+            artifact = cached['artifacts'].get(name)
+            if artifact is None:
+                return None
+            try:
+                _link_or_copy(os.path.join(entry, artifact), target)
+            except OSError:
+                return None
+            result[name] = target
+        return result
+
+    def put(self, key, result, artifacts=None):
+        """Store `result` with its artifact files ({name: path}); the files are copied in."""
+        entry = self._entry_dir(key)
+        os.makedirs(os.path.dirname(entry), exist_ok=True)
+        tmp_entry = tempfile.mkdtemp(dir=self.tmp_dir)
+
+        try:
+            stored = {}
+            for name, path in (artifacts or {}).items():
+                if path and os.path.exists(path):
+                    artifact = name + os.path.splitext(path)[1]
+                    _link_or_copy(path, os.path.join(tmp_entry, artifact))
+                    stored[name] = artifact
+
+            with open(os.path.join(tmp_entry, _RESULT_FILE), 'w') as f:
+                json.dump({'result': result, 'artifacts': stored, 'created': time.time()}, f)
+
+            if os.path.exists(entry):
+                shutil.rmtree(entry, ignore_errors=True)
+            os.rename(tmp_entry, entry)
+        except OSError as e:
+            logging.warning(f"Could not store analysis result {key}: {e}")
+            shutil.rmtree(tmp_entry, ignore_errors=True)
+            return False
+
+        self.evict()
+        return True
+
+    def _entries(self):
+        for shard in os.scandir(self.root):
+            if not shard.is_dir() or shard.name.startswith('.'):
+                continue
+            for entry in os.scandir(shard.path):
+                if not entry.is_dir():
+                    continue
+                try:
+                    size = sum(f.stat().st_size for f in os.scandir(entry.path) if f.is_file())
+                    last_used = os.stat(os.path.join(entry.path, _RESULT_FILE)).st_mtime
+                except OSError:
+                    # Half-written entry; give it the oldest timestamp so it goes first.
+                    size, last_used = 0, 0.0
+                yield last_used, size, entry.path
+
+    def usage(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Drop least-recently-used entries until the cache fits its byte budget."""
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+        return total
@@ -0,0 +1,103 @@
+import os
+import re
+import time
+import shutil
+import tempfile
+import logging
+
+
+SCRATCH_DIR = os.getenv('SMARTFIT_SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'smartfit_scratch'))
+
+# Per-user disk quota for uploads and analysis outputs.
+USER_QUOTA_BYTES = int(os.getenv('SMARTFIT_USER_QUOTA_MB', '2048')) * 1024 * 1024
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+class QuotaExceededError(Exception):
+    pass
+
+
+class ScratchStore:
+    """
+    Managed scratch space for uploaded videos and analysis outputs, one
+    directory per user with a disk quota.
+    """
+
+    def __init__(self, root=SCRATCH_DIR, quota_bytes=USER_QUOTA_BYTES):
+        self.root = root
+        self.quota_bytes = quota_bytes
+        os.makedirs(self.root, exist_ok=True)
+
+    def user_dir(self, user):
+        safe_user = re.sub(r'[^A-Za-z0-9_.-]', '_', str(user)) or 'anonymous'
+        path = os.path.join(self.root, safe_user)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def path(self, user, name):
+        return os.path.join(self.user_dir(user), os.path.basename(name))
+
+    def usage(self, user):
+        total = 0
+        for entry in os.scandir(self.user_dir(user)):
+            if entry.is_file():
+                total += entry.stat().st_size
+        return total
+
+    def check_quota(self, user, incoming_bytes):
+        used = self.usage(user)
+        if used + incoming_bytes > self.quota_bytes:
+            raise QuotaExceededError(
+                f"Upload of {incoming_bytes / 1e6:.1f} MB exceeds the scratch quota "
+                f"({used / 1e6:.1f} of {self.quota_bytes / 1e6:.0f} MB used)"
+            )
+
+    def ingest(self, user, fileobj, suffix='', expected_size=None, chunk_size=CHUNK_SIZE):
+        """
+        Copy `fileobj` into the user's scratch directory in fixed-size chunks and
+        return the new path. The quota is checked up front when the size is known
+        and again while copying; partial files are removed on failure.
+        """
+        if expected_size is not None:
+            self.check_quota(user, expected_size)
+        remaining = self.quota_bytes - self.usage(user)
+
+        fd, path = tempfile.mkstemp(suffix=suffix, dir=self.user_dir(user))
+        try:
+            written = 0
+            with os.fdopen(fd, 'wb') as out_file:
+                while True:
+                    chunk = fileobj.read(chunk_size)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > remaining:
+                        raise QuotaExceededError(
+                            f"Upload exceeds the scratch quota of {self.quota_bytes / 1e6:.0f} MB"
+                        )
+                    out_file.write(chunk)
+        except BaseException:
+            self.remove(path)
+            raise
+
+        return path
+
+    def remove(self, path):
+        if path and os.path.exists(path):
+            try:
+                os.remove(path)
+            except OSError as e:
+                logging.warning(f"Could not remove scratch file {path}: {e}")
+
+    def cleanup_stale(self, max_age_seconds=24 * 3600):
+        """Remove scratch files older than `max_age_seconds`, e.g. left by killed sessions."""
+        cutoff = time.time() - max_age_seconds
+        for user_entry in os.scandir(self.root):
+            if not user_entry.is_dir():
+                continue
+            for entry in os.scandir(user_entry.path):
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    self.remove(entry.path)
+            if not os.listdir(user_entry.path):
+                shutil.rmtree(user_entry.path, ignore_errors=True)
@@ -0,0 +1,179 @@
+import struct
+import time
+import numpy as np
+
+
+# Number of feedback messages tracked by ProcessFrame.FEEDBACK_ID_MAP.
+NUM_FEEDBACK = 4
+
+# Longest valid state sequence: s2 -> s3 -> s2.
+MAX_SEQ_LEN = 3
+
+_STATE_CODES = {None: 0, 's1': 1, 's2': 2, 's3': 3}
+_STATE_NAMES = (None, 's1', 's2', 's3')
+
+# version, seq_len, seq[3], prev, curr, flags, squat_count, improper_squat,
+# inactive_time, inactive_time_front, start_inactive_age, start_inactive_front_age,
+# display_text bitmask, count_frames[NUM_FEEDBACK]
+_SNAPSHOT_VERSION = 1
+_SNAPSHOT_FMT = '<BB3sBBBII4dB%dq' % NUM_FEEDBACK
+_SNAPSHOT_STRUCT = struct.Struct(_SNAPSHOT_FMT)
+
+_FLAG_LOWER_HIPS = 1
+_FLAG_INCORRECT_POSTURE = 2
+
+
+class SessionState:
+    """
+    Per-session counters and feedback state shared in and out of the frame callback.
+
+    All buffers are allocated once and updated in place, so a session never
+    reallocates while running and can be snapshotted to a fixed-size byte string.
+    """
+
+    __slots__ = (
+        '_seq', '_seq_len',
+        'start_inactive_time', 'start_inactive_time_front',
+        'inactive_time', 'inactive_time_front',
+        'display_text', 'count_frames',
+        'lower_hips', 'incorrect_posture',
+        'prev_state', 'curr_state',
+        'squat_count', 'improper_squat',
+    )
+
+    SNAPSHOT_SIZE = _SNAPSHOT_STRUCT.size
+
+    def __init__(self):
+        now = time.perf_counter()
+
+        self._seq = bytearray(MAX_SEQ_LEN)
+        self._seq_len = 0
+
+        self.start_inactive_time = now
+        self.start_inactive_time_front = now
+        self.inactive_time = 0.0
+        self.inactive_time_front = 0.0
+
+        # 0 --> Bend Backwards, 1 --> Bend Forward, 2 --> Keep shin straight, 3 --> Deep squat
+        self.display_text = np.full((NUM_FEEDBACK,), False)
+        self.count_frames = np.zeros((NUM_FEEDBACK,), dtype=np.int64)
+
+        self.lower_hips = False
+        self.incorrect_posture = False
+
+        self.prev_state = None
+        self.curr_state = None
+
+        self.squat_count = 0
+        self.improper_squat = 0
+
+    # ------------------------------- State sequence -------------------------------
+
+    @property
+    def state_seq(self):
+        return [_STATE_NAMES[code] for code in self._seq[:self._seq_len]]
+
+    @property
+    def seq_len(self):
+        return self._seq_len
+
+    def seq_count(self, state):
+        code = _STATE_CODES[state]
+        return sum(1 for i in range(self._seq_len) if self._seq[i] == code)
+
+    def seq_contains(self, state):
+        return self.seq_count(state) > 0
+
+    def seq_append(self, state):
+        if self._seq_len < MAX_SEQ_LEN:
+            self._seq[self._seq_len] = _STATE_CODES[state]
+            self._seq_len += 1
+
+    def seq_clear(self):
+        self._seq_len = 0
+
+    # ------------------------------- Resets -------------------------------
+
+    def reset_feedback(self):
+        """Clear the feedback buffers in place."""
+        self.display_text.fill(False)
+        self.count_frames.fill(0)
+
+    def reset_counters(self):
+        self.squat_count = 0
+        self.improper_squat = 0
+
+    # ------------------------------- Snapshot / restore -------------------------------
+
+    def snapshot(self, now=None) -> bytes:
+        """
+        Serialize the state to a fixed-size byte string.
+
+        Timers are stored as ages relative to `now` (perf_counter by default,
+        or ProcessFrame.clock() of the last frame), since perf_counter values
+        are only meaningful inside the process that produced them.
+        """
+        if now is None:
+            now = time.perf_counter()
+        flags = (_FLAG_LOWER_HIPS if self.lower_hips else 0) | \
+                (_FLAG_INCORRECT_POSTURE if self.incorrect_posture else 0)
+        display_mask = 0
+        for idx in range(NUM_FEEDBACK):
+            if self.display_text[idx]:
+                display_mask |= 1 << idx
+
+        return _SNAPSHOT_STRUCT.pack(
+            _SNAPSHOT_VERSION,
+            self._seq_len,
+            bytes(self._seq),
+            _STATE_CODES[self.prev_state],
+            _STATE_CODES[self.curr_state],
+            flags,
+            self.squat_count,
+            self.improper_squat,
+            self.inactive_time,
+            self.inactive_time_front,
+            now - self.start_inactive_time,
+            now - self.start_inactive_time_front,
+            display_mask,
+            *(int(c) for c in self.count_frames)
+        )
+
+    def restore(self, data: bytes, now=None):
+        """Load a snapshot produced by snapshot() into this object in place, with timer ages counted back from `now`."""
+        fields = _SNAPSHOT_STRUCT.unpack(data)
+        if fields[0] != _SNAPSHOT_VERSION:
+            raise ValueError(f"Unsupported session snapshot version: {fields[0]}")
+
+        (_, seq_len, seq, prev_code, curr_code, flags,
+         squat_count, improper_squat,
+         inactive_time, inactive_time_front,
+         start_age, start_front_age,
+         display_mask) = fields[:13]
+        count_frames = fields[13:]
+
+        if now is None:
+            now = time.perf_counter()
+
+        self._seq[:] = seq
+        self._seq_len = seq_len
+        self.prev_state = _STATE_NAMES[prev_code]
+        self.curr_state = _STATE_NAMES[curr_code]
+        self.lower_hips = bool(flags & _FLAG_LOWER_HIPS)
+        self.incorrect_posture = bool(flags & _FLAG_INCORRECT_POSTURE)
+        self.squat_count = squat_count
+        self.improper_squat = improper_squat
+        self.inactive_time = inactive_time
+        self.inactive_time_front = inactive_time_front
+        self.start_inactive_time = now - start_age
+        self.start_inactive_time_front = now - start_front_age
+
+        for idx in range(NUM_FEEDBACK):
+            self.display_text[idx] = bool(display_mask & (1 << idx))
+            self.count_frames[idx] = count_frames[idx]
+
+        return self
+
+    @classmethod
+    def from_snapshot(cls, data: bytes):
+        return cls().restore(data)
@@ -0,0 +1,217 @@
+import os
+import json
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, LANDMARK_FIELDS, ReplayPose
+from process_frame import ProcessFrame
+from rep_metrics import feedback_flags, LOWER_HIPS_FLAG
+from session_state import NUM_FEEDBACK
+from media_backend import open_reader, open_writer
+
+
+SIDECAR_VERSION = 1
+
+# Frames are buffered in preallocated chunks so recording never reallocates per frame.
+_CHUNK_FRAMES = 1024
+
+# Frame cap for a live sidecar, which is held in memory (about 560 bytes per
+# frame) until the stream stops; 10 minutes at 30 fps by default.
+SIDECAR_MAX_FRAMES = int(os.getenv('SMARTFIT_SIDECAR_MAX_FRAMES', '18000'))
+
+
+def _new_chunk():
+    return {
+        'present'  : np.zeros((_CHUNK_FRAMES,), dtype=bool),
+        'times'    : np.zeros((_CHUNK_FRAMES,), dtype=np.float64),
+        'landmarks': np.zeros((_CHUNK_FRAMES, NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32),
+        'angles'   : np.full((_CHUNK_FRAMES, 3), np.nan, dtype=np.float32),
+        'counts'   : np.zeros((_CHUNK_FRAMES, 2), dtype=np.int32),
+        'flags'    : np.zeros((_CHUNK_FRAMES,), dtype=np.uint8),
+    }
+
+
+class SidecarWriter:
+    """
+    Records the per-frame landmarks, angles, counters and feedback flags of an
+    analysis instead of a burned-in overlay video. The overlay can be rebuilt
+    later from the source video with render_overlay().
+
+    Like LiveRecorder, a live sidecar stops recording once `max_seconds` of
+    timestamps or `max_frames` frames are reached, and sets `stop_reason`.
+    """
+
+    def __init__(self, path, fps, frame_size, thresholds, flip_frame=False, max_seconds=None, max_frames=None):
+        self.path = path
+        self.max_seconds = max_seconds
+        self.max_frames = max_frames
+        self.stop_reason = None
+        self._start_time = None
+        self.meta = {
+            'version': SIDECAR_VERSION,
+            'fps': fps,
+            'frame_size': list(frame_size) if frame_size else None,
+            'thresholds': thresholds,
+            'flip_frame': flip_frame,
+            'events': [],
+            'reps': []
+        }
+        self.n_frames = 0
+        self._chunks = []
+
+    @classmethod
+    def from_file(cls, path, n_frames=None):
+        """Reopen a saved sidecar to keep appending, optionally truncated to `n_frames`."""
+        sidecar = load_sidecar(path)
+        meta = sidecar['meta']
+        n_frames = meta['n_frames'] if n_frames is None else min(n_frames, meta['n_frames'])
+
+        writer = cls(path, meta['fps'], meta['frame_size'], meta['thresholds'], meta['flip_frame'])
+        writer.meta['events'] = [event for event in meta['events'] if event[0] < n_frames]
+        writer.meta['reps'] = [rep for rep in meta['reps'] if rep['end_frame'] < n_frames]
+
+        for start in range(0, n_frames, _CHUNK_FRAMES):
+            chunk = _new_chunk()
+            stop = min(start + _CHUNK_FRAMES, n_frames)
+            for key in chunk:
+                chunk[key][:stop - start] = sidecar[key][start:stop]
+            writer._chunks.append(chunk)
+        writer.n_frames = n_frames
+        return writer
+
+    @property
+    def recording(self):
+        return self.stop_reason is None
+
+    def add(self, recording_pose, process_frame, play_sound=None, timestamp=0.0):
+        """
+        Record one frame after ProcessFrame.process() ran with `recording_pose`.
+        Returns False once a cap has stopped the recording.
+        """
+        if self.stop_reason is not None:
+            return False
+        if self._start_time is None:
+            self._start_time = timestamp
+        if self.max_seconds is not None and timestamp - self._start_time >= self.max_seconds:
+            self.stop_reason = 'duration'
+            return False
+        if self.max_frames is not None and self.n_frames >= self.max_frames:
+            self.stop_reason = 'size'
+            return False
+
+        chunk_idx, row = divmod(self.n_frames, _CHUNK_FRAMES)
+        if chunk_idx == len(self._chunks):
+            self._chunks.append(_new_chunk())
+        chunk = self._chunks[chunk_idx]
+
+        state = process_frame.state_tracker
+
+        chunk['times'][row] = timestamp
+
+        if recording_pose.last_present:
+            chunk['present'][row] = True
+            chunk['landmarks'][row] = recording_pose.last_landmarks
+
+        if process_frame.last_angles is not None:
+            chunk['angles'][row] = process_frame.last_angles
+
+        chunk['counts'][row, 0] = state.squat_count
+        chunk['counts'][row, 1] = state.improper_squat
+
+        # Same bits as RepRecord.flags.
+        chunk['flags'][row] = feedback_flags(state.display_text, state.lower_hips)
+
+        if play_sound is not None:
+            self.meta['events'].append([self.n_frames, play_sound])
+
+        self.n_frames += 1
+        return True
+
+    def flags(self):
+        """Per-frame feedback flags recorded so far."""
+        if not self._chunks:
+            return _new_chunk()['flags'][:0]
+        return np.concatenate([chunk['flags'] for chunk in self._chunks])[:self.n_frames]
+
+    def add_rep(self, rep):
+        self.meta['reps'].append(rep._asdict())
+
+    def _arrays(self):
+        arrays = {}
+        for key in ('present', 'times', 'landmarks', 'angles', 'counts', 'flags'):
+            if self._chunks:
+                arrays[key] = np.concatenate([chunk[key] for chunk in self._chunks])[:self.n_frames]
+            else:
+                arrays[key] = _new_chunk()[key][:0]
+        return arrays
+
+    def save(self, path=None):
+        path = path or self.path
+        meta = dict(self.meta, n_frames=self.n_frames)
+
+        # Write next to the target and swap it in, so a crash never leaves a torn file.
+        tmp_path = path + '.tmp.npz'
+        np.savez_compressed(tmp_path, meta=np.array(json.dumps(meta)), **self._arrays())
+        os.replace(tmp_path, path)
+        return path
+
+
+
+def load_sidecar(path):
+    with np.load(path, allow_pickle=False) as data:
+        sidecar = {key: data[key] for key in data.files if key != 'meta'}
+        sidecar['meta'] = json.loads(str(data['meta']))
+
+    if sidecar['meta']['version'] != SIDECAR_VERSION:
+        raise ValueError(f"Unsupported sidecar version: {sidecar['meta']['version']}")
+    return sidecar
+
+
+
+def recorded_analysis(analysis, sidecar, frame_idx):
+    """
+    `analysis` with the counters, feedback and angles the session recorded for
+    `frame_idx`, so the overlay shows exactly what the session recorded even
+    where the replay's own analysis would differ.
+    """
+    flags = int(sidecar['flags'][frame_idx])
+    squat_count, improper_squat = (int(count) for count in sidecar['counts'][frame_idx])
+    angles = sidecar['angles'][frame_idx]
+
+    return analysis._replace(
+        squat_count=squat_count,
+        improper_squat=improper_squat,
+        feedback=tuple(idx for idx in range(NUM_FEEDBACK) if flags & (1 << idx)),
+        lower_hips=bool(flags & LOWER_HIPS_FLAG),
+        angles=analysis.angles if np.isnan(angles).any() else tuple(float(angle) for angle in angles)
+    )
+
+
+def render_overlay(video_path, sidecar_path, output_path, backend=None):
+    """
+    Burn the overlay into `video_path` on demand. The recorded landmarks give
+    the joint positions; counters and feedback are drawn as recorded.
+    """
+    sidecar = load_sidecar(sidecar_path)
+    meta = sidecar['meta']
+
+    process_frame = ProcessFrame(thresholds=meta['thresholds'], flip_frame=meta['flip_frame'])
+    pose = ReplayPose(sidecar['landmarks'], sidecar['present'])
+
+    reader = open_reader(video_path, backend)
+    fps = meta['fps']
+    video_output = open_writer(output_path, fps, meta['frame_size'], backend)
+
+    times = sidecar['times']
+
+    try:
+        for frame_idx, frame in enumerate(reader):
+            timestamp = times[frame_idx] if frame_idx < len(times) else frame_idx / max(fps, 1)
+            keypoints = pose.process(frame)
+            analysis = process_frame.analyze(keypoints.pose_landmarks, frame.shape[1], frame.shape[0], timestamp)
+            if frame_idx < len(times):
+                analysis = recorded_analysis(analysis, sidecar, frame_idx)
+            video_output.write(process_frame.render(frame, analysis))
+    finally:
+        reader.close()
+        video_output.close()
+    return output_path
@@ -0,0 +1,359 @@
+import io
+import os
+import sys
+import json
+import time
+import uuid
+import shutil
+import argparse
+import tempfile
+import threading
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from process_frame import ProcessFrame
+from thresholds import get_thresholds
+from live_feed import LiveFeed
+from admission import AdmissionController
+from live_recorder import LiveRecorder, RECORD_MAX_SECONDS
+from sidecar import SidecarWriter, SIDECAR_MAX_FRAMES
+from landmarks import RecordingPose
+from live_session import LiveFrameHandler, session_pose
+from response_handler import ResponseHandler, append_chat_message
+from scratch import ScratchStore
+from load_test import load_source_frames, TracePose, MIN_DETECTION_RATE, _rss_bytes
+
+
+# Python allocations are attributed to the first subsystem whose pattern is in the file path.
+SUBSYSTEMS = (
+    ('process_frame', ('process_frame.py', 'session_state.py', 'rep_metrics.py', 'landmarks.py', 'utils.py')),
+    ('coach', ('ai_coach.py',)),
+    ('chat', ('response_handler.py',)),
+    ('recorder', ('live_recorder.py', 'sidecar.py', 'scratch.py')),
+    ('live_feed', ('live_feed.py',)),
+    ('control', ('admission.py', 'capture_control.py', 'live_session.py')),
+    ('media', (os.sep + 'av' + os.sep, 'media_backend.py')),
+    ('mediapipe', ('mediapipe',)),
+    ('numpy', ('numpy',)),
+)
+
+# Size of the simulated upload-page video copied into scratch each upload cycle.
+UPLOAD_BYTES = 4 * 2**20
+
+# Chat turns whose intents need no knowledge base, so no chatbot model is loaded.
+CHAT_QUERIES = ('How is my progress?', 'My knee hurts after squats', 'How to brace my core?', 'What next?')
+
+# Growth limits, in MB per simulated session-hour.
+MAX_RSS_GROWTH = 10.0
+MAX_SUBSYSTEM_GROWTH = 1.0
+
+
+
+class SoakSession:
+    """
+    One long live session, with the page's periodic work: a rerun every
+    `rerun_every` simulated seconds rebuilds the frame handler and finalizes a
+    stopped recording (an overlay video or, with record='sidecar', a landmark
+    sidecar) the way the Live Stream page does, a chat turn every
+    `chat_every` seconds goes through ResponseHandler and the chat history,
+    and an upload every `upload_every` seconds is copied into scratch and
+    replaces the previous one, as on the Upload Video page.
+
+    Frames are processed back to back, so hours of session take minutes. With
+    a synthetic `trace` its landmarks are replayed instead of running a pose
+    model, so ProcessFrame, the coach and rep metrics see a squatting person.
+    """
+
+    def __init__(self, session_id, frames, fps, thresholds, admission, scratch,
+                 record='video', rerun_every=60.0, chat_every=120.0, upload_every=300.0, trace=None):
+        self.session_id = session_id
+        self.frames = frames
+        self.fps = fps
+        self.thresholds = thresholds
+        self.admission = admission
+        self.scratch = scratch
+        self.record = record
+        self.rerun_every = rerun_every
+        self.chat_every = chat_every
+        self.upload_every = upload_every
+
+        self.state = {}
+        if trace is not None:
+            # Picked up by session_pose() in place of a MediaPipe model.
+            self.state['live_pose'] = RecordingPose(TracePose(*trace))
+        self.process_frame = ProcessFrame(thresholds=thresholds, flip_frame=True)
+        self.feed = LiveFeed([feedback[0] for feedback in self.process_frame.FEEDBACK_ID_MAP.values()])
+        self.responses = ResponseHandler()
+        self.chat_history = []
+        self.recorder = None
+        self.sidecar = None
+        self.recording_file = None
+        self.upload_file = None
+        self.handler = None
+
+        self.frames_done = 0
+        self.analyzed = 0
+        self.detected = 0
+        self.stop = False
+
+    def rerun(self):
+        """What a page rerun does to the session's objects."""
+        if self.recorder is not None and not self.recorder.recording:
+            self.recorder.close()
+            if self.recorder.has_output:
+                self.scratch.remove(self.recording_file)
+                self.recording_file = self.recorder.path
+            else:
+                self.scratch.remove(self.recorder.path)
+            self.recorder = None
+        if self.sidecar is not None and not self.sidecar.recording:
+            self.sidecar.save()
+            self.scratch.remove(self.recording_file)
+            self.recording_file = self.sidecar.path
+            self.sidecar = None
+
+        if self.record == 'video' and self.recorder is None:
+            self.recorder = LiveRecorder(self.scratch.path(str(self.session_id), f'live_{uuid.uuid4().hex[:12]}.mp4'))
+        elif self.record == 'sidecar' and self.sidecar is None:
+            self.sidecar = SidecarWriter(self.scratch.path(str(self.session_id), f'live_{uuid.uuid4().hex[:12]}.npz'),
+                                         None, None, self.thresholds, flip_frame=True,
+                                         max_seconds=RECORD_MAX_SECONDS, max_frames=SIDECAR_MAX_FRAMES)
+
+        # No capture controller: its wall-clock frame-rate cap would skip most
+        # of the back-to-back frames instead of analyzing them.
+        self.handler = LiveFrameHandler(
+            self.process_frame, session_pose(self.state), self.feed, self.admission, self.session_id,
+            recorder=self.recorder, sidecar=self.sidecar
+        )
+
+    def chat(self):
+        query = CHAT_QUERIES[(self.frames_done // max(1, int(self.chat_every * self.fps))) % len(CHAT_QUERIES)]
+        append_chat_message(self.chat_history, 'user', query)
+        append_chat_message(self.chat_history, 'assistant', self.responses.process_query(query, None))
+
+    def upload(self):
+        """Copy a new upload into scratch and drop the previous one, like the Upload Video page."""
+        user = f'upload_{self.session_id}'
+        previous = self.upload_file
+        self.upload_file = self.scratch.ingest(user, io.BytesIO(bytes(UPLOAD_BYTES)), suffix='.mp4',
+                                               expected_size=UPLOAD_BYTES)
+        self.scratch.remove(previous)
+
+    def run(self, n_frames):
+        rerun_frames = max(1, int(self.rerun_every * self.fps))
+        chat_frames = max(1, int(self.chat_every * self.fps))
+        upload_frames = max(1, int(self.upload_every * self.fps))
+        self.rerun()
+        pose = self.state['live_pose']
+        while self.frames_done < n_frames and not self.stop:
+            if isinstance(pose.pose, TracePose):
+                pose.pose.seek(self.frames_done)
+            self.handler(self.frames[self.frames_done % len(self.frames)])
+            self.analyzed += 1
+            self.detected += self.process_frame.last_analysis.view is not None
+            self.frames_done += 1
+            if self.frames_done % rerun_frames == 0:
+                self.rerun()
+            if self.frames_done % chat_frames == 0:
+                self.chat()
+            if self.frames_done % upload_frames == 0:
+                self.upload()
+
+        if self.recorder is not None:
+            self.recorder.close()
+        self.scratch.remove(self.upload_file)
+        pose.pose.close()
+
+    def detection(self):
+        """Share of frames where ProcessFrame had a usable pose to analyze."""
+        return self.detected / max(1, self.analyzed)
+
+    def probes(self):
+        """Sizes of the containers that grow with session length."""
+        return {
+            'coach_feedback_history': len(self.process_frame.coach.feedback_history),
+            'reps': self.process_frame.state_tracker.squat_count + self.process_frame.state_tracker.improper_squat,
+            'conversation_history': len(self.responses.conversation_history),
+            'chat_history': len(self.chat_history),
+            'sidecar_frames': self.sidecar.n_frames if self.sidecar is not None else 0,
+        }
+
+
+
+# ------------------------------------- SAMPLING -------------------------------------
+
+def subsystem_bytes(snapshot):
+    """Traced Python bytes per subsystem, by the file that made the allocation."""
+    totals = dict.fromkeys([name for name, _ in SUBSYSTEMS] + ['other'], 0)
+    for stat in snapshot.statistics('filename'):
+        filename = stat.traceback[0].filename
+        for name, patterns in SUBSYSTEMS:
+            if any(pattern in filename for pattern in patterns):
+                totals[name] += stat.size
+                break
+        else:
+            totals['other'] += stat.size
+    return totals
+
+
+def _dir_bytes(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def _open_fds():
+    try:
+        return len(os.listdir('/proc/self/fd'))
+    except OSError:
+        return None
+
+
+def growth(hours, values, limit):
+    """
+    (slope per hour, leaking) for samples taken after warm-up. A leak is a
+    slope over `limit` where the second half also sits above everything in
+    the first, so one-off spikes and plateaus don't count.
+    """
+    hours, values = np.asarray(hours, dtype=float), np.asarray(values, dtype=float)
+    if len(hours) < 4 or np.ptp(hours) == 0:
+        return 0.0, False
+    slope = float(np.polyfit(hours, values, 1)[0])
+    half = len(values) // 2
+    sustained = np.median(values[half:]) > values[:half].max()
+    return slope, bool(slope > limit and sustained)
+
+
+def run_soak(n_sessions, hours, frames, fps, thresholds, sample_every=10.0, trace=True,
+             record='video', rerun_every=60.0, chat_every=120.0, upload_every=300.0, warmup=0.2, landmark_trace=None):
+    """
+    Run the sessions for `hours` of simulated time each; returns (samples table,
+    verdict rows, lowest detection rate of any session).
+    """
+    scratch_root = tempfile.mkdtemp(prefix='smartfit_soak_')
+    scratch = ScratchStore(root=scratch_root)
+    admission = AdmissionController()
+    sessions = [SoakSession(idx, frames, fps, thresholds, admission, scratch, record, rerun_every, chat_every,
+                            upload_every, landmark_trace)
+                for idx in range(n_sessions)]
+    n_frames = int(hours * 3600 * fps)
+
+    samples = []
+
+    def sample():
+        row = {
+            'wall_s': round(time.perf_counter() - started, 1),
+            # Simulated hours each session has run so far.
+            'session_hours': sum(session.frames_done for session in sessions) / (n_sessions * fps * 3600),
+            'rss_mb': (_rss_bytes() or 0) / 2**20,
+            'scratch_mb': _dir_bytes(scratch_root) / 2**20,
+            'open_fds': _open_fds(),
+            'threads': threading.active_count(),
+        }
+        if trace:
+            row.update({f'{name}_mb': size / 2**20 for name, size in subsystem_bytes(tracemalloc.take_snapshot()).items()})
+        for key, value in sessions[0].probes().items():
+            row[key] = value
+        samples.append(row)
+        print(f"{row['session_hours']:.2f} h  rss {row['rss_mb']:.0f} MB  scratch {row['scratch_mb']:.1f} MB  "
+              f"fds {row['open_fds']}  threads {row['threads']}", flush=True)
+
+    if trace:
+        tracemalloc.start()
+    threads = [threading.Thread(target=session.run, args=(n_frames,), daemon=True) for session in sessions]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+
+    try:
+        while any(thread.is_alive() for thread in threads):
+            time.sleep(sample_every)
+            sample()
+    except KeyboardInterrupt:
+        for session in sessions:
+            session.stop = True
+    for thread in threads:
+        thread.join()
+    if trace:
+        tracemalloc.stop()
+    shutil.rmtree(scratch_root, ignore_errors=True)
+
+    table = pd.DataFrame(samples)
+    steady = table[table['session_hours'] >= warmup * table['session_hours'].max()] if len(table) else table
+
+    # Limits are per session, so scale them by the number of sessions sharing the process.
+    checks = [('rss', 'rss_mb', MAX_RSS_GROWTH), ('scratch files', 'scratch_mb', MAX_RSS_GROWTH)]
+    if trace:
+        checks += [(name, f'{name}_mb', MAX_SUBSYSTEM_GROWTH) for name, _ in SUBSYSTEMS] + \
+                  [('other', 'other_mb', MAX_SUBSYSTEM_GROWTH)]
+
+    verdicts = []
+    for name, column, limit in checks:
+        if column not in steady:
+            continue
+        slope, leaking = growth(steady['session_hours'], steady[column], limit * n_sessions)
+        verdicts.append({
+            'subsystem': name,
+            'start_mb': round(float(steady[column].iloc[0]), 2) if len(steady) else None,
+            'end_mb': round(float(steady[column].iloc[-1]), 2) if len(steady) else None,
+            'mb_per_session_hour': round(slope / n_sessions, 3),
+            'limit': limit,
+            'leak': leaking
+        })
+    return table, verdicts, min(session.detection() for session in sessions)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Soak-test long live sessions and report memory growth per subsystem.')
+    parser.add_argument('--sessions', type=int, default=2, help='Concurrent simulated sessions.')
+    parser.add_argument('--hours', type=float, default=3.0, help='Simulated hours per session.')
+    parser.add_argument('--source', default=None, help='Video or synthetic .npz trace to loop (default: generated clip, '
+                                                       'whose landmarks are replayed without a pose model).')
+    parser.add_argument('--fps', type=float, default=15.0, help='Simulated camera frame rate.')
+    parser.add_argument('--size', default='480x360', help='Camera resolution, WxH.')
+    parser.add_argument('--mode', default='beginner', choices=['beginner', 'pro'])
+    parser.add_argument('--sample-every', type=float, default=10.0, help='Wall seconds between memory samples.')
+    parser.add_argument('--rerun-every', type=float, default=60.0, help='Simulated seconds between page reruns.')
+    parser.add_argument('--chat-every', type=float, default=120.0, help='Simulated seconds between chat turns.')
+    parser.add_argument('--upload-every', type=float, default=300.0, help='Simulated seconds between uploads.')
+    parser.add_argument('--record', default='video', choices=['video', 'sidecar', 'none'],
+                        help='Live recording mode: overlay video (LiveRecorder), landmark sidecar, or none.')
+    parser.add_argument('--no-tracemalloc', action='store_true', help='Only sample RSS (faster, no per-subsystem view).')
+    parser.add_argument('--json', help='Write samples and verdicts to this JSON file.')
+    args = parser.parse_args()
+
+    frame_size = tuple(int(value) for value in args.size.lower().split('x'))
+    # Long enough for the generated clip's reps to loop whole.
+    frames, landmark_trace = load_source_frames(args.source, frame_size, args.fps, max_frames=300)
+
+    table, verdicts, detection = run_soak(args.sessions, args.hours, frames, args.fps, get_thresholds(args.mode),
+                                          args.sample_every, not args.no_tracemalloc, None if args.record == 'none' else args.record,
+                                          args.rerun_every, args.chat_every, args.upload_every,
+                                          landmark_trace=landmark_trace)
+
+    with pd.option_context('display.max_rows', None, 'display.width', 200):
+        print(pd.DataFrame(verdicts).to_string(index=False))
+        if len(table):
+            print(table.iloc[-1].to_string())
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'samples': json.loads(table.to_json(orient='records')), 'verdicts': verdicts,
+                       'detection': detection}, f, indent=2)
+
+    # Without a pose the coach, rep metrics and feedback paths never ran, so a clean run proves nothing.
+    leaks = [verdict['subsystem'] for verdict in verdicts if verdict['leak']]
+    if leaks:
+        print(f"FAIL: growing memory in {', '.join(leaks)}")
+    elif detection < MIN_DETECTION_RATE:
+        print(f'FAIL: a pose was found in only {detection:.0%} of frames')
+    else:
+        print('PASS')
+    sys.exit(1 if leaks or detection < MIN_DETECTION_RATE else 0)
@@ -0,0 +1,71 @@
+// Draws the overlay primitives produced by overlay.py onto a 2D canvas.
+// The canvas is expected to have the analyzed frame's size (CSS scaling is fine).
+
+function drawOverlay(ctx, primitives) {
+  ctx.clearRect(0, 0, ctx.canvas.width, ctx.canvas.height);
+  ctx.lineCap = 'round';
+
+  for (const p of primitives) {
+    switch (p[0]) {
+      case 'c': {
+        const [, x, y, r, color] = p;
+        ctx.fillStyle = color;
+        ctx.beginPath();
+        ctx.arc(x, y, r, 0, 2 * Math.PI);
+        ctx.fill();
+        break;
+      }
+      case 'l': {
+        const [, x1, y1, x2, y2, color, width] = p;
+        ctx.strokeStyle = color;
+        ctx.lineWidth = width;
+        ctx.beginPath();
+        ctx.moveTo(x1, y1);
+        ctx.lineTo(x2, y2);
+        ctx.stroke();
+        break;
+      }
+      case 'a': {
+        // Degrees, clockwise from +x like OpenCV; canvas y also points down.
+        const [, x, y, r, start, end, color, width] = p;
+        ctx.strokeStyle = color;
+        ctx.lineWidth = width;
+        ctx.beginPath();
+        ctx.arc(x, y, r, Math.min(start, end) * Math.PI / 180, Math.max(start, end) * Math.PI / 180);
+        ctx.stroke();
+        break;
+      }
+      case 'd': {
+        const [, x, y1, y2, color] = p;
+        ctx.fillStyle = color;
+        for (let y = y1; y <= y2; y += 8) {
+          ctx.beginPath();
+          ctx.arc(x, y, 2, 0, 2 * Math.PI);
+          ctx.fill();
+        }
+        break;
+      }
+      case 't': {
+        const [, text, x, y, color, background, scale] = p;
+        // OpenCV's Hershey font at scale 1 is roughly 22px tall.
+        const size = Math.round(22 * scale);
+        ctx.font = `bold ${size}px Helvetica, Arial, sans-serif`;
+        ctx.textBaseline = 'top';
+        if (background) {
+          const width = ctx.measureText(text).width;
+          ctx.fillStyle = background;
+          ctx.beginPath();
+          ctx.roundRect(x - 20, y - 10, width + 20, size + 10, 8);
+          ctx.fill();
+          ctx.fillStyle = color;
+          ctx.fillText(text, x - 14, y);
+        } else {
+          ctx.fillStyle = color;
+          ctx.textBaseline = 'alphabetic';
+          ctx.fillText(text, x, y);
+        }
+        break;
+      }
+    }
+  }
+}
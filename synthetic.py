@@ -0,0 +1,418 @@
+import os
+import json
+import argparse
+from typing import NamedTuple
+
+import cv2
+import numpy as np
+
+from landmarks import NUM_LANDMARKS, LANDMARK_FIELDS
+from thresholds import get_thresholds
+from rep_metrics import LOWER_HIPS_FLAG
+from media_backend import open_writer
+
+
+# Bits of RepRecord.flags, in ProcessFrame.FEEDBACK_ID_MAP order.
+BEND_BACKWARDS = 1 << 0
+BEND_FORWARD = 1 << 1
+KNEE_OVER_TOE = 1 << 2
+TOO_DEEP = 1 << 3
+
+# Segment lengths as a fraction of the subject's height.
+_SHIN, _THIGH, _TORSO = 0.25, 0.245, 0.30
+_UPPER_ARM, _FOREARM = 0.17, 0.15
+
+# Standing angles (degrees) every rep starts and ends at.
+_STAND_KNEE, _STAND_HIP, _STAND_ANKLE = 5.0, 5.0, 5.0
+
+# Landmarks that disappear together when something passes in front of the subject.
+OCCLUSION_GROUPS = (
+    (13, 15, 17, 19, 21),   # left arm
+    (14, 16, 18, 20, 22),   # right arm
+    (25, 27, 29, 31),       # left leg
+    (26, 28, 30, 32),       # right leg
+)
+
+# Bones drawn by render_frames().
+SKELETON = (
+    (11, 12), (11, 13), (13, 15), (12, 14), (14, 16), (11, 23), (12, 24), (23, 24),
+    (23, 25), (25, 27), (27, 29), (29, 31), (27, 31), (24, 26), (26, 28), (28, 30), (30, 32), (28, 32),
+    (0, 2), (0, 5), (2, 7), (5, 8), (9, 10),
+)
+
+
+class RepSpec(NamedTuple):
+    depth: float = 85.0         # Peak thigh angle from vertical (ProcessFrame's knee angle).
+    tempo: float = 2.5          # Seconds from standing, down and back up.
+    hip_peak: float = 30.0      # Peak forward lean of the torso from vertical.
+    ankle_peak: float = 25.0    # Peak forward tilt of the shin; knee over toe above ANKLE_THRESH.
+    rest: float = 1.0           # Seconds standing after the rep.
+
+
+class SyntheticClip(NamedTuple):
+    landmarks: np.ndarray       # (n_frames, 33, 4) normalized x, y, z, visibility
+    present: np.ndarray         # (n_frames,) False where the pose was dropped
+    times: np.ndarray           # (n_frames,) seconds
+    fps: float
+    frame_size: tuple
+    reps: list                  # Ground-truth label per rep, see label_rep()
+    params: dict
+
+
+
+# ------------------------------------- LABELS -------------------------------------
+
+def label_rep(spec, thresholds):
+    """
+    Ground truth for one rep under `thresholds`: (outcome, flags).
+
+    outcome is 'correct', 'incorrect', or None when the rep is too shallow to
+    count at all. flags uses RepRecord.flags bits for the faults that were
+    built into the rep; LOWER_HIPS_FLAG marks reps that never reach passing depth.
+    """
+    knee_vert = thresholds['HIP_KNEE_VERT']
+    if spec.depth < knee_vert['TRANS'][0]:
+        return None, 0
+
+    flags = 0
+    if spec.hip_peak > thresholds['HIP_THRESH'][1]:
+        flags |= BEND_BACKWARDS
+    elif spec.hip_peak < thresholds['HIP_THRESH'][0]:
+        flags |= BEND_FORWARD
+    if spec.ankle_peak > thresholds['ANKLE_THRESH']:
+        flags |= KNEE_OVER_TOE
+    if spec.depth > thresholds['KNEE_THRESH'][2]:
+        flags |= TOO_DEEP
+    if spec.depth < knee_vert['PASS'][0]:
+        flags |= LOWER_HIPS_FLAG
+
+    correct = spec.depth >= knee_vert['PASS'][0] and not flags & (KNEE_OVER_TOE | TOO_DEEP)
+    return ('correct' if correct else 'incorrect'), flags
+
+
+def random_reps(rng, n_reps, thresholds, fault_rate=0.3):
+    """Rep specs with natural variation; about `fault_rate` of them get one fault."""
+    knee_vert = thresholds['HIP_KNEE_VERT']
+    hip_low, hip_high = thresholds['HIP_THRESH']
+    ankle_thresh = thresholds['ANKLE_THRESH']
+    deepest = min(knee_vert['PASS'][1], thresholds['KNEE_THRESH'][2])
+
+    reps = []
+    for _ in range(n_reps):
+        spec = RepSpec(
+            depth=rng.uniform(knee_vert['PASS'][0] + 3, deepest - 3),
+            tempo=rng.uniform(1.8, 4.0),
+            hip_peak=rng.uniform(hip_low + 8, hip_high - 8),
+            ankle_peak=rng.uniform(10, ankle_thresh - 8),
+            rest=rng.uniform(0.5, 2.0)
+        )
+        if rng.random() < fault_rate:
+            fault = rng.choice(['shallow', 'knee_over_toe', 'too_deep', 'lean'])
+            if fault == 'shallow':
+                spec = spec._replace(depth=rng.uniform(knee_vert['TRANS'][0] + 5, knee_vert['PASS'][0] - 5))
+            elif fault == 'knee_over_toe':
+                spec = spec._replace(ankle_peak=rng.uniform(ankle_thresh + 5, ankle_thresh + 20))
+            elif fault == 'too_deep':
+                spec = spec._replace(depth=rng.uniform(thresholds['KNEE_THRESH'][2] + 3, 110))
+            else:
+                spec = spec._replace(hip_peak=rng.uniform(hip_high + 5, hip_high + 15))
+        reps.append(spec)
+    return reps
+
+
+
+# ------------------------------------- SKELETON -------------------------------------
+
+def _body_points(knee, hip, ankle, arm):
+    """
+    Landmark positions in the subject's own frame for per-frame angle arrays:
+    (n_frames, 33, 3) of forward, up and lateral (left positive), in subject heights.
+    """
+    knee, hip, ankle, arm = (np.radians(angle) for angle in (knee, hip, ankle, arm))
+    n_frames = len(knee)
+    points = np.zeros((n_frames, NUM_LANDMARKS, 3), dtype=np.float64)
+
+    def vec(angle):
+        return np.stack([np.sin(angle), np.cos(angle)], axis=-1)
+
+    ankle_pt = np.tile([0.0, 0.045], (n_frames, 1))
+    knee_pt = ankle_pt + _SHIN * vec(ankle)
+    hip_pt = knee_pt + _THIGH * vec(-knee)
+    shoulder_pt = hip_pt + _TORSO * vec(hip)
+
+    # Arms swing forward for balance as the subject goes down.
+    arm_dir = np.stack([np.sin(arm), -np.cos(arm)], axis=-1)
+    elbow_pt = shoulder_pt + _UPPER_ARM * arm_dir
+    wrist_pt = elbow_pt + _FOREARM * arm_dir
+    hand_pt = wrist_pt + 0.04 * arm_dir
+
+    # The head follows the torso's lean.
+    up = vec(hip)
+    forward = np.stack([np.cos(hip), -np.sin(hip)], axis=-1)
+    neck_pt = shoulder_pt + 0.10 * up
+
+    heel_pt = ankle_pt + [-0.045, -0.03]
+    toe_pt = ankle_pt + [0.13, -0.04]
+
+    # (landmark, sagittal position, lateral offset); left side first, right mirrored.
+    layout = [
+        (0, neck_pt + 0.06 * forward + 0.02 * up, 0.0),
+        (9, neck_pt + 0.05 * forward, 0.02),
+        (11, shoulder_pt, 0.11),
+        (13, elbow_pt, 0.12),
+        (15, wrist_pt, 0.12),
+        (17, hand_pt, 0.13),
+        (19, hand_pt + 0.01 * arm_dir, 0.12),
+        (21, wrist_pt + 0.02 * arm_dir, 0.10),
+        (23, hip_pt, 0.08),
+        (25, knee_pt, 0.085),
+        (27, ankle_pt, 0.08),
+        (29, heel_pt, 0.08),
+        (31, toe_pt, 0.09),
+    ]
+    for idx, sagittal, lateral in layout:
+        points[:, idx, :2] = sagittal
+        points[:, idx, 2] = lateral
+        if idx not in (0, 9):
+            points[:, idx + 1, :2] = sagittal
+            points[:, idx + 1, 2] = -lateral
+    points[:, 10, :2] = points[:, 9, :2]
+    points[:, 10, 2] = -0.02
+
+    # Eyes and ears, left then right.
+    for idx, fwd, height, lateral in ((1, 0.05, 0.045, 0.015), (2, 0.045, 0.045, 0.03), (3, 0.04, 0.045, 0.045),
+                                      (7, 0.0, 0.04, 0.07)):
+        sagittal = neck_pt + fwd * forward + height * up
+        right = idx + 3 if idx < 7 else idx + 1
+        points[:, idx, :2] = points[:, right, :2] = sagittal
+        points[:, idx, 2] = lateral
+        points[:, right, 2] = -lateral
+
+    return points
+
+
+def _angle_tracks(reps, fps, lead_in):
+    """Per-frame knee, hip, ankle and arm angles for the rep sequence, plus each rep's time span."""
+    duration = lead_in + sum(spec.tempo + spec.rest for spec in reps)
+    times = np.arange(int(np.ceil(duration * fps))) / fps
+
+    knee = np.full(len(times), _STAND_KNEE)
+    hip = np.full(len(times), _STAND_HIP)
+    ankle = np.full(len(times), _STAND_ANKLE)
+    arm = np.zeros(len(times))
+
+    spans = []
+    start = lead_in
+    for spec in reps:
+        mask = (times >= start) & (times < start + spec.tempo)
+        # Smooth down-and-up: 0 standing, 1 at the bottom halfway through.
+        progress = np.sin(np.pi * (times[mask] - start) / spec.tempo) ** 2
+        knee[mask] = _STAND_KNEE + (spec.depth - _STAND_KNEE) * progress
+        hip[mask] = _STAND_HIP + (spec.hip_peak - _STAND_HIP) * progress
+        ankle[mask] = _STAND_ANKLE + (spec.ankle_peak - _STAND_ANKLE) * progress
+        arm[mask] = 70.0 * progress
+        spans.append((start, start + spec.tempo / 2, start + spec.tempo))
+        start += spec.tempo + spec.rest
+
+    return times, knee, hip, ankle, arm, spans
+
+
+def _offset_angle(image_points):
+    """ProcessFrame's camera offset angle: at the nose, between the two shoulders."""
+    a = image_points[11] - image_points[0]
+    b = image_points[12] - image_points[0]
+    cos_theta = np.dot(a, b) / max(np.linalg.norm(a) * np.linalg.norm(b), 1e-9)
+    return float(np.degrees(np.arccos(np.clip(cos_theta, -1.0, 1.0))))
+
+
+def _dropout_mask(rng, n_frames, rate, mean_length=4):
+    """Pose-lost frames in bursts of about `mean_length`, covering about `rate` of the clip."""
+    present = np.ones(n_frames, dtype=bool)
+    if rate <= 0:
+        return present
+    start_prob = min(1.0, rate / (mean_length * max(1e-6, 1.0 - rate)))
+    lost = False
+    for idx in range(n_frames):
+        lost = rng.random() >= 1.0 / mean_length if lost else rng.random() < start_prob
+        present[idx] = not lost
+    return present
+
+
+def generate_clip(reps, fps=30.0, frame_size=(640, 480), camera_offset=0.0, facing=1,
+                  noise=1.5, dropout=0.0, occlusion=0.0, lead_in=1.0, thresholds=None, seed=None):
+    """
+    Landmark trace of a subject doing `reps` (RepSpec list), as MediaPipe Pose would report it.
+
+    camera_offset turns the subject away from a pure side view (degrees);
+    facing=-1 makes them face left. noise is per-landmark jitter in pixels,
+    dropout the fraction of frames without a pose, and occlusion the number
+    of occlusion bursts per second, each hiding a limb for a fraction of a
+    second with low visibility and drifting positions.
+    """
+    rng = np.random.default_rng(seed)
+    thresholds = thresholds or get_thresholds('beginner')
+    frame_width, frame_height = frame_size
+    subject_px = 0.8 * frame_height
+
+    times, knee, hip, ankle, arm, spans = _angle_tracks(reps, fps, lead_in)
+    n_frames = len(times)
+    body = _body_points(knee, hip, ankle, arm)
+
+    # Orthographic camera, turned `camera_offset` degrees around the vertical axis.
+    theta = np.radians(camera_offset)
+    across = body[..., 0] * np.cos(theta) + body[..., 2] * np.sin(theta)
+    depth = -body[..., 0] * np.sin(theta) + body[..., 2] * np.cos(theta)
+
+    x_px = 0.5 * frame_width + facing * across * subject_px
+    y_px = 0.95 * frame_height - body[..., 1] * subject_px
+
+    # Standing, noise-free pose decides which view ProcessFrame will see.
+    view_offset = _offset_angle(np.stack([x_px[0], y_px[0]], axis=-1))
+
+    x_px = x_px + rng.normal(0.0, noise, x_px.shape)
+    y_px = y_px + rng.normal(0.0, noise, y_px.shape)
+
+    landmarks = np.empty((n_frames, NUM_LANDMARKS, len(LANDMARK_FIELDS)), dtype=np.float32)
+    landmarks[..., 0] = x_px / frame_width
+    landmarks[..., 1] = y_px / frame_height
+    landmarks[..., 2] = depth * subject_px / frame_width
+    # The far side of the body is less certain than the near side.
+    landmarks[..., 3] = np.clip(0.9 - 2.0 * depth, 0.5, 0.99) - rng.uniform(0.0, 0.03, depth.shape)
+
+    n_bursts = rng.poisson(occlusion * n_frames / fps) if occlusion > 0 else 0
+    for _ in range(n_bursts):
+        group = list(OCCLUSION_GROUPS[rng.integers(len(OCCLUSION_GROUPS))])
+        start = rng.integers(n_frames)
+        stop = min(n_frames, start + max(1, int(rng.uniform(0.2, 0.6) * fps)))
+        drift = np.cumsum(rng.normal(0.0, 0.01, (stop - start, len(group), 2)), axis=0)
+        landmarks[start:stop, group, :2] += drift
+        landmarks[start:stop, group, 3] = rng.uniform(0.05, 0.3, (stop - start, len(group)))
+
+    present = _dropout_mask(rng, n_frames, dropout)
+
+    front_view = view_offset > thresholds['OFFSET_THRESH']
+    labels = []
+    for rep_idx, (spec, (start, bottom, end)) in enumerate(zip(reps, spans), start=1):
+        outcome, flags = label_rep(spec, thresholds)
+        labels.append({
+            'rep': rep_idx,
+            # A misaligned camera shows the front view, where no rep should be counted.
+            'outcome': None if front_view else outcome,
+            'flags': flags,
+            'start_time': start,
+            'bottom_time': bottom,
+            'end_time': end,
+            'start_frame': int(np.ceil(start * fps)),
+            'end_frame': min(n_frames - 1, int(np.ceil(end * fps))),
+            **spec._asdict()
+        })
+
+    params = {
+        'camera_offset': camera_offset, 'facing': facing, 'noise': noise, 'dropout': dropout,
+        'occlusion': occlusion, 'lead_in': lead_in, 'seed': seed, 'thresholds': thresholds,
+        'view': 'front' if front_view else 'side', 'offset_angle': view_offset
+    }
+    return SyntheticClip(landmarks, present, times, fps, tuple(frame_size), labels, params)
+
+
+
+# ------------------------------------- OUTPUT -------------------------------------
+
+def render_frames(clip, background=(32, 32, 32)):
+    """
+    Stick-figure RGB frames for the clip. They exercise decoding, ProcessFrame
+    rendering and encoding with the trace replayed through ReplayPose; a pose
+    model won't find a person in them.
+    """
+    frame_width, frame_height = clip.frame_size
+    scale = np.array([frame_width, frame_height], dtype=np.float32)
+
+    for landmarks, present in zip(clip.landmarks, clip.present):
+        frame = np.empty((frame_height, frame_width, 3), dtype=np.uint8)
+        frame[:] = background
+        cv2.line(frame, (0, int(0.95 * frame_height)), (frame_width, int(0.95 * frame_height)), (90, 90, 90), 2)
+
+        if present:
+            points = (landmarks[:, :2] * scale).astype(np.int32)
+            for start, end in SKELETON:
+                cv2.line(frame, tuple(map(int, points[start])), tuple(map(int, points[end])), (200, 200, 200), 3, cv2.LINE_AA)
+            for point in points:
+                cv2.circle(frame, tuple(map(int, point)), 3, (255, 180, 0), -1, cv2.LINE_AA)
+        yield frame
+
+
+def write_video(clip, path, backend=None):
+    writer = open_writer(path, clip.fps, clip.frame_size, backend)
+    try:
+        for frame in render_frames(clip):
+            writer.write(frame)
+    finally:
+        writer.close()
+    return path
+
+
+def save_clip(clip, path):
+    """Save as .npz with the same landmark arrays as a sidecar, plus the labels in 'meta'."""
+    meta = {
+        'kind': 'synthetic', 'fps': clip.fps, 'frame_size': list(clip.frame_size),
+        'n_frames': len(clip.times), 'reps': clip.reps, 'params': clip.params
+    }
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(tmp_path, meta=np.array(json.dumps(meta)),
+                        landmarks=clip.landmarks, present=clip.present, times=clip.times)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_clip(path):
+    with np.load(path, allow_pickle=False) as data:
+        meta = json.loads(str(data['meta']))
+        return SyntheticClip(data['landmarks'], data['present'], data['times'], meta['fps'],
+                             tuple(meta['frame_size']), meta['reps'], meta['params'])
+
+
+
+# ------------------------------------- CLI -------------------------------------
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Generate labelled synthetic squat landmark traces.')
+    parser.add_argument('--out', default='synthetic', help='Output directory')
+    parser.add_argument('--clips', type=int, default=10)
+    parser.add_argument('--reps', type=int, default=8, help='Reps per clip')
+    parser.add_argument('--fault-rate', type=float, default=0.3, help='Share of reps with a form fault')
+    parser.add_argument('--mode', default='beginner', help='Thresholds the labels are computed for')
+    parser.add_argument('--fps', type=float, default=30.0)
+    parser.add_argument('--size', default='640x480', help='Frame size, WxH')
+    parser.add_argument('--offset', type=float, default=0.0, help='Camera offset from a side view, degrees')
+    parser.add_argument('--noise', type=float, default=1.5, help='Landmark jitter, pixels')
+    parser.add_argument('--dropout', type=float, default=0.0, help='Fraction of frames without a pose')
+    parser.add_argument('--occlusion', type=float, default=0.0, help='Occlusion bursts per second')
+    parser.add_argument('--video', action='store_true', help='Also write stick-figure videos')
+    parser.add_argument('--backend', default=None, help='Media backend for --video')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    frame_size = tuple(int(value) for value in args.size.lower().split('x'))
+    thresholds = get_thresholds(args.mode)
+    rng = np.random.default_rng(args.seed)
+    os.makedirs(args.out, exist_ok=True)
+
+    for clip_idx in range(args.clips):
+        clip = generate_clip(
+            random_reps(rng, args.reps, thresholds, args.fault_rate),
+            fps=args.fps, frame_size=frame_size, camera_offset=args.offset,
+            facing=1 if rng.random() < 0.5 else -1, noise=args.noise, dropout=args.dropout,
+            occlusion=args.occlusion, thresholds=thresholds, seed=int(rng.integers(2**31))
+        )
+        stem = os.path.join(args.out, f'synthetic_{clip_idx:04d}')
+        save_clip(clip, stem + '.npz')
+        if args.video:
+            write_video(clip, stem + '.mp4', args.backend)
+
+        outcomes = [rep['outcome'] for rep in clip.reps]
+        print(f"{stem}.npz: {len(clip.times)} frames, {outcomes.count('correct')} correct, "
+              f"{outcomes.count('incorrect')} incorrect reps")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+import os
+import sys
+import copy
+import json
+import argparse
+import itertools
+import multiprocessing
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from process_frame import ProcessFrame, FEEDBACK_ID_MAP
+from thresholds import get_thresholds, load_thresholds
+from landmarks import array_to_result
+from batch_analyze import collect_videos
+from pose_eval import load_trace, load_labels, score_clip
+
+
+# Thresholds that can be swept offline. Inactivity is timed on the trace's
+# timestamps, so INACTIVE_THRESH can be tuned on replays too.
+SWEEP_KEYS = ('HIP_KNEE_VERT', 'HIP_THRESH', 'KNEE_THRESH', 'ANKLE_THRESH', 'OFFSET_THRESH', 'INACTIVE_THRESH',
+              'CNT_FRAME_THRESH', 'VISIBILITY_THRESH')
+
+
+def expand_sweep(base, sweep):
+    """
+    Every combination of the candidate values in `sweep`, applied to a copy
+    of `base`. Keys are threshold names, or 'HIP_KNEE_VERT.PASS' style for
+    one entry of a nested range dict, e.g.
+
+        {"ANKLE_THRESH": [30, 40, 45], "HIP_KNEE_VERT.PASS": [[70, 95], [80, 95]]}
+
+    Returns a list of (thresholds, changed values).
+    """
+    for key in sweep:
+        name, _, entry = key.partition('.')
+        if name not in SWEEP_KEYS:
+            raise ValueError(f"Can't sweep {key} (choose from {', '.join(SWEEP_KEYS)})")
+        if entry and entry not in base[name]:
+            raise ValueError(f"Unknown entry in {key}")
+
+    candidates = []
+    for values in itertools.product(*sweep.values()):
+        thresholds = copy.deepcopy(base)
+        for key, value in zip(sweep, values):
+            name, _, entry = key.partition('.')
+            if entry:
+                thresholds[name][entry] = value
+            else:
+                thresholds[name] = value
+        candidates.append((thresholds, dict(zip(sweep, values))))
+    return candidates
+
+
+
+# ------------------------------------- WORKER PROCESS -------------------------------------
+
+_worker = {}
+
+
+def _init_worker(trace_paths):
+    # Each worker decodes the traces once and reuses them for every candidate.
+    traces = []
+    for path in trace_paths:
+        trace = load_trace(path)
+        pose_landmarks = [array_to_result(landmarks if present else None).pose_landmarks
+                          for landmarks, present in zip(trace['landmarks'], trace['present'])]
+        traces.append((pose_landmarks, trace['times'].tolist(), trace['frame_size'],
+                       load_labels(path, FEEDBACK_ID_MAP, trace)))
+    _worker['traces'] = traces
+
+
+def score_thresholds(thresholds):
+    """Summed score_clip() counts of one candidate over every trace, through the analysis-only path."""
+    totals = Counter()
+    for pose_landmarks, times, (frame_width, frame_height), labels in _worker['traces']:
+        reps = []
+        process_frame = ProcessFrame(thresholds=thresholds, on_rep=reps.append)
+        for landmarks, timestamp in zip(pose_landmarks, times):
+            process_frame.analyze(landmarks, frame_width, frame_height, timestamp)
+        predicted = [{'outcome': rep.outcome, 'flags': rep.flags, 'bottom_time': rep.bottom_time} for rep in reps]
+        totals.update(score_clip(labels, predicted))
+        totals['clips'] += 1
+    return dict(totals)
+
+
+
+# ------------------------------------- DRIVER -------------------------------------
+
+def run_sweep(trace_paths, candidates, workers=None):
+    """Score every candidate in parallel and return the ranking, best first."""
+    workers = min(workers or os.cpu_count() or 1, len(candidates))
+    context = multiprocessing.get_context('spawn')
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                             initargs=(trace_paths,)) as pool:
+        # Big chunks keep the per-task overhead small next to a replay of every trace.
+        chunksize = max(1, len(candidates) // (workers * 4))
+        scores = list(pool.map(score_thresholds, [thresholds for thresholds, _ in candidates], chunksize=chunksize))
+
+    rows = []
+    for idx, ((_, changed), totals) in enumerate(zip(candidates, scores)):
+        tp, fp, fn = totals.get('feedback_tp', 0), totals.get('feedback_fp', 0), totals.get('feedback_fn', 0)
+        rows.append(dict(
+            {key: json.dumps(value) for key, value in changed.items()},
+            candidate=idx,
+            reps=totals.get('reps', 0),
+            rep_accuracy=round(totals.get('outcome_hits', 0) / max(1, totals.get('outcome_total', 0)), 4),
+            count_error=round(totals.get('count_error', 0) / max(1, totals.get('clips', 0)), 4),
+            feedback_f1=round(2 * tp / max(1, 2 * tp + fp + fn), 4)
+        ))
+
+    ranking = pd.DataFrame(rows)
+    return ranking.sort_values(['rep_accuracy', 'count_error', 'feedback_f1'],
+                               ascending=[False, True, False]).reset_index(drop=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tune thresholds on cached landmark traces without re-running inference.')
+    parser.add_argument('traces', nargs='+', help='Synthetic traces or sidecars with <name>.labels.json (.npz), '
+                                                  'directories or glob patterns (quote them).')
+    parser.add_argument('--sweep', required=True, help='JSON file mapping thresholds to candidate values.')
+    parser.add_argument('--mode', default='beginner', choices=['beginner', 'pro'], help='Profile to start from.')
+    parser.add_argument('--thresholds', help='JSON thresholds file to start from; overrides --mode.')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count).')
+    parser.add_argument('--top', type=int, default=3, help='Number of best profiles to write.')
+    parser.add_argument('--out', default='sweep', help='Output directory for the ranking and profiles.')
+    args = parser.parse_args()
+
+    base = load_thresholds(args.thresholds) if args.thresholds else get_thresholds(args.mode)
+    with open(args.sweep) as f:
+        try:
+            candidates = expand_sweep(base, json.load(f))
+        except ValueError as e:
+            parser.error(str(e))
+
+    trace_paths = []
+    for path in collect_videos(args.traces, ('.npz',)):
+        try:
+            load_labels(path, FEEDBACK_ID_MAP)
+        except (OSError, KeyError, ValueError) as e:
+            print(f'Skipping {path}: no labels ({e})', file=sys.stderr)
+            continue
+        trace_paths.append(path)
+    if not trace_paths:
+        parser.error('No labelled traces matched.')
+
+    print(f'Scoring {len(candidates)} candidates on {len(trace_paths)} traces', flush=True)
+    ranking = run_sweep(trace_paths, candidates, args.workers)
+
+    os.makedirs(args.out, exist_ok=True)
+    ranking.to_csv(os.path.join(args.out, 'ranking.csv'), index=False)
+
+    # Full profiles in the thresholds.py layout; load them with load_thresholds().
+    for rank, candidate in enumerate(ranking['candidate'][:args.top], 1):
+        with open(os.path.join(args.out, f'profile_{rank}.json'), 'w') as f:
+            json.dump(candidates[candidate][0], f, indent=4)
+
+    with pd.option_context('display.max_rows', 20, 'display.width', 200):
+        print(ranking.to_string(index=False))
+    print(f'Ranking and top {min(args.top, len(ranking))} profiles written to {args.out}')
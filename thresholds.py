@@ -1,3 +1,6 @@
+import json
+
+
 # Get thresholds for beginner mode
 def get_thresholds_beginner():
 
@@ -18,7 +21,9 @@ def get_thresholds_beginner():
                     'OFFSET_THRESH'    : 35.0,
                     'INACTIVE_THRESH'  : 15.0,
 
-                    'CNT_FRAME_THRESH' : 50
+                    'CNT_FRAME_THRESH' : 50,
+
+                    'VISIBILITY_THRESH': 0.5
                             
                 }
 
@@ -46,7 +51,9 @@ def get_thresholds_pro():
                     'OFFSET_THRESH'    : 35.0,
                     'INACTIVE_THRESH'  : 15.0,
 
-                    'CNT_FRAME_THRESH' : 50
+                    'CNT_FRAME_THRESH' : 50,
+
+                    'VISIBILITY_THRESH': 0.5
                             
                  }
                  
@@ -62,4 +69,33 @@ def get_thresholds_custom(experience_level):
         base_thresholds['HIP_THRESH'] = [15, 40]
         base_thresholds['ANKLE_THRESH'] = 35
         
-    return base_thresholds
\ No newline at end of file
+    return base_thresholds
+
+def get_thresholds(mode):
+    modes = {
+        'beginner': get_thresholds_beginner,
+        'pro': get_thresholds_pro
+    }
+    if mode not in modes:
+        raise ValueError(f"Unknown mode: {mode} (choose from {', '.join(modes)})")
+    return modes[mode]()
+
+
+def load_thresholds(path):
+    """
+    Load thresholds from a JSON file. The file may hold a complete thresholds
+    dict or only the keys to change, applied on top of the mode named by its
+    optional 'base' key (beginner by default).
+    """
+    with open(path) as f:
+        overrides = json.load(f)
+
+    thresholds = get_thresholds(overrides.pop('base', 'beginner'))
+    for key, value in overrides.items():
+        if key not in thresholds:
+            raise ValueError(f"Unknown threshold in {path}: {key}")
+        if isinstance(thresholds[key], dict):
+            thresholds[key] = dict(thresholds[key], **value)
+        else:
+            thresholds[key] = value
+    return thresholds
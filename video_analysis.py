@@ -0,0 +1,157 @@
+import os
+import time
+import numpy as np
+
+from utils import get_mediapipe_pose
+from process_frame import ProcessFrame
+from landmarks import RecordingPose
+from sidecar import SidecarWriter
+from rep_metrics import feedback_flags
+from highlights import feedback_spans, build_highlight_index
+from media_backend import open_reader, open_writer
+
+
+# Bump whenever a change to ProcessFrame or the analysis loop changes results,
+# so cached analyses computed by older code are never served.
+ANALYSIS_VERSION = '4'
+
+# MediaPipe settings used for offline analysis; part of the result cache key.
+POSE_SETTINGS = {
+    'static_image_mode': False,
+    'model_complexity': 1,
+    'smooth_landmarks': True,
+    'min_detection_confidence': 0.5,
+    'min_tracking_confidence': 0.5
+}
+
+
+class AnalysisCancelled(Exception):
+    pass
+
+
+def analyze_video(source_path, thresholds, sidecar_path=None, video_path=None, pose=None,
+                  on_progress=None, on_frame=None, should_stop=None, throttle=None,
+                  checkpoint=None, checkpoint_interval=30.0, resume=None, backend=None):
+    """
+    Run the squat analysis over a video file without any UI.
+
+    Outputs are a landmark sidecar (`sidecar_path`) and/or an annotated video
+    (`video_path`). `throttle()` is called before each frame and may block to
+    give CPU back to live sessions. `checkpoint(data)` is called every `checkpoint_interval`
+    seconds with a JSON-serializable dict that can be passed back as `resume`
+    to continue from that frame; this requires a sidecar and no video output,
+    since a partially written video can't be appended to. `backend` selects
+    the media_backend used to decode and encode (default MEDIA_BACKEND).
+    """
+    own_pose = pose is None
+    if own_pose:
+        pose = get_mediapipe_pose(**POSE_SETTINGS)
+
+    reader = open_reader(source_path, backend)
+
+    fps = reader.fps
+    frame_size = reader.frame_size
+    total_frames = reader.frame_count
+
+    can_resume = sidecar_path is not None and video_path is None
+
+    reps = []
+    sidecar = None
+    start_frame = 0
+    # One byte of feedback flags per frame, for the highlight index.
+    frame_flags = bytearray()
+
+    if sidecar_path is not None:
+        if can_resume and resume and os.path.exists(sidecar_path):
+            start_frame = resume['frame_idx']
+            sidecar = SidecarWriter.from_file(sidecar_path, n_frames=start_frame)
+            frame_flags.extend(sidecar.flags().tobytes())
+        else:
+            sidecar = SidecarWriter(sidecar_path, fps, frame_size, thresholds)
+        reps = sidecar.meta['reps']
+
+    def on_rep(rep):
+        if sidecar is not None:
+            sidecar.add_rep(rep)
+        else:
+            reps.append(rep._asdict())
+
+    process_frame = ProcessFrame(thresholds=thresholds, on_rep=on_rep)
+    recording_pose = RecordingPose(pose)
+
+    if start_frame:
+        # Timers continue from the checkpointed frame's time, not from when the job resumed.
+        process_frame.state_tracker.restore(bytes.fromhex(resume['state']),
+                                            now=process_frame.clock((start_frame - 1) / fps))
+        process_frame.rep_metrics.rep_idx = resume['rep_idx']
+        process_frame.frame_idx = start_frame - 1
+        reader.seek(start_frame)
+
+    video_output = None
+    if video_path is not None:
+        video_output = open_writer(video_path, fps, frame_size, backend)
+
+    frame_idx = start_frame
+    last_checkpoint = time.perf_counter()
+
+    try:
+        for frame in reader:
+            if throttle is not None:
+                throttle()
+            if should_stop is not None and should_stop():
+                raise AnalysisCancelled()
+
+            timestamp = frame_idx / fps
+            out_frame, play_sound = process_frame.process(frame, recording_pose, timestamp=timestamp)
+            frame_idx += 1
+
+            state = process_frame.state_tracker
+            frame_flags.append(feedback_flags(state.display_text, state.lower_hips))
+
+            if sidecar is not None:
+                sidecar.add(recording_pose, process_frame, play_sound, timestamp)
+            if video_output is not None:
+                video_output.write(out_frame)
+
+            if on_frame is not None:
+                on_frame(out_frame)
+            if on_progress is not None:
+                on_progress(frame_idx, total_frames)
+
+            if checkpoint is not None and can_resume and \
+                    time.perf_counter() - last_checkpoint >= checkpoint_interval:
+                sidecar.save()
+                checkpoint({
+                    'frame_idx': frame_idx,
+                    'state': process_frame.state_tracker.snapshot(now=process_frame.clock(timestamp)).hex(),
+                    'rep_idx': process_frame.rep_metrics.rep_idx
+                })
+                last_checkpoint = time.perf_counter()
+
+    finally:
+        reader.close()
+        if video_output is not None:
+            video_output.close()
+        if own_pose:
+            pose.close()
+
+    if sidecar is not None:
+        sidecar.save()
+
+    flags = np.frombuffer(bytes(frame_flags), dtype=np.uint8)
+    spans = feedback_spans(flags, np.arange(len(flags)) / fps)
+
+    return {
+        'frames': frame_idx,
+        'fps': fps,
+        'frame_size': list(frame_size),
+        'squat_count': process_frame.state_tracker.squat_count,
+        'improper_squat': process_frame.state_tracker.improper_squat,
+        # Totals over the whole video; the on-screen counters reset after inactivity.
+        'correct_reps': sum(1 for rep in reps if rep['outcome'] == 'correct'),
+        'incorrect_reps': sum(1 for rep in reps if rep['outcome'] == 'incorrect'),
+        'reps': reps,
+        'highlights': build_highlight_index(reps, spans, process_frame.FEEDBACK_ID_MAP),
+        'sidecar': sidecar_path,
+        'video': video_path
+    }